@@ -24,13 +24,26 @@ for documentation of the GSF format.
 from .grains import Grain, GrainFactory
 from uuid import UUID, uuid1
 from datetime import datetime, timezone
-from io import BytesIO, RawIOBase, BufferedIOBase
-from mediatimestamp.immutable import Timestamp
+from io import BytesIO, RawIOBase, BufferedIOBase, UnsupportedOperation
+from mediatimestamp.immutable import Timestamp, TimeOffset, TimeRange
 from fractions import Fraction
 from frozendict import frozendict
-from .utils import IOBytes
-from os import SEEK_SET, SEEK_CUR
+from .utils import IOBytes, GrainDataCache
+from os import SEEK_SET, SEEK_CUR, SEEK_END
+from bisect import bisect_left, bisect_right, insort
+from heapq import heappush, heappop
+import os
+import errno
+import mmap
+import struct
+import json
+import time
 import warnings
+import asyncio
+import numpy as np
+from collections import deque
+from copy import deepcopy
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 
 from inspect import isawaitable
 
@@ -47,27 +60,33 @@ from typing import (
     IO,
     Sequence,
     AsyncIterable,
+    AsyncGenerator,
+    Iterator,
+    Callable,
+    Deque,
+    TypeVar,
     Awaitable,
     overload,
-    NamedTuple)
+    NamedTuple,
+    Set)
 from typing_extensions import TypedDict
-from .typing import GrainMetadataDict, RationalTypes, ParseGrainType
+from .typing import GrainMetadataDict, GrainDataType, RationalTypes, ParseGrainType
 
 from .grains import VideoGrain, EventGrain, AudioGrain, CodedAudioGrain, CodedVideoGrain
 
 from .utils.asyncbinaryio import AsyncBinaryIO, OpenAsyncBinaryIO, AsyncFileWrapper, OpenAsyncFileWrapper
 
-from contextlib import contextmanager
+from contextlib import contextmanager, suppress, ExitStack
 
 from deprecated import deprecated
 
-from enum import Enum
+from enum import Enum, Flag
 
 
-__all__ = ["GSFDecoder", "load", "loads", "GSFError", "GSFDecodeError",
-           "GSFDecodeBadFileTypeError", "GSFDecodeBadVersionError",
-           "GSFEncoder", "dump", "dumps", "GSFEncodeError",
-           "GSFEncodeAddToActiveDump"]
+__all__ = ["GSFDecoder", "load", "loads", "scan_headers", "GSF_HEADER_DTYPE", "GSF_GRAIN_TYPES", "parallel_decode",
+           "GSFError", "GSFDecodeError", "GSFDecodeBadFileTypeError", "GSFDecodeBadVersionError", "GSFIndex",
+           "GSFIndexEntry", "GSFEncoder", "GSFRollingEncoder", "dump", "dumps", "remux", "merge", "FileRangeCopier",
+           "GSFEncodeError", "GSFEncodeAddToActiveDump"]
 
 
 @contextmanager
@@ -82,6 +101,8 @@ def no_deprecation_warnings():
 
 GSFFileHeaderDict = dict
 
+T = TypeVar("T")
+
 
 def loads(s: bytes,
           cls: Optional[Type["GSFDecoder"]] = None,
@@ -101,7 +122,7 @@ def loads(s: bytes,
     if parse_grain is None:
         parse_grain = GrainFactory
 
-    return load(BytesIO(s), cls=cls, parse_grain=parse_grain)
+    return load(BytesIO(s), cls=cls, parse_grain=parse_grain, **kwargs)
 
 
 @overload
@@ -145,6 +166,49 @@ def load(fp,
         return cls(file_data=fp, parse_grain=parse_grain, **kwargs)._synchronously_decode()
 
 
+# The grain type names, in the order of the numeric codes used by scan_headers and in "gidx" blocks
+GSF_GRAIN_TYPES = ("empty", "video", "coded_video", "audio", "coded_audio", "event")
+
+# The fields of the rows returned by scan_headers. Timestamps are in integer nanoseconds, rates and durations are the
+# numerators and denominators stored in the file (0 if unset), format is the cog format from the video, coded video,
+# audio or coded audio header (0 for other grains), is_key_frame is -1 unless set in a coded video header, offset is
+# the position of the "grai" block and data_offset and data_length give the position and size of the grain data.
+# grain_type is an index into GSF_GRAIN_TYPES.
+GSF_HEADER_DTYPE = np.dtype([
+    ("offset", "<u8"),
+    ("origin_timestamp", "<i8"),
+    ("sync_timestamp", "<i8"),
+    ("rate_numerator", "<u4"),
+    ("rate_denominator", "<u4"),
+    ("duration_numerator", "<u4"),
+    ("duration_denominator", "<u4"),
+    ("grain_type", "u1"),
+    ("format", "<u4"),
+    ("is_key_frame", "<i1"),
+    ("samples", "<u4"),
+    ("sample_rate", "<u4"),
+    ("data_offset", "<u8"),
+    ("data_length", "<u8")
+])
+
+
+def scan_headers(fp: Union[str, "os.PathLike[str]", IO[bytes]],
+                 local_ids: Optional[Sequence[int]] = None,
+                 **kwargs) -> Dict[int, np.ndarray]:
+    """Read only the grain headers of a GSF file into NumPy structured arrays, without constructing Grain objects,
+    returns a dictionary mapping numeric segment ids to arrays of GSF_HEADER_DTYPE with one row per grain.
+
+    fp may be a path or a binary file object. If local_ids is set only those
+    segments are included. Extra kwargs will be passed to the decoder
+    constructor."""
+    if isinstance(fp, (str, os.PathLike)):
+        with open(fp, "rb") as f:
+            return scan_headers(f, local_ids=local_ids, **kwargs)
+
+    with GSFDecoder(file_data=fp, **kwargs) as dec:
+        return dec.scan_headers(local_ids=local_ids)
+
+
 def dump(grains: Iterable[Grain],
          fp: IO[bytes],
          cls: Optional[Type["GSFEncoder"]] = None,
@@ -393,6 +457,23 @@ class AsyncGSFBlock():
 
         return block
 
+    async def read_remaining_bytes(self) -> bytes:
+        """Reads the remaining data in the block as bytes
+
+        :returns: The bytes up to the end of the block
+        :raises EOFError: If there are fewer bytes left in the source than in the block
+        """
+        assert self.size is not None, "read_remaining_bytes() only works in a context manager"
+
+        bytes_remaining = self.get_remaining()
+        if bytes_remaining <= 0:
+            return bytes()
+
+        buffer = await self.file_data.read(bytes_remaining)
+        if len(buffer) != bytes_remaining:
+            raise EOFError("Unable to read enough bytes from source")
+        return buffer
+
     async def read_tag(self) -> str:
         """Read a 4 character tag
 
@@ -610,6 +691,23 @@ class SyncGSFBlock():
 
         return block
 
+    def read_remaining_bytes(self) -> bytes:
+        """Reads the remaining data in the block as bytes
+
+        :returns: The bytes up to the end of the block
+        :raises EOFError: If there are fewer bytes left in the source than in the block
+        """
+        assert self.size is not None, "read_remaining_bytes() only works in a context manager"
+
+        bytes_remaining = self.get_remaining()
+        if bytes_remaining <= 0:
+            return bytes()
+
+        buffer = self.file_data.read(bytes_remaining)
+        if len(buffer) != bytes_remaining:
+            raise EOFError("Unable to read enough bytes from source")
+        return buffer
+
     def read_tag(self) -> str:
         """Read a 4 character tag
 
@@ -807,6 +905,7 @@ class GrainDataLoadingMode (Enum):
         ALWAYS_LOAD_DEFER_IF_POSSIBLE -- Grain data will be read as the stream is processed
         ALWAYS_DEFER_LOAD_IF_POSSIBLE -- Grain data will be read as the stream is processed
         LOAD_NEVER -- Grain data will be skipped over
+        MEMORY_MAP_IF_POSSIBLE -- Grain data will be read as the stream is processed
 
     For a Seekable input:
         LOAD_IMMEDIATELY -- Grain data will be read as the stream is processed
@@ -817,11 +916,247 @@ class GrainDataLoadingMode (Enum):
                                          upon request. All unloaded grains will have their data
                                          loading canceled when the context manager is exited.
         LOAD_NEVER -- Grain data will be skipped over
+        MEMORY_MAP_IF_POSSIBLE -- Grain data will be a read-only memoryview onto a memory map of the
+                                  input (or onto the contents of a BytesIO, which is not locked by the
+                                  views), so no copy is made. If the input cannot be mapped the data will
+                                  be loaded as for ALWAYS_DEFER_LOAD_IF_POSSIBLE. The views remain valid
+                                  after the context manager is exited.
     """
     LOAD_IMMEDIATELY = 0
     ALWAYS_LOAD_DEFER_IF_POSSIBLE = 1
     ALWAYS_DEFER_LOAD_IF_POSSIBLE = 2
     LOAD_NEVER = 3
+    MEMORY_MAP_IF_POSSIBLE = 4
+
+
+class GrainMetadataParts (Flag):
+    """This enumeration describes the optional parts of grain metadata which a decoder can be asked to skip, so that
+    the blocks holding them are not parsed.
+
+        TIMELABELS -- The time labels ("tils" block). Grains will have no timelabels
+        COMPONENTS -- The components of video grains ("comp" block). Video grains will have an empty component list
+        UNIT_OFFSETS -- The unit offsets of coded video grains ("unof" block). Coded video grains will have no unit
+                        offsets
+
+    Values can be combined with "|", and ALL skips every optional part.
+    """
+    NONE = 0
+    TIMELABELS = 1
+    COMPONENTS = 2
+    UNIT_OFFSETS = 4
+    ALL = 7
+
+
+# The grain type implied by each of the child blocks of a "gbhd" block
+_GRAIN_TYPE_FOR_HEADER_TAG = {
+    "vghd": "video",
+    "cghd": "coded_video",
+    "aghd": "audio",
+    "cahd": "coded_audio",
+    "eghd": "event"
+}
+_GRAIN_TYPE_CODE_FOR_HEADER_TAG = {
+    tag: GSF_GRAIN_TYPES.index(name) for (tag, name) in _GRAIN_TYPE_FOR_HEADER_TAG.items()
+}
+
+# Precompiled layouts of the fixed size parts of "gbhd" blocks and their children, all little-endian. Timestamps are
+# stored as an (optional) sign byte, a 48 bit seconds value split into low and high words, and a 32 bit nanoseconds
+# value.
+_BLOCK_HEADER = struct.Struct("<4sI")
+_UINT16 = struct.Struct("<H")
+_UINT32 = struct.Struct("<I")
+_GBHD = struct.Struct("<16s16sBIHIBIHIIIII")
+_GBHD_TIMESTAMPS = struct.Struct("<32xBIHIBIHI")
+_GBHD_V7 = struct.Struct("<16s16s16xIHIIHIIIII")
+_GBHD_V7_TIMESTAMPS = struct.Struct("<48xIHIIHI")
+_GBHD_FIELDS = struct.Struct("<32xBIHIBIHIIIII")
+_GBHD_V7_FIELDS = struct.Struct("<48xIHIIHIIIII")
+_TIMELABEL = struct.Struct("<16sIIIB")
+_VGHD = struct.Struct("<IIIIIIIII")
+_COMPONENT = struct.Struct("<IIII")
+_CGHD = struct.Struct("<IIIIIIBi")
+_AGHD = struct.Struct("<IHII")
+_CAHD = struct.Struct("<IHIIII")
+
+# The fixed fields of a "gbhd" block and its (tag, start, end) child blocks, as returned by _unpack_gbhd
+_UnpackedGBHD = Tuple[tuple, List[Tuple[str, int, int]]]
+
+
+def _decode_rational(numerator: int, denominator: int) -> Fraction:
+    """Convert a stored numerator and denominator into a Fraction
+
+    :returns: fraction.Fraction, or Fraction(0) if numerator or denominator is 0
+    """
+    if numerator == 0 or denominator == 0:
+        return Fraction(0)
+    else:
+        return Fraction(numerator, denominator)
+
+
+def _decode_string(string_data: bytes, position: int) -> str:
+    """Decode a fixed-length string, treating it as UTF-8, in the same way as SyncGSFBlock.read_string
+
+    :param string_data: The bytes of the string
+    :param position: The position of the string in the file, used for error reporting
+    :returns: String
+    :raises GSFDecodeError: If the bytes are not valid UTF-8
+    """
+    try:
+        string = string_data.decode(encoding='utf-8').rstrip('\x00')
+        if not string or string[0] == '\x00':
+            return ""
+        return string
+    except UnicodeDecodeError:
+        raise GSFDecodeError(f"Failed to decode bytes at {position} to a valid string", position)
+
+
+def _sub_buffer(buffer: bytes, start: int, length: int) -> memoryview:
+    """Get a view of part of a buffer
+
+    :raises struct.error: If the buffer is too short
+    """
+    if start + length > len(buffer):
+        raise struct.error("buffer too short")
+    return memoryview(buffer)[start:start + length]
+
+
+def _child_blocks(buffer: bytes, start: int, end: int, parent_tag: str, base: int) -> Iterator[Tuple[str, int, int]]:
+    """Generator for the child blocks contained in a part of a buffer
+
+    Works in the same way as SyncGSFBlock.child_blocks with strict_blocks=True.
+
+    :param buffer: A buffer holding the parent block
+    :param start: The position in the buffer of the first child block
+    :param end: The position in the buffer of the end of the parent block
+    :param parent_tag: The tag of the parent block, used for error reporting
+    :param base: The position in the file of the start of the buffer, used for error reporting
+    :yields: (tag, contents_start, contents_end) tuples, positions are relative to the buffer
+    :raises GSFDecodeError: If there is a partial block, or a tag fails to decode
+    :raises struct.error: If the buffer is too short
+    """
+    pos = start
+    while end - pos >= 8:
+        (tag_data, size) = _BLOCK_HEADER.unpack_from(buffer, pos)
+        tag = _decode_string(tag_data, base + pos)
+
+        # If size is < 8 bytes then it is a special value, the actual size is 8
+        block_end = pos + max(8, size)
+        yield (tag, pos + 8, block_end)
+        pos = block_end
+
+    if end != pos:
+        raise GSFDecodeError("Found a partial block (or parent too small) in '{}' at {}".format(parent_tag, base + pos),
+                             base + pos)
+
+
+def _map_file(fp: IO[bytes]) -> Optional[memoryview]:
+    """Create a read-only view over the whole of a seekable input without copying it
+
+    :param fp: A seekable file-like object. Real files are memory mapped. For BytesIO objects the view is onto a
+               snapshot of their contents rather than onto getbuffer(), which would stop the BytesIO being written to
+               or closed whilst any grain held a view. CPython shares the snapshot with the BytesIO until it is next
+               changed, so it is usually not a copy
+    :returns: A memoryview, or None if the input cannot be mapped
+    """
+    if isinstance(fp, BytesIO):
+        return memoryview(fp.getvalue())
+
+    try:
+        fileno = fp.fileno()
+    except (AttributeError, OSError, UnsupportedOperation):
+        return None
+
+    try:
+        return memoryview(mmap.mmap(fileno, 0, access=mmap.ACCESS_READ))
+    except (OSError, ValueError):
+        # Empty files and special files (eg. pipes) cannot be mapped
+        return None
+
+
+def _event_topic(data: bytes) -> Optional[str]:
+    """Get the topic from the payload of an event grain, or None if the payload isn't valid"""
+    try:
+        payload = json.loads(bytes(data).decode('utf-8'))
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    return payload.get('topic')
+
+
+# The shortest and longest waits between checks for new data when following a file that is still being written
+_FOLLOW_MIN_DELAY = 0.01
+_FOLLOW_MAX_DELAY = 0.5
+
+
+def _skip_forward(fp: IO[bytes], length: int, chunk_size: int = 1 << 20) -> None:
+    """Move forward over `length` bytes of an input, seeking if possible or otherwise reading the bytes in bounded
+    chunks into a reused buffer rather than reading them all at once
+
+    :raises EOFError: If the input ends before `length` bytes have been skipped
+    """
+    if fp.seekable():
+        fp.seek(length, SEEK_CUR)
+        return
+
+    buffer = memoryview(bytearray(min(length, chunk_size)))
+    while length > 0:
+        n = cast(BufferedIOBase, fp).readinto(buffer[:min(length, len(buffer))])
+        if not n:
+            raise EOFError("Unable to read enough bytes from source")
+        length -= n
+
+
+def _readinto_exactly(fp: IO[bytes], buffer: bytearray) -> None:
+    """Fill a buffer from an input
+
+    :raises EOFError: If the input ends before the buffer is full
+    """
+    view = memoryview(buffer)
+    filled = 0
+    while filled < len(view):
+        n = cast(BufferedIOBase, fp).readinto(view[filled:])
+        if not n:
+            raise EOFError("Unable to read enough bytes from source")
+        filled += n
+
+
+async def _async_readinto_exactly(fp: OpenAsyncBinaryIO, buffer: bytearray) -> None:
+    """Fill a buffer from an asynchronous input
+
+    :raises EOFError: If the input ends before the buffer is full
+    """
+    view = memoryview(buffer)
+    filled = 0
+    while filled < len(view):
+        n = await fp.readinto(cast(bytearray, view[filled:]))
+        if n is None:
+            continue
+        if n == 0:
+            raise EOFError("Unable to read enough bytes from source")
+        filled += n
+
+
+def _coalesce_ranges(ranges: Iterable[Tuple[int, int, T]],
+                     max_gap: int,
+                     max_read: int) -> List[Tuple[int, int, List[Tuple[int, int, T]]]]:
+    """Group (position, length, item) ranges of a file into runs which can each be loaded with a single read
+
+    :param max_gap: The largest number of unwanted bytes between two ranges for them to be read together
+    :param max_read: The largest run to read at once, unless a single range is larger
+    :returns: A list of (start, end, ranges) tuples in file order
+    """
+    runs: List[Tuple[int, int, List[Tuple[int, int, T]]]] = []
+    for r in sorted(ranges, key=lambda r: r[0]):
+        (pos, length, _) = r
+        if runs:
+            (start, end, members) = runs[-1]
+            if pos - end <= max_gap and max(end, pos + length) - start <= max_read:
+                runs[-1] = (start, max(end, pos + length), members)
+                members.append(r)
+                continue
+        runs.append((pos, pos + length, [r]))
+    return runs
 
 
 class BaseGSFDecoderSession(object):
@@ -829,6 +1164,49 @@ class BaseGSFDecoderSession(object):
     def __init__(self):
         self.major = 0
         self.minor = 0
+        self.skip_metadata = GrainMetadataParts.NONE
+
+        self._memory_map: Optional[memoryview] = None
+        self._memory_map_unavailable = False
+
+    def _mapped_data(self, fp: IO[bytes], pos: int, length: int) -> Optional[memoryview]:
+        """Get a zero-copy view of a region of the input file, mapping (or re-mapping) the file if needed
+
+        :param fp: The synchronous file object underlying this session
+        :param pos: The start of the region in the file
+        :param length: The length of the region
+        :returns: A read-only memoryview, or None if the file cannot be mapped
+        """
+        if self._memory_map_unavailable:
+            return None
+
+        if self._memory_map is None or pos + length > len(self._memory_map):
+            # The file may have grown since it was mapped
+            self._release_memory_map()
+            self._memory_map = _map_file(fp)
+
+            if self._memory_map is None:
+                self._memory_map_unavailable = True
+                return None
+            elif pos + length > len(self._memory_map):
+                # The region may be mapped once the file has grown further
+                return None
+
+        return self._memory_map[pos:pos + length]
+
+    def _release_memory_map(self) -> None:
+        """Drop this session's reference to the memory map. Views already handed out to grains remain valid."""
+        if self._memory_map is not None:
+            underlying = self._memory_map.obj
+            self._memory_map.release()
+            self._memory_map = None
+
+            if isinstance(underlying, mmap.mmap):
+                try:
+                    underlying.close()
+                except BufferError:
+                    # Some grains still hold views, the map will be closed when they are garbage collected
+                    pass
 
     def _sync_decode_head(self,
                           head_block: SyncGSFBlock) -> GSFFileHeaderDict:
@@ -883,161 +1261,370 @@ class BaseGSFDecoderSession(object):
 
         return cast(GSFFileHeaderDict, head)
 
-    def _sync_decode_tils(self, tils_block: SyncGSFBlock) -> List[dict]:
-        """Decode timelabels (tils) block
+    def _decode_tils(self, buffer: bytes, pos: int, base: int) -> List[dict]:
+        """Decode the contents of a timelabels ("tils") block
 
-        :param tils_block: Instance of SyncGSFBlock() representing a "gbhd" block
-        :returns: tils block as a dict
+        :param buffer: A buffer containing the block
+        :param pos: The position of the start of the block contents in the buffer
+        :param base: The position of the start of the buffer in the file
+        :returns: A list of timelabel dicts
         """
         tils = []
-        timelabel_count = tils_block.read_uint(2)
+        (timelabel_count,) = _UINT16.unpack_from(buffer, pos)
+        pos += _UINT16.size
         for i in range(0, timelabel_count):
-            tag = tils_block.read_string(16)
-            tag = tag.strip("\x00")
-            count = tils_block.read_uint(4)
-            rate = tils_block.read_rational()
-            drop = tils_block.read_bool()
+            (tag, count, numerator, denominator, drop) = _TIMELABEL.unpack_from(buffer, pos)
+            rate = _decode_rational(numerator, denominator)
 
-            tils.append({'tag': tag,
+            tils.append({'tag': _decode_string(tag, base + pos).strip("\x00"),
                          'timelabel': {'frames_since_midnight': count,
                                        'frame_rate_numerator': rate.numerator,
                                        'frame_rate_denominator': rate.denominator,
-                                       'drop_frame': drop}})
+                                       'drop_frame': (drop != 0)}})
+            pos += _TIMELABEL.size
 
         return tils
 
-    def _sync_decode_gbhd(self, gbhd_block: SyncGSFBlock) -> GrainMetadataDict:
-        """Decode grain block header ("gbhd") to get grain metadata
+    def _unpack_gbhd(self, buffer: bytes, base: int) -> _UnpackedGBHD:
+        """Unpack the fixed fields of a grain block header ("gbhd") and find its child blocks, so that the filters in
+        grains() and _decode_gbhd can share them
+
+        :param buffer: The contents of the "gbhd" block, not including its tag and size
+        :param base: The position in the file of the start of the buffer
+        :returns: (fields, children) tuple, where fields is (source_id, flow_id, ots_sign, ots_sec_lo, ots_sec_hi,
+                  ots_nsec, sts_sign, sts_sec_lo, sts_sec_hi, sts_nsec, rate_num, rate_den, duration_num,
+                  duration_den) with both signs set for a version 7 file, and children is a list of (tag, start, end)
+                  tuples as from _child_blocks
+        :raises GSFDecodeError: If "gbhd" block contains a partial child block
+        :raises EOFError: If the buffer is too short for the data it should contain
+        """
+        try:
+            if self.major == 7:
+                (src_id, flow_id,
+                 ots_sec_lo, ots_sec_hi, ots_nsec,
+                 sts_sec_lo, sts_sec_hi, sts_nsec,
+                 rate_num, rate_den, duration_num, duration_den) = _GBHD_V7.unpack_from(buffer, 0)
+                fields: tuple = (src_id, flow_id,
+                                 1, ots_sec_lo, ots_sec_hi, ots_nsec,
+                                 1, sts_sec_lo, sts_sec_hi, sts_nsec,
+                                 rate_num, rate_den, duration_num, duration_den)
+                pos = _GBHD_V7.size
+            else:
+                fields = _GBHD.unpack_from(buffer, 0)
+                pos = _GBHD.size
+
+            children = list(_child_blocks(buffer, pos, len(buffer), "gbhd", base))
+        except struct.error:
+            raise EOFError("Unable to read enough bytes from source")
+
+        return (fields, children)
 
-        :param gbhd_block: Instance of GSFBlock() representing a "gbhd" block
+    def _decode_gbhd(self,
+                     buffer: bytes,
+                     base: int,
+                     unpacked: Optional[_UnpackedGBHD] = None) -> GrainMetadataDict:
+        """Decode the contents of a grain block header ("gbhd") to get grain metadata
+
+        The fixed layouts of the header and its child blocks are unpacked directly from the buffer.
+
+        :param buffer: The contents of the "gbhd" block, not including its tag and size
+        :param base: The position in the file of the start of the buffer
+        :param unpacked: The result of _unpack_gbhd for the buffer, if it has already been unpacked
         :returns: Grain data dict
-        :raises GSFDecodeError: If "gbhd" block contains an unkown child block
+        :raises GSFDecodeError: If "gbhd" block contains a partial child block
+        :raises EOFError: If the buffer is too short for the data it should contain
         """
         meta: dict = {
             "grain": {
             }
         }
 
-        meta['grain']['source_id'] = gbhd_block.read_uuid()
-        meta['grain']['flow_id'] = gbhd_block.read_uuid()
-        if self.major == 7:
-            gbhd_block.skip(16)  # Skip over deprecated byte array
-            meta['grain']['origin_timestamp'] = gbhd_block.read_timestamp_v7()
-            meta['grain']['sync_timestamp'] = gbhd_block.read_timestamp_v7()
-        else:
-            meta['grain']['origin_timestamp'] = gbhd_block.read_timestamp()
-            meta['grain']['sync_timestamp'] = gbhd_block.read_timestamp()
-        meta['grain']['rate'] = gbhd_block.read_rational()
-        meta['grain']['duration'] = gbhd_block.read_rational()
-
-        for gbhd_child in gbhd_block.child_blocks():
-            if gbhd_child.tag == "tils":
-                meta['grain']['timelabels'] = self._sync_decode_tils(gbhd_child)
-            elif gbhd_child.tag == "vghd":
-                meta['grain']['grain_type'] = 'video'
-                meta['grain']['cog_frame'] = {}
-                meta['grain']['cog_frame']['format'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_frame']['layout'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_frame']['width'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_frame']['height'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_frame']['extension'] = gbhd_child.read_uint(4)
-
-                src_aspect_ratio = gbhd_child.read_rational()
-                if src_aspect_ratio != 0:
-                    meta['grain']['cog_frame']['source_aspect_ratio'] = {
-                        'numerator': src_aspect_ratio.numerator,
-                        'denominator': src_aspect_ratio.denominator
-                    }
+        if unpacked is None:
+            unpacked = self._unpack_gbhd(buffer, base)
+        ((src_id, flow_id,
+          ots_sign, ots_sec_lo, ots_sec_hi, ots_nsec,
+          sts_sign, sts_sec_lo, sts_sec_hi, sts_nsec,
+          rate_num, rate_den, duration_num, duration_den), children) = unpacked
 
-                pixel_aspect_ratio = gbhd_child.read_rational()
-                if pixel_aspect_ratio != 0:
-                    meta['grain']['cog_frame']['pixel_aspect_ratio'] = {
-                        'numerator': pixel_aspect_ratio.numerator,
-                        'denominator': pixel_aspect_ratio.denominator
+        try:
+            meta['grain']['source_id'] = UUID(bytes=src_id)
+            meta['grain']['flow_id'] = UUID(bytes=flow_id)
+            meta['grain']['origin_timestamp'] = Timestamp(ots_sec_lo + (ots_sec_hi << 32), ots_nsec,
+                                                          1 if ots_sign else -1)
+            meta['grain']['sync_timestamp'] = Timestamp(sts_sec_lo + (sts_sec_hi << 32), sts_nsec,
+                                                        1 if sts_sign else -1)
+            meta['grain']['rate'] = _decode_rational(rate_num, rate_den)
+            meta['grain']['duration'] = _decode_rational(duration_num, duration_den)
+
+            for (tag, start, end) in children:
+                if tag == "tils":
+                    if GrainMetadataParts.TIMELABELS in self.skip_metadata:
+                        continue
+                    meta['grain']['timelabels'] = self._decode_tils(buffer, start, base)
+                elif tag == "vghd":
+                    (fmt, layout, width, height, extension,
+                     src_aspect_num, src_aspect_den, pixel_aspect_num, pixel_aspect_den) = _VGHD.unpack_from(
+                        buffer, start)
+
+                    meta['grain']['grain_type'] = 'video'
+                    meta['grain']['cog_frame'] = {
+                        'format': fmt,
+                        'layout': layout,
+                        'width': width,
+                        'height': height,
+                        'extension': extension
                     }
 
-                meta['grain']['cog_frame']['components'] = []
-                for comp_block in gbhd_child.child_blocks():
-                    if comp_block.tag != 'comp':
-                        continue
+                    src_aspect_ratio = _decode_rational(src_aspect_num, src_aspect_den)
+                    if src_aspect_ratio != 0:
+                        meta['grain']['cog_frame']['source_aspect_ratio'] = {
+                            'numerator': src_aspect_ratio.numerator,
+                            'denominator': src_aspect_ratio.denominator
+                        }
+
+                    pixel_aspect_ratio = _decode_rational(pixel_aspect_num, pixel_aspect_den)
+                    if pixel_aspect_ratio != 0:
+                        meta['grain']['cog_frame']['pixel_aspect_ratio'] = {
+                            'numerator': pixel_aspect_ratio.numerator,
+                            'denominator': pixel_aspect_ratio.denominator
+                        }
 
-                    # Guard against bad files with multiple 'comp'
                     meta['grain']['cog_frame']['components'] = []
+                    if GrainMetadataParts.COMPONENTS in self.skip_metadata:
+                        continue
+                    for (comp_tag, comp_start, _) in _child_blocks(buffer, start + _VGHD.size, end, "vghd", base):
+                        if comp_tag != 'comp':
+                            continue
 
-                    comp_count = comp_block.read_uint(2)
-                    offset = 0
-                    for i in range(0, comp_count):
-                        comp = {}
-                        comp['width'] = comp_block.read_uint(4)
-                        comp['height'] = comp_block.read_uint(4)
-                        comp['stride'] = comp_block.read_uint(4)
-                        comp['length'] = comp_block.read_uint(4)
-                        comp['offset'] = offset
-                        offset += comp['length']
-                        meta['grain']['cog_frame']['components'].append(comp)
-
-            elif gbhd_child.tag == 'cghd':
-                meta['grain']['grain_type'] = "coded_video"
-                meta['grain']['cog_coded_frame'] = {}
-                meta['grain']['cog_coded_frame']['format'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_coded_frame']['layout'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_coded_frame']['origin_width'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_coded_frame']['origin_height'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_coded_frame']['coded_width'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_coded_frame']['coded_height'] = gbhd_child.read_uint(4)
-                if self.major < 9:
-                    meta['grain']['cog_coded_frame']['is_key_frame'] = gbhd_child.read_bool()
-                    meta['grain']['cog_coded_frame']['temporal_offset'] = gbhd_child.read_sint(4)
-                else:
-                    is_key_frame = gbhd_child.read_optional_bool()
-                    if is_key_frame is not None:
-                        meta['grain']['cog_coded_frame']['is_key_frame'] = is_key_frame
-                    temporal_offset = gbhd_child.read_optional_sint(4, 0x7fffffff)
-                    if temporal_offset is not None:
+                        # Guard against bad files with multiple 'comp'
+                        meta['grain']['cog_frame']['components'] = []
+
+                        (comp_count,) = _UINT16.unpack_from(buffer, comp_start)
+                        offset = 0
+                        for (comp_width, comp_height, stride, length) in _COMPONENT.iter_unpack(
+                                _sub_buffer(buffer, comp_start + _UINT16.size, comp_count * _COMPONENT.size)):
+                            meta['grain']['cog_frame']['components'].append({
+                                'width': comp_width,
+                                'height': comp_height,
+                                'stride': stride,
+                                'length': length,
+                                'offset': offset
+                            })
+                            offset += length
+
+                elif tag == 'cghd':
+                    (fmt, layout, origin_width, origin_height, coded_width, coded_height,
+                     is_key_frame, temporal_offset) = _CGHD.unpack_from(buffer, start)
+
+                    meta['grain']['grain_type'] = "coded_video"
+                    meta['grain']['cog_coded_frame'] = {
+                        'format': fmt,
+                        'layout': layout,
+                        'origin_width': origin_width,
+                        'origin_height': origin_height,
+                        'coded_width': coded_width,
+                        'coded_height': coded_height
+                    }
+                    if self.major < 9:
+                        meta['grain']['cog_coded_frame']['is_key_frame'] = (is_key_frame != 0)
                         meta['grain']['cog_coded_frame']['temporal_offset'] = temporal_offset
-
-                for unof_block in gbhd_child.child_blocks():
-                    if unof_block.tag != 'unof':
+                    else:
+                        # Values of is_key_frame greater than 1 and a temporal_offset of 0x7fffffff mean "unset"
+                        if is_key_frame <= 1:
+                            meta['grain']['cog_coded_frame']['is_key_frame'] = (is_key_frame != 0)
+                        if temporal_offset != 0x7fffffff:
+                            meta['grain']['cog_coded_frame']['temporal_offset'] = temporal_offset
+
+                    if GrainMetadataParts.UNIT_OFFSETS in self.skip_metadata:
                         continue
+                    for (unof_tag, unof_start, _) in _child_blocks(buffer, start + _CGHD.size, end, "cghd", base):
+                        if unof_tag != 'unof':
+                            continue
+
+                        (unit_offsets,) = _UINT16.unpack_from(buffer, unof_start)
+                        meta['grain']['cog_coded_frame']['unit_offsets'] = [
+                            unit_offset for (unit_offset,) in _UINT32.iter_unpack(
+                                _sub_buffer(buffer, unof_start + _UINT16.size, unit_offsets * _UINT32.size))]
+
+                elif tag == "aghd":
+                    (fmt, channels, samples, sample_rate) = _AGHD.unpack_from(buffer, start)
+
+                    meta['grain']['grain_type'] = "audio"
+                    meta['grain']['cog_audio'] = {
+                        'format': fmt,
+                        'channels': channels,
+                        'samples': samples,
+                        'sample_rate': sample_rate
+                    }
 
-                    meta['grain']['cog_coded_frame']['unit_offsets'] = []
-
-                    unit_offsets = unof_block.read_uint(2)
-                    for i in range(0, unit_offsets):
-                        meta['grain']['cog_coded_frame']['unit_offsets'].append(unof_block.read_uint(4))
-
-            elif gbhd_child.tag == "aghd":
-                meta['grain']['grain_type'] = "audio"
-                meta['grain']['cog_audio'] = {}
-                meta['grain']['cog_audio']['format'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_audio']['channels'] = gbhd_child.read_uint(2)
-                meta['grain']['cog_audio']['samples'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_audio']['sample_rate'] = gbhd_child.read_uint(4)
-
-            elif gbhd_child.tag == "cahd":
-                meta['grain']['grain_type'] = "coded_audio"
-                meta['grain']['cog_coded_audio'] = {}
-                meta['grain']['cog_coded_audio']['format'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_coded_audio']['channels'] = gbhd_child.read_uint(2)
-                meta['grain']['cog_coded_audio']['samples'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_coded_audio']['priming'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_coded_audio']['remainder'] = gbhd_child.read_uint(4)
-                meta['grain']['cog_coded_audio']['sample_rate'] = gbhd_child.read_uint(4)
-
-            elif gbhd_child.tag == "eghd":
-                meta['grain']['grain_type'] = "event"
+                elif tag == "cahd":
+                    (fmt, channels, samples, priming, remainder, sample_rate) = _CAHD.unpack_from(buffer, start)
+
+                    meta['grain']['grain_type'] = "coded_audio"
+                    meta['grain']['cog_coded_audio'] = {
+                        'format': fmt,
+                        'channels': channels,
+                        'samples': samples,
+                        'priming': priming,
+                        'remainder': remainder,
+                        'sample_rate': sample_rate
+                    }
+
+                elif tag == "eghd":
+                    meta['grain']['grain_type'] = "event"
+        except struct.error:
+            raise EOFError("Unable to read enough bytes from source")
 
         return cast(GrainMetadataDict, meta)
 
+    def _scan_gbhd(self, buffer: bytes, base: int) -> Tuple[Timestamp, Timestamp, str]:
+        """Decode only the timestamps and grain type from the contents of a grain block header ("gbhd")
+
+        :param buffer: The contents of the "gbhd" block, not including its tag and size
+        :param base: The position in the file of the start of the buffer
+        :returns: (origin_timestamp, sync_timestamp, grain_type) tuple
+        :raises EOFError: If the buffer is too short for the data it should contain
+        """
+        try:
+            if self.major == 7:
+                (ots_sec_lo, ots_sec_hi, ots_nsec,
+                 sts_sec_lo, sts_sec_hi, sts_nsec) = _GBHD_V7_TIMESTAMPS.unpack_from(buffer, 0)
+                ots_sign = sts_sign = 1
+                pos = _GBHD_V7.size
+            else:
+                (ots_sign, ots_sec_lo, ots_sec_hi, ots_nsec,
+                 sts_sign, sts_sec_lo, sts_sec_hi, sts_nsec) = _GBHD_TIMESTAMPS.unpack_from(buffer, 0)
+                pos = _GBHD.size
+
+            grain_type = "empty"
+            for (tag, _, _) in _child_blocks(buffer, pos, len(buffer), "gbhd", base):
+                if tag in _GRAIN_TYPE_FOR_HEADER_TAG:
+                    grain_type = _GRAIN_TYPE_FOR_HEADER_TAG[tag]
+        except struct.error:
+            raise EOFError("Unable to read enough bytes from source")
+
+        return (Timestamp(ots_sec_lo + (ots_sec_hi << 32), ots_nsec, 1 if ots_sign else -1),
+                Timestamp(sts_sec_lo + (sts_sec_hi << 32), sts_nsec, 1 if sts_sign else -1),
+                grain_type)
+
+    def _scan_gbhd_row(self, buffer: bytes, base: int) -> tuple:
+        """Decode the fields used by scan_headers from the contents of a grain block header ("gbhd")
+
+        No Timestamp objects or metadata dicts are created.
+
+        :param buffer: The contents of the "gbhd" block, not including its tag and size
+        :param base: The position in the file of the start of the buffer
+        :returns: (origin_timestamp, sync_timestamp, rate_numerator, rate_denominator, duration_numerator,
+                  duration_denominator, grain_type, format, is_key_frame, samples, sample_rate) tuple, with timestamps
+                  as integer nanoseconds, grain_type as an index into GSF_GRAIN_TYPES, is_key_frame set to -1 when it
+                  is not known and samples and sample_rate set to 0 for grains which aren't audio or coded audio
+        :raises GSFDecodeError: If "gbhd" block contains a partial child block
+        :raises EOFError: If the buffer is too short for the data it should contain
+        """
+        try:
+            if self.major == 7:
+                (ots_sec_lo, ots_sec_hi, ots_nsec,
+                 sts_sec_lo, sts_sec_hi, sts_nsec,
+                 rate_num, rate_den, duration_num, duration_den) = _GBHD_V7_FIELDS.unpack_from(buffer, 0)
+                ots_sign = sts_sign = 1
+                pos = _GBHD_V7.size
+            else:
+                (ots_sign, ots_sec_lo, ots_sec_hi, ots_nsec,
+                 sts_sign, sts_sec_lo, sts_sec_hi, sts_nsec,
+                 rate_num, rate_den, duration_num, duration_den) = _GBHD_FIELDS.unpack_from(buffer, 0)
+                pos = _GBHD.size
+
+            grain_type = 0
+            fmt = 0
+            is_key_frame = -1
+            samples = sample_rate = 0
+            for (tag, start, _) in _child_blocks(buffer, pos, len(buffer), "gbhd", base):
+                if tag not in _GRAIN_TYPE_CODE_FOR_HEADER_TAG:
+                    continue
+
+                grain_type = _GRAIN_TYPE_CODE_FOR_HEADER_TAG[tag]
+                if tag == "eghd":
+                    fmt = 0
+                else:
+                    (fmt,) = _UINT32.unpack_from(buffer, start)
+
+                if tag == "cghd":
+                    key_frame_flag = _CGHD.unpack_from(buffer, start)[6]
+                    if self.major < 9:
+                        is_key_frame = int(key_frame_flag != 0)
+                    elif key_frame_flag <= 1:
+                        is_key_frame = key_frame_flag
+                elif tag == "aghd":
+                    (_, _, samples, sample_rate) = _AGHD.unpack_from(buffer, start)
+                elif tag == "cahd":
+                    (_, _, samples, _, _, sample_rate) = _CAHD.unpack_from(buffer, start)
+        except struct.error:
+            raise EOFError("Unable to read enough bytes from source")
+
+        ots = (ots_sec_lo + (ots_sec_hi << 32)) * 1000000000 + ots_nsec
+        sts = (sts_sec_lo + (sts_sec_hi << 32)) * 1000000000 + sts_nsec
+        return (ots if ots_sign else -ots,
+                sts if sts_sign else -sts,
+                rate_num, rate_den, duration_num, duration_den,
+                grain_type, fmt, is_key_frame, samples, sample_rate)
+
+    def _match_grain_header(self,
+                            buffer: bytes,
+                            base: int,
+                            grain_types: Optional[Sequence[str]],
+                            timerange: Optional[TimeRange],
+                            key_frames_only: bool,
+                            event_topics: Optional[Sequence[str]]) -> Optional[_UnpackedGBHD]:
+        """Check the contents of a grain block header ("gbhd") against the filters passed to grains(), without
+        creating a metadata dict
+
+        :param buffer: The contents of the "gbhd" block, not including its tag and size
+        :param base: The position in the file of the start of the buffer
+        :returns: The result of _unpack_gbhd, to pass on to _decode_gbhd, or None if the grain is excluded by the
+                  filters. Grains which pass may still be excluded by their event topic, which isn't part of the header
+        :raises GSFDecodeError: If "gbhd" block contains a partial child block
+        :raises EOFError: If the buffer is too short for the data it should contain
+        """
+        unpacked = self._unpack_gbhd(buffer, base)
+        (fields, children) = unpacked
+
+        grain_type = "empty"
+        is_key_frame = False
+        try:
+            for (tag, start, _) in children:
+                if tag in _GRAIN_TYPE_FOR_HEADER_TAG:
+                    grain_type = _GRAIN_TYPE_FOR_HEADER_TAG[tag]
+                    if tag == "cghd":
+                        key_frame_flag = _CGHD.unpack_from(buffer, start)[6]
+                        is_key_frame = (key_frame_flag != 0) if self.major < 9 else (key_frame_flag == 1)
+        except struct.error:
+            raise EOFError("Unable to read enough bytes from source")
+
+        if grain_types is not None and grain_type not in grain_types:
+            return None
+        if event_topics is not None and grain_type != "event":
+            return None
+        if key_frames_only and not is_key_frame:
+            return None
+        if timerange is not None:
+            (ots_sign, ots_sec_lo, ots_sec_hi, ots_nsec) = fields[2:6]
+            if Timestamp(ots_sec_lo + (ots_sec_hi << 32), ots_nsec, 1 if ots_sign else -1) not in timerange:
+                return None
+        return unpacked
+
 
 class GSFAsyncDecoderSession(BaseGSFDecoderSession):
     def __init__(self,
                  parse_grain: ParseGrainType,
                  file_data: OpenAsyncBinaryIO,
                  sync_compatibility_mode: bool,
-                 support_concatenation: bool = True):
+                 support_concatenation: bool = True,
+                 data_cache: Optional[GrainDataCache] = None,
+                 skip_metadata: GrainMetadataParts = GrainMetadataParts.NONE):
         super().__init__()
         self.file_data = file_data
+        self.data_cache = data_cache
+        self.skip_metadata = skip_metadata
 
         if not self.file_data.seekable_forwards():
             raise RuntimeError("Cannot decode a stream that is not at least forward seekable")
@@ -1047,11 +1634,27 @@ class GSFAsyncDecoderSession(BaseGSFDecoderSession):
 
         self._exiting = False
         self._unloaded_lazy_grains: Dict[int, Grain] = {}
+        self._lazy_grain_ranges: Dict[int, Tuple[int, int]] = {}
+        self._preloaded_data: Dict[int, bytes] = {}
         self._next_lazy_grain_number = 0
 
+        # The data_cache keys of grains from this session whose data is currently loaded
+        self._cached_grains: Set[int] = set()
+
         self._sync_compatibility_mode = sync_compatibility_mode
         self._support_concatenation = support_concatenation
 
+        # Held while the file position is in use, so that lazy loads don't interfere with grains being prefetched
+        self._io_lock = asyncio.Lock()
+
+        self._grains_start: Optional[int] = None
+        self._file_header_offsets: List[int] = []
+        self._header_walk_pos: Optional[int] = None
+        self._found_all_file_headers = False
+
+        # May be set to an existing index (eg. loaded from a sidecar file), otherwise built when first needed
+        self.index: Optional[GSFIndex] = None
+
     async def _decode_ssb_header(self, head_tag=""):
         """Find and read the SSB header in the GSF file
 
@@ -1071,13 +1674,17 @@ class GSFAsyncDecoderSession(BaseGSFDecoderSession):
 
         return (major, minor)
 
-    async def _decode_file_headers(self, head_tag="") -> None:
+    async def _decode_file_headers(self, head_tag="", allow_partial: bool = False) -> None:
         """Verify the file is a supported version, get the file header and store it in the file_headers property
 
+        :param allow_partial: If True, raise EOFError rather than GSFDecodeError if the file ends in the middle of the
+                              "head" block, so that a file which is still being written can be read again later
         :raises GSFDecodeBadVersionError: If the file version is not supported
         :raises GSFDecodeBadFileTypeError: If this isn't a GSF file
         :raises GSFDecodeError: If the file doesn't have a "head" block
+        :raises EOFError: If the file ends in the middle of the file header, or the "head" block if allow_partial is set
         """
+        header_offset = self.file_data.tell() - len(head_tag)
         (self.major, self.minor) = await self._decode_ssb_header(head_tag=head_tag)
         if self.major not in [7, 8, 9]:
             raise GSFDecodeBadVersionError(f"Unknown Version {self.major}.{self.minor}", 0, self.major, self.minor)
@@ -1086,26 +1693,311 @@ class GSFAsyncDecoderSession(BaseGSFDecoderSession):
             async with AsyncGSFBlock(self.file_data, want_tag="head") as head_block:
                 self.file_headers = self._sync_decode_head(await head_block.read_remaining_block())
         except EOFError:
+            if allow_partial:
+                raise
             raise GSFDecodeError("No head block found in file", self.file_data.tell())
 
-    def _add_lazy_grain(self, key: int, grain: Grain):
+        if self._grains_start is None:
+            self._grains_start = self.file_data.tell()
+        if header_offset not in self._file_header_offsets:
+            insort(self._file_header_offsets, header_offset)
+
+    def _add_lazy_grain(self, key: int, grain: Grain, data_range: Tuple[int, int]):
         self._unloaded_lazy_grains[key] = grain
+        self._lazy_grain_ranges[key] = data_range
 
     def _remove_lazy_grain(self, key: int):
         del self._unloaded_lazy_grains[key]
+        del self._lazy_grain_ranges[key]
 
     async def _kill_unused_lazy_loaders(self):
         self._exiting = True
-        for (key, grain) in self._unloaded_lazy_grains.items():
+
+        # Grains which are still loaded keep their data, since once the file is closed it can't be loaded again
+        if self.data_cache is not None:
+            for key in self._cached_grains:
+                self.data_cache.discard(key)
+        self._cached_grains.clear()
+
+        for (key, grain) in list(self._unloaded_lazy_grains.items()):
             await grain
 
     async def _load_unused_lazy_loaders(self):
         for (key, grain) in list(self._unloaded_lazy_grains.items()):
             await grain
 
+    async def load_grains(self, grains: Iterable[Grain], max_gap: int = 1 << 16, max_read: int = 1 << 26) -> None:
+        """Load the data of several grains from this session which were decoded with deferred loading. The data of
+        grains which are close together in the file is loaded with a single larger read rather than one per grain.
+
+        :param grains: The grains to load. Grains that have already been loaded or weren't deferred are ignored
+        :param max_gap: The largest number of unwanted bytes between the data of two grains for them to be read together
+        :param max_read: The largest number of bytes to read at once, unless a single grain is larger
+        """
+        keys = {id(grain): key for (key, grain) in self._unloaded_lazy_grains.items()}
+        requests: List[Tuple[int, int, int]] = []
+        deferred_grains: List[Grain] = []
+        for grain in grains:
+            key = keys.get(id(grain))
+            if key is not None:
+                (pos, length) = self._lazy_grain_ranges[key]
+                requests.append((pos, length, key))
+                deferred_grains.append(grain)
+
+        for (start, end, members) in _coalesce_ranges(requests, max_gap, max_read):
+            async with self._io_lock:
+                oldpos = self.file_data.tell()
+                self.file_data.seek(start)
+                try:
+                    buffer = memoryview(await self.file_data.read(end - start))
+                finally:
+                    self.file_data.seek(oldpos)
+
+            for (pos, length, key) in members:
+                self._preloaded_data[key] = bytes(buffer[pos - start:pos - start + length])
+
+        for grain in deferred_grains:
+            await grain
+
+    async def _follow_file_headers(self, follow_timeout: Optional[float] = None) -> None:
+        """Decode the file header of a file which is still being written, waiting for the rest of it to be written if
+        the file ends part of the way through it, in the same way as grains() waits for grains when following
+
+        :param follow_timeout: Stop waiting once no new data has been written for this many seconds. If None (the
+                               default) wait until the file header has been written
+        :raises RuntimeError: If the input is not seekable
+        :raises GSFDecodeError: If the file header still hasn't been written when the timeout expires
+        """
+        if not self.file_data.seekable_backwards():
+            raise RuntimeError("Cannot follow a stream that is not seekable")
+
+        waiting_since: Optional[float] = None
+        delay = _FOLLOW_MIN_DELAY
+        pos = self.file_data.tell()
+        while True:
+            try:
+                await self._decode_file_headers(allow_partial=True)
+                return
+            except EOFError:
+                self.file_data.seek(pos)
+                now = time.monotonic()
+                if waiting_since is None:
+                    waiting_since = now
+                if follow_timeout is not None and now - waiting_since >= follow_timeout:
+                    raise GSFDecodeError("No head block found in file", pos)
+                await asyncio.sleep(delay)
+                delay = min(2*delay, _FOLLOW_MAX_DELAY)
+
+    async def read_index(self) -> Optional["GSFIndex"]:
+        """Read the index stored in the "gidx" block at the end of the file by a GSFEncoder constructed with
+        `index=True`. The file position is restored afterwards.
+
+        :returns: A GSFIndex, or None if the file doesn't end with a "gidx" block which describes the whole file
+        :raises RuntimeError: If the input is not seekable
+        """
+        if not self.file_data.seekable_backwards():
+            raise RuntimeError("Cannot read the index of a stream that is not seekable")
+
+        pos = self.file_data.tell()
+        try:
+            self.file_data.seek(0, SEEK_END)
+            file_size = self.file_data.tell()
+            self.file_data.seek(max(0, file_size - GSFIndex._TRAILER.size))
+            size = GSFIndex._trailer_block_size(await self.file_data.read(GSFIndex._TRAILER.size), file_size)
+            if size is None:
+                return None
+
+            self.file_data.seek(file_size - len(GSFIndex._TERMINATOR) - size)
+            return GSFIndex._from_block(await self.file_data.read(size), file_size)
+        except EOFError:
+            return None
+        finally:
+            self.file_data.seek(pos)
+
+    async def _find_file_headers(self, end: Optional[int] = None) -> None:
+        """Find the file headers of the concatenated files in the input which start before `end` (or all of them if
+        it is None). They are taken from the index if it records them, and otherwise found by walking over the top
+        level blocks after the first file header, carrying on from where any earlier walk stopped. The file position
+        is restored afterwards."""
+        if self.index is not None and self.index.header_offsets is not None:
+            for header_offset in self.index.header_offsets:
+                if header_offset not in self._file_header_offsets:
+                    insort(self._file_header_offsets, header_offset)
+            return
+
+        if self._found_all_file_headers:
+            return
+        if self._header_walk_pos is None:
+            self._header_walk_pos = cast(int, self._grains_start)
+
+        pos = self.file_data.tell()
+        try:
+            self.file_data.seek(self._header_walk_pos)
+            while end is None or self._header_walk_pos < end:
+                block_start = self._header_walk_pos
+                header = await self.file_data.read(8)
+                if len(header) < 8:
+                    self._found_all_file_headers = True
+                    break
+                if header == b"SSBBgrsg":
+                    if block_start not in self._file_header_offsets:
+                        insort(self._file_header_offsets, block_start)
+                    self._header_walk_pos = block_start + 12  # The rest of the file header is the version
+                else:
+                    self._header_walk_pos = block_start + max(8, int.from_bytes(header[4:], 'little'))
+                self.file_data.seek(self._header_walk_pos)
+        except EOFError:
+            self._found_all_file_headers = True
+        finally:
+            self.file_data.seek(pos)
+
+    async def _seek_to_grain(self, offset: int) -> None:
+        """Position the session at the "grai" block at `offset`. If the input is made of concatenated files the file
+        header of the one which contains the block is decoded first, so that its grains are decoded with the right
+        version and segments."""
+        if self._support_concatenation:
+            await self._find_file_headers(end=offset)
+            if len(self._file_header_offsets) > 1:
+                self.file_data.seek(self._file_header_offsets[bisect_right(self._file_header_offsets, offset) - 1])
+                await self._decode_file_headers()
+        self.file_data.seek(offset)
+
+    async def build_index(self) -> "GSFIndex":
+        """Scan the headers of every grain in the file to build an index of grain positions and timestamps
+
+        Grain data is seeked over rather than read, and the file position is restored afterwards.
+
+        :returns: A GSFIndex for the file
+        :raises RuntimeError: If the input is not seekable
+        :raises GSFDecodeError: If a grain is invalid (e.g. no "gbhd" child)
+        """
+        if not self.file_data.seekable_backwards():
+            raise RuntimeError("Cannot index a stream that is not seekable")
+
+        start_pos = self.file_data.tell()
+        header_state = (self.major, self.minor, self.file_headers)
+        entries: List[GSFIndexEntry] = []
+
+        try:
+            self.file_data.seek(cast(int, self._grains_start))
+
+            async for (offset, local_id, gbhd_buffer, gbhd_base, data_offset, data_length) in self._grain_headers():
+                (origin_timestamp, sync_timestamp, grain_type) = self._scan_gbhd(gbhd_buffer, gbhd_base)
+                entries.append(GSFIndexEntry(offset=offset,
+                                             local_id=local_id,
+                                             grain_type=grain_type,
+                                             origin_timestamp=origin_timestamp,
+                                             sync_timestamp=sync_timestamp,
+                                             data_offset=data_offset,
+                                             data_length=data_length))
+
+            self.file_data.seek(0, SEEK_END)
+            file_size = self.file_data.tell()
+        finally:
+            self.file_data.seek(start_pos)
+            (self.major, self.minor, self.file_headers) = header_state
+
+        # The scan decoded the file header of every concatenated file it passed
+        return GSFIndex(entries, file_size=file_size, header_offsets=self._file_header_offsets)
+
+    async def _grain_headers(self,
+                             local_ids: Optional[Sequence[int]] = None
+                             ) -> AsyncIterable[Tuple[int, int, bytes, int, int, int]]:
+        """Generator which reads the grain headers from the current position to the end of the file, seeking over the
+        grain data and following concatenated files. Used for header-only scans of the file.
+
+        :param local_ids: If set, only grains with these local ids are included
+        :yields: (offset, local_id, gbhd, gbhd_base, data_offset, data_length) tuple for each grain, where gbhd is the
+                 contents of the "gbhd" block and gbhd_base is its position in the file
+        :raises GSFDecodeError: If a grain is invalid (e.g. no "gbhd" child)
+        """
+        have_concatenation = False
+
+        while True:
+            try:
+                if have_concatenation:
+                    await self._decode_file_headers(head_tag="SSBBgrsg")
+                    have_concatenation = False
+
+                async with AsyncGSFBlock(self.file_data) as grai_block:
+                    if grai_block.tag != "grai":
+                        if grai_block.tag == "SSBB":
+                            if not self._support_concatenation:
+                                break
+                            have_concatenation = True
+                        continue
+
+                    if grai_block.size == 0:
+                        # Terminator block reached
+                        if self._support_concatenation:
+                            continue
+                        break
+
+                    local_id = await grai_block.read_uint(2)
+
+                    if local_ids is not None and local_id not in local_ids:
+                        continue
+
+                    async with AsyncGSFBlock(grai_block, want_tag="gbhd", raise_on_wrong_tag=True) as gbhd_block:
+                        gbhd_buffer = await gbhd_block.read_remaining_bytes()
+                        gbhd_base = gbhd_block.block_start + 8
+
+                    data_offset = grai_block.block_start + cast(int, grai_block.size)
+                    data_length = 0
+                    if grai_block.has_child_block():
+                        async with AsyncGSFBlock(grai_block, want_tag="grdt") as grdt_block:
+                            data_offset = self.file_data.tell()
+                            data_length = grdt_block.get_remaining()
+
+                    header = (grai_block.block_start, local_id, gbhd_buffer, gbhd_base, data_offset, data_length)
+                yield header
+            except EOFError:
+                break  # We ran out of grains to read and hit EOF
+
+    async def _prefetched_grains(self, prefetch: int, **kwargs) -> AsyncIterable[Tuple[Grain, int]]:
+        """Generator which runs grains() with the given keyword arguments in a background task, up to `prefetch`
+        grains ahead of the consumer"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=prefetch)
+        end = object()
+
+        async def _producer() -> None:
+            # grains() holds the io lock only whilst it reads each block, so lazy loads aren't blocked whilst it waits
+            # for a followed file to grow
+            source = self.grains(**kwargs)
+            try:
+                async for item in source:
+                    await queue.put(item)
+                await queue.put(end)
+            except Exception as e:
+                await queue.put(e)
+            finally:
+                await cast(AsyncGenerator, source).aclose()
+
+        producer = asyncio.ensure_future(_producer())
+        try:
+            while True:
+                item = await queue.get()
+                if item is end:
+                    break
+                elif isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+            with suppress(asyncio.CancelledError):
+                await producer
+
     async def grains(self,
                      local_ids: Optional[Sequence[int]] = None,
-                     loading_mode: GrainDataLoadingMode = GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE
+                     loading_mode: GrainDataLoadingMode = GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE,
+                     prefetch: int = 0,
+                     buffer_provider: Optional[Callable[[int], bytearray]] = None,
+                     grain_types: Optional[Sequence[str]] = None,
+                     timerange: Optional[TimeRange] = None,
+                     key_frames_only: bool = False,
+                     event_topics: Optional[Sequence[str]] = None,
+                     follow: bool = False,
+                     follow_timeout: Optional[float] = None
                      ) -> AsyncIterable[Tuple[Grain, int]]:
         """Generator to get grains from the GSF file. Skips blocks which aren't "grai".
 
@@ -1118,8 +2010,27 @@ class GSFAsyncDecoderSession(BaseGSFDecoderSession):
                              by awaiting the grain object itself. as long as you are still inside this context manager.
                              When the context manager exits all grains are either implicitly loaded or rendered
                              permanently empty.
+        :param prefetch: If greater than 0, read and decode up to this many grains ahead of the consumer in a
+                         background task, so that reading the file overlaps with processing the grains. In this case
+                         the file_data will usually be positioned ahead of the last grain yielded
+        :param buffer_provider: If set, a callable taking a size and returning a bytearray of that size (such as a
+                                GrainBufferPool), used for the data of grains which are loaded immediately. The data
+                                is read into the bytearray rather than into a newly allocated bytes object
+        :param grain_types: If set, only grains with these grain types (eg. "video", "coded_audio" or "event") are
+                            included
+        :param timerange: If set, only grains with origin timestamps in this time range are included
+        :param key_frames_only: If True, only coded video grains flagged as key frames are included
+        :param event_topics: If set, only event grains with these topics are included. Their payloads are read
+                             immediately, whatever the loading mode, so that the topic can be checked
+        :param follow: If True, follow a file which is still being written (eg. by a streaming GSFEncoder). On
+                       reaching the end of the input before a terminator block, wait for more data to be written and
+                       continue decoding from the last complete block (including the file header of a concatenated
+                       file). The input must be seekable
+        :param follow_timeout: If following, stop once no new data has been written for this many seconds. If None
+                               (the default) wait until a terminator block is written
         :yields: (Grain, local_id) tuple for each grain
         :raises GSFDecodeError: If grain is invalid (e.g. no "gbhd" child)
+        :raises RuntimeError: If following an input which is not seekable
         """
         async def _read_out_of_order(parent: GSFAsyncDecoderSession,
                                      key: int,
@@ -1128,100 +2039,272 @@ class GSFAsyncDecoderSession(BaseGSFDecoderSession):
                                      length: int,
                                      load_on_exit=False) -> Optional[bytes]:
             if load_on_exit or not parent._exiting:
+                grain = parent._unloaded_lazy_grains[key]
                 parent._remove_lazy_grain(key)
 
-                oldpos = file_data.tell()
-                file_data.seek(pos)
-                data = await file_data.read(length)
-                file_data.seek(oldpos)
+                if key in parent._preloaded_data:
+                    # Already read by load_grains
+                    data = parent._preloaded_data.pop(key)
+                else:
+                    async with parent._io_lock:
+                        oldpos = file_data.tell()
+                        file_data.seek(pos)
+                        data = await file_data.read(length)
+                        file_data.seek(oldpos)
+
+                # Grains loaded whilst the session exits aren't cached, since they couldn't be loaded again
+                if parent.data_cache is not None and grain.grain_type != "event" and not parent._exiting:
+                    def _evict() -> None:
+                        # Set up a new lazy loader so that awaiting the grain loads the data again
+                        parent._cached_grains.discard(id(grain))
+                        parent._add_lazy_grain(key, grain, (pos, length))
+                        grain.data = _read_out_of_order(parent, key, file_data, pos, length,
+                                                        load_on_exit=load_on_exit)
+
+                    parent._cached_grains.add(id(grain))
+                    parent.data_cache.add(id(grain), len(data), _evict)
                 return data
             else:
                 return None
 
+        if follow and not self.file_data.seekable_backwards():
+            raise RuntimeError("Cannot follow a stream that is not seekable")
+
+        if prefetch > 0:
+            async for item in self._prefetched_grains(prefetch,
+                                                      local_ids=local_ids,
+                                                      loading_mode=loading_mode,
+                                                      buffer_provider=buffer_provider,
+                                                      grain_types=grain_types,
+                                                      timerange=timerange,
+                                                      key_frames_only=key_frames_only,
+                                                      event_topics=event_topics,
+                                                      follow=follow,
+                                                      follow_timeout=follow_timeout):
+                yield item
+            return
+
+        filtered = (grain_types is not None or timerange is not None or key_frames_only or event_topics is not None)
         have_concatenation = False
+        file_length = 0
+        waiting_since: Optional[float] = None
+        delay = _FOLLOW_MIN_DELAY
 
+        pos = self.file_data.tell()
         while True:
             try:
-                if have_concatenation:
-                    await self._decode_file_headers(head_tag="SSBBgrsg")
-                    have_concatenation = False
+                # The lock is held whilst each block is read, but not whilst waiting for a followed file to grow or
+                # whilst the grain is yielded, so that lazy loads (eg. whilst prefetching) can run in between
+                async with self._io_lock:
+                    pos = self.file_data.tell()
+                    if have_concatenation:
+                        await self._decode_file_headers(head_tag="SSBBgrsg", allow_partial=follow)
+                        have_concatenation = False
+
+                    async with AsyncGSFBlock(self.file_data) as block:
+                        if follow:
+                            block_end = pos + max(8, cast(int, block.size))
+                            if block_end > file_length:
+                                header_end = self.file_data.tell()
+                                self.file_data.seek(0, SEEK_END)
+                                file_length = self.file_data.tell()
+                                self.file_data.seek(header_end)
+                            if block_end > file_length:
+                                # The rest of the block hasn't been written yet
+                                raise EOFError
+                            waiting_since = None
+                            delay = _FOLLOW_MIN_DELAY
+
+                        if block.tag != "grai":
+                            if block.tag == "SSBB":
+                                if not self._support_concatenation:
+                                    break
+                                have_concatenation = True
+                            continue
 
-                async with AsyncGSFBlock(self.file_data) as block:
-                    if block.tag != "grai":
-                        if block.tag == "SSBB":
-                            if not self._support_concatenation:
-                                break
-                            have_concatenation = True
-                        continue
+                        grai_block = block
+                        if grai_block.size == 0:
+                            # Terminator block reached
+                            if self._support_concatenation and not follow:
+                                continue
+                            break
 
-                    grai_block = block
-                    if grai_block.size == 0:
-                        # Terminator block reached
-                        if self._support_concatenation:
+                        local_id = await grai_block.read_uint(2)
+
+                        if local_ids is not None and local_id not in local_ids:
                             continue
-                        break
 
-                    local_id = await grai_block.read_uint(2)
+                        async with AsyncGSFBlock(grai_block, want_tag="gbhd", raise_on_wrong_tag=True) as gbhd_block:
+                            gbhd_buffer = await gbhd_block.read_remaining_bytes()
+                            gbhd_base = gbhd_block.block_start + 8
+
+                        # Filters are checked on the raw header so that excluded grains are never decoded or loaded
+                        unpacked: Optional[_UnpackedGBHD] = None
+                        if filtered:
+                            unpacked = self._match_grain_header(gbhd_buffer, gbhd_base, grain_types, timerange,
+                                                                key_frames_only, event_topics)
+                            if unpacked is None:
+                                continue
+
+                        data: Optional[Union[bytes, Awaitable[Optional[bytes]]]] = None
+
+                        data_offset = 0
+                        data_length = 0
+                        if grai_block.has_child_block():
+                            async with AsyncGSFBlock(grai_block, want_tag="grdt") as grdt_block:
+                                if grdt_block.get_remaining() > 0:
+                                    mapped_data: Optional[memoryview] = None
+                                    if (event_topics is None and self.file_data.seekable_backwards() and
+                                            loading_mode == GrainDataLoadingMode.MEMORY_MAP_IF_POSSIBLE and
+                                            hasattr(self.file_data, "getsync")):
+                                        mapped_data = self._mapped_data(
+                                            cast(OpenAsyncFileWrapper, self.file_data).getsync(),
+                                            self.file_data.tell(),
+                                            grdt_block.get_remaining())
+
+                                    if event_topics is not None:
+                                        data = await self.file_data.read(grdt_block.get_remaining())
+                                    elif mapped_data is not None:
+                                        data = cast(bytes, mapped_data)
+                                    elif self.file_data.seekable_backwards() and loading_mode in [
+                                     GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE,
+                                     GrainDataLoadingMode.ALWAYS_LOAD_DEFER_IF_POSSIBLE,
+                                     GrainDataLoadingMode.MEMORY_MAP_IF_POSSIBLE]:
+                                        if not self._sync_compatibility_mode:
+                                            # It is correct that this is not awaited here
+                                            # It will be awaited when the data is actually needed.
+                                            load_on_exit = (
+                                                loading_mode == GrainDataLoadingMode.ALWAYS_LOAD_DEFER_IF_POSSIBLE)
+                                            data = _read_out_of_order(self,
+                                                                      self._next_lazy_grain_number,
+                                                                      self.file_data,
+                                                                      self.file_data.tell(),
+                                                                      grdt_block.get_remaining(),
+                                                                      load_on_exit=load_on_exit)
+                                            data_offset = self.file_data.tell()
+                                            data_length = grdt_block.get_remaining()
+                                        else:
+                                            # This is compatibility mode with the old code
+                                            data = IOBytes(cast(OpenAsyncFileWrapper, self.file_data).getsync(),
+                                                           self.file_data.tell(),
+                                                           grdt_block.get_remaining(),
+                                                           cache=self.data_cache)
+                                    elif loading_mode == GrainDataLoadingMode.LOAD_NEVER:
+                                        if self.file_data.seekable_forwards():
+                                            self.file_data.seek(grdt_block.get_remaining(), SEEK_CUR)
+                                        else:
+                                            await self.file_data.read(grdt_block.get_remaining())
+                                    elif buffer_provider is not None:
+                                        buffer = buffer_provider(grdt_block.get_remaining())
+                                        await _async_readinto_exactly(self.file_data, buffer)
+                                        data = cast(bytes, buffer)
+                                    else:
+                                        data = await self.file_data.read(grdt_block.get_remaining())
 
-                    if local_ids is not None and local_id not in local_ids:
+                    if event_topics is not None and (data is None or
+                                                     _event_topic(cast(bytes, data)) not in event_topics):
                         continue
 
-                    async with AsyncGSFBlock(grai_block, want_tag="gbhd", raise_on_wrong_tag=True) as gbhd_block:
-                        meta = self._sync_decode_gbhd(await gbhd_block.read_remaining_block())
+                    grain = self.Grain(self._decode_gbhd(gbhd_buffer, gbhd_base, unpacked), data)
 
-                    data: Optional[Union[bytes, Awaitable[Optional[bytes]]]] = None
+                    if isawaitable(data):
+                        grain.length = data_length
+                        self._add_lazy_grain(self._next_lazy_grain_number, grain, (data_offset, data_length))
+                        self._next_lazy_grain_number += 1
 
-                    data_length = 0
-                    if grai_block.has_child_block():
-                        async with AsyncGSFBlock(grai_block, want_tag="grdt") as grdt_block:
-                            if grdt_block.get_remaining() > 0:
-                                if self.file_data.seekable_backwards() and loading_mode in [
-                                 GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE,
-                                 GrainDataLoadingMode.ALWAYS_LOAD_DEFER_IF_POSSIBLE]:
-                                    if not self._sync_compatibility_mode:
-                                        # It is correct that this is not awaited here
-                                        # It will be awaited when the data is actually needed.
-                                        load_on_exit = (
-                                            loading_mode == GrainDataLoadingMode.ALWAYS_LOAD_DEFER_IF_POSSIBLE)
-                                        data = _read_out_of_order(self,
-                                                                  self._next_lazy_grain_number,
-                                                                  self.file_data,
-                                                                  self.file_data.tell(),
-                                                                  grdt_block.get_remaining(),
-                                                                  load_on_exit=load_on_exit)
-                                        data_length = grdt_block.get_remaining()
-                                    else:
-                                        # This is compatibility mode with the old code
-                                        data = IOBytes(cast(OpenAsyncFileWrapper, self.file_data).getsync(),
-                                                       self.file_data.tell(),
-                                                       grdt_block.get_remaining())
-                                elif loading_mode == GrainDataLoadingMode.LOAD_NEVER:
-                                    if self.file_data.seekable_forwards():
-                                        self.file_data.seek(grdt_block.get_remaining(), SEEK_CUR)
-                                    else:
-                                        await self.file_data.read(grdt_block.get_remaining())
-                                else:
-                                    data = await self.file_data.read(grdt_block.get_remaining())
+                yield (grain, local_id)
+            except EOFError:
+                if not follow:
+                    return  # We ran out of grains to read and hit EOF
+
+                # Wait for the writer to add more data, then try this block again
+                async with self._io_lock:
+                    self.file_data.seek(pos)
+                now = time.monotonic()
+                if waiting_since is None:
+                    waiting_since = now
+                if follow_timeout is not None and now - waiting_since >= follow_timeout:
+                    return
+                await asyncio.sleep(delay)
+                delay = min(2*delay, _FOLLOW_MAX_DELAY)
+
+    async def seek(self, timestamp: Timestamp, local_id: Optional[int] = None) -> Optional["GSFIndexEntry"]:
+        """Position the session so that the next call to grains() starts from the earliest grain in the file from
+        which every grain with an origin timestamp at or after the given timestamp will be reached. Grains with
+        earlier timestamps may still be yielded if the file is not in timestamp order.
+
+        Uses the index in the `index` property. If it is None then the index stored at the end of the file is read,
+        or if there isn't one an index is built by scanning the grain headers.
+
+        :param timestamp: The timestamp to seek to
+        :param local_id: If set, only consider grains with this local id
+        :returns: The GSFIndexEntry of the grain seeked to, or None if there are no grains at or after the timestamp
+                  (in which case the session is positioned at the end of the file)
+        :raises RuntimeError: If the input is not seekable
+        """
+        if self.index is None:
+            self.index = await self.read_index()
+        if self.index is None:
+            self.index = await self.build_index()
+
+        entry = self.index.find(timestamp, local_id=local_id)
+        if entry is None:
+            self.file_data.seek(self.index.file_size)
+        else:
+            await self._seek_to_grain(entry.offset)
+        return entry
 
-                grain = self.Grain(meta, data)
+    async def grains_in_range(self,
+                              timerange: TimeRange,
+                              local_ids: Optional[Sequence[int]] = None,
+                              loading_mode: GrainDataLoadingMode = GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE
+                              ) -> AsyncIterable[Tuple[Grain, int]]:
+        """Generator to get the grains with origin timestamps in a time range. Only the region of the file which
+        contains those grains is decoded.
 
-                if isawaitable(data):
-                    grain.length = data_length
-                    self._add_lazy_grain(self._next_lazy_grain_number, grain)
-                    self._next_lazy_grain_number += 1
+        Uses the index in the `index` property. If it is None then the index stored at the end of the file is read,
+        or if there isn't one an index is built by scanning the grain headers.
 
-                yield (grain, local_id)
-            except EOFError:
-                return  # We ran out of grains to read and hit EOF
+        :param timerange: The range of origin timestamps to include
+        :param local_ids: A list of local-ids to include in the output. If None (the default) then all local-ids will
+                          be included
+        :param loading_mode: The mode to use when loading grain data elements, as for grains()
+        :yields: (Grain, local_id) tuple for each grain
+        :raises RuntimeError: If the input is not seekable
+        """
+        if self.index is None:
+            self.index = await self.read_index()
+        if self.index is None:
+            self.index = await self.build_index()
+
+        span = self.index.span(timerange, local_ids=local_ids)
+        if span is None:
+            return
+
+        (first, last) = span
+        remaining = self.index.count(timerange, local_ids=local_ids)
+        await self._seek_to_grain(first)
+
+        # Stop after the last grain in the range, without reading on through any grains which are filtered out
+        async for (grain, local_id) in self.grains(local_ids=local_ids, loading_mode=loading_mode, timerange=timerange):
+            yield (grain, local_id)
+
+            remaining -= 1
+            if remaining == 0 or self.file_data.tell() > last:
+                break
 
 
 class GSFSyncDecoderSession(BaseGSFDecoderSession):
     def __init__(self,
                  parse_grain: ParseGrainType,
                  file_data: IO[bytes],
-                 support_concatenation: bool = True):
+                 support_concatenation: bool = True,
+                 data_cache: Optional[GrainDataCache] = None,
+                 skip_metadata: GrainMetadataParts = GrainMetadataParts.NONE):
         super().__init__()
         self.file_data = file_data
+        self.data_cache = data_cache
+        self.skip_metadata = skip_metadata
 
         self.Grain = parse_grain
         self.file_headers: Optional[GSFFileHeaderDict] = None
@@ -1230,6 +2313,14 @@ class GSFSyncDecoderSession(BaseGSFDecoderSession):
 
         self._exiting = False
 
+        self._grains_start: Optional[int] = None
+        self._file_header_offsets: List[int] = []
+        self._header_walk_pos: Optional[int] = None
+        self._found_all_file_headers = False
+
+        # May be set to an existing index (eg. loaded from a sidecar file), otherwise built when first needed
+        self.index: Optional[GSFIndex] = None
+
     def _decode_ssb_header(self, head_tag=""):
         """Find and read the SSB header in the GSF file
 
@@ -1249,13 +2340,17 @@ class GSFSyncDecoderSession(BaseGSFDecoderSession):
 
         return (major, minor)
 
-    def _decode_file_headers(self, head_tag="") -> None:
+    def _decode_file_headers(self, head_tag="", allow_partial: bool = False) -> None:
         """Verify the file is a supported version, get the file header and store it in the file_headers property
 
+        :param allow_partial: If True, raise EOFError rather than GSFDecodeError if the file ends in the middle of the
+                              "head" block, so that a file which is still being written can be read again later
         :raises GSFDecodeBadVersionError: If the file version is not supported
         :raises GSFDecodeBadFileTypeError: If this isn't a GSF file
         :raises GSFDecodeError: If the file doesn't have a "head" block
+        :raises EOFError: If the file ends in the middle of the file header, or the "head" block if allow_partial is set
         """
+        header_offset = self.file_data.tell() - len(head_tag)
         (self.major, self.minor) = self._decode_ssb_header(head_tag=head_tag)
         if self.major not in [7, 8, 9]:
             raise GSFDecodeBadVersionError(f"Unknown Version {self.major}.{self.minor}", 0, self.major, self.minor)
@@ -1264,11 +2359,261 @@ class GSFSyncDecoderSession(BaseGSFDecoderSession):
             with SyncGSFBlock(self.file_data, want_tag="head") as head_block:
                 self.file_headers = self._sync_decode_head(head_block.read_remaining_block())
         except EOFError:
+            if allow_partial:
+                raise
             raise GSFDecodeError("No head block found in file", self.file_data.tell())
 
+        if self._grains_start is None:
+            self._grains_start = self.file_data.tell()
+        if header_offset not in self._file_header_offsets:
+            insort(self._file_header_offsets, header_offset)
+
+    def _follow_file_headers(self, follow_timeout: Optional[float] = None) -> None:
+        """Decode the file header of a file which is still being written, waiting for the rest of it to be written if
+        the file ends part of the way through it, in the same way as grains() waits for grains when following
+
+        :param follow_timeout: Stop waiting once no new data has been written for this many seconds. If None (the
+                               default) wait until the file header has been written
+        :raises RuntimeError: If the input is not seekable
+        :raises GSFDecodeError: If the file header still hasn't been written when the timeout expires
+        """
+        if not self.file_data.seekable():
+            raise RuntimeError("Cannot follow a stream that is not seekable")
+
+        waiting_since: Optional[float] = None
+        delay = _FOLLOW_MIN_DELAY
+        pos = self.file_data.tell()
+        while True:
+            try:
+                self._decode_file_headers(allow_partial=True)
+                return
+            except EOFError:
+                self.file_data.seek(pos)
+                now = time.monotonic()
+                if waiting_since is None:
+                    waiting_since = now
+                if follow_timeout is not None and now - waiting_since >= follow_timeout:
+                    raise GSFDecodeError("No head block found in file", pos)
+                time.sleep(delay)
+                delay = min(2*delay, _FOLLOW_MAX_DELAY)
+
+    def read_index(self) -> Optional["GSFIndex"]:
+        """Read the index stored in the "gidx" block at the end of the file by a GSFEncoder constructed with
+        `index=True`. The file position is restored afterwards.
+
+        :returns: A GSFIndex, or None if the file doesn't end with a "gidx" block which describes the whole file
+        :raises RuntimeError: If the input is not seekable
+        """
+        if not self.file_data.seekable():
+            raise RuntimeError("Cannot read the index of a stream that is not seekable")
+
+        return GSFIndex.load_from_gsf(self.file_data)
+
+    def _find_file_headers(self, end: Optional[int] = None) -> None:
+        """Find the file headers of the concatenated files in the input which start before `end` (or all of them if
+        it is None). They are taken from the index if it records them, and otherwise found by walking over the top
+        level blocks after the first file header, carrying on from where any earlier walk stopped. The file position
+        is restored afterwards."""
+        if self.index is not None and self.index.header_offsets is not None:
+            for header_offset in self.index.header_offsets:
+                if header_offset not in self._file_header_offsets:
+                    insort(self._file_header_offsets, header_offset)
+            return
+
+        if self._found_all_file_headers:
+            return
+        if self._header_walk_pos is None:
+            self._header_walk_pos = cast(int, self._grains_start)
+
+        pos = self.file_data.tell()
+        try:
+            self.file_data.seek(self._header_walk_pos)
+            while end is None or self._header_walk_pos < end:
+                block_start = self._header_walk_pos
+                header = self.file_data.read(8)
+                if len(header) < 8:
+                    self._found_all_file_headers = True
+                    break
+                if header == b"SSBBgrsg":
+                    if block_start not in self._file_header_offsets:
+                        insort(self._file_header_offsets, block_start)
+                    self._header_walk_pos = block_start + 12  # The rest of the file header is the version
+                else:
+                    self._header_walk_pos = block_start + max(8, int.from_bytes(header[4:], 'little'))
+                self.file_data.seek(self._header_walk_pos)
+        finally:
+            self.file_data.seek(pos)
+
+    def _seek_to_grain(self, offset: int) -> None:
+        """Position the session at the "grai" block at `offset`. If the input is made of concatenated files the file
+        header of the one which contains the block is decoded first, so that its grains are decoded with the right
+        version and segments."""
+        if self._support_concatenation:
+            self._find_file_headers(end=offset)
+            if len(self._file_header_offsets) > 1:
+                self.file_data.seek(self._file_header_offsets[bisect_right(self._file_header_offsets, offset) - 1])
+                self._decode_file_headers()
+        self.file_data.seek(offset)
+
+    def build_index(self) -> "GSFIndex":
+        """Scan the headers of every grain in the file to build an index of grain positions and timestamps
+
+        Grain data is seeked over rather than read, and the file position is restored afterwards.
+
+        :returns: A GSFIndex for the file
+        :raises RuntimeError: If the input is not seekable
+        :raises GSFDecodeError: If a grain is invalid (e.g. no "gbhd" child)
+        """
+        if not self.file_data.seekable():
+            raise RuntimeError("Cannot index a stream that is not seekable")
+
+        start_pos = self.file_data.tell()
+        header_state = (self.major, self.minor, self.file_headers)
+        entries: List[GSFIndexEntry] = []
+
+        try:
+            self.file_data.seek(cast(int, self._grains_start))
+
+            for (offset, local_id, gbhd_buffer, gbhd_base, data_offset, data_length) in self._grain_headers():
+                (origin_timestamp, sync_timestamp, grain_type) = self._scan_gbhd(gbhd_buffer, gbhd_base)
+                entries.append(GSFIndexEntry(offset=offset,
+                                             local_id=local_id,
+                                             grain_type=grain_type,
+                                             origin_timestamp=origin_timestamp,
+                                             sync_timestamp=sync_timestamp,
+                                             data_offset=data_offset,
+                                             data_length=data_length))
+
+            file_size = self.file_data.seek(0, SEEK_END)
+        finally:
+            self.file_data.seek(start_pos)
+            (self.major, self.minor, self.file_headers) = header_state
+
+        # The scan decoded the file header of every concatenated file it passed
+        return GSFIndex(entries, file_size=file_size, header_offsets=self._file_header_offsets)
+
+    def _grain_headers(self,
+                       local_ids: Optional[Sequence[int]] = None
+                       ) -> Iterator[Tuple[int, int, bytes, int, int, int]]:
+        """Generator which reads the grain headers from the current position to the end of the file, seeking over (or
+        reading and discarding) the grain data and following concatenated files. Used for header-only scans of the file.
+
+        :param local_ids: If set, only grains with these local ids are included
+        :yields: (offset, local_id, gbhd, gbhd_base, data_offset, data_length) tuple for each grain, where gbhd is the
+                 contents of the "gbhd" block and gbhd_base is its position in the file
+        :raises GSFDecodeError: If a grain is invalid (e.g. no "gbhd" child)
+        """
+        have_concatenation = False
+
+        while True:
+            try:
+                if have_concatenation:
+                    self._decode_file_headers(head_tag="SSBBgrsg")
+                    have_concatenation = False
+
+                with SyncGSFBlock(self.file_data) as grai_block:
+                    if grai_block.tag != "grai":
+                        if grai_block.tag == "SSBB":
+                            if not self._support_concatenation:
+                                break
+                            have_concatenation = True
+                        continue
+
+                    if grai_block.size == 0:
+                        # Terminator block reached
+                        if self._support_concatenation:
+                            continue
+                        break
+
+                    local_id = grai_block.read_uint(2)
+
+                    if local_ids is not None and local_id not in local_ids:
+                        continue
+
+                    with SyncGSFBlock(grai_block, want_tag="gbhd", raise_on_wrong_tag=True) as gbhd_block:
+                        gbhd_buffer = gbhd_block.read_remaining_bytes()
+                        gbhd_base = gbhd_block.block_start + 8
+
+                    data_offset = grai_block.block_start + cast(int, grai_block.size)
+                    data_length = 0
+                    if grai_block.has_child_block():
+                        with SyncGSFBlock(grai_block, want_tag="grdt") as grdt_block:
+                            data_offset = grdt_block.block_start + 8
+                            data_length = grdt_block.get_remaining()
+                            _skip_forward(self.file_data, data_length)
+
+                    header = (grai_block.block_start, local_id, gbhd_buffer, gbhd_base, data_offset, data_length)
+                yield header
+            except EOFError:
+                break  # We ran out of grains to read and hit EOF
+
+    def scan_headers(self, local_ids: Optional[Sequence[int]] = None) -> Dict[int, np.ndarray]:
+        """Read only the grain headers from the rest of the file into a NumPy structured array for each segment
+
+        No Grain objects or metadata dicts are created, and grain data is seeked over (or read and discarded if the
+        input is not seekable). See GSF_HEADER_DTYPE for the fields in each row.
+
+        :param local_ids: A list of local-ids to include in the output. If None (the default) then all local-ids will
+                          be included
+        :returns: A dictionary mapping local ids to structured arrays with one row per grain, in file order
+        :raises GSFDecodeError: If a grain is invalid (e.g. no "gbhd" child)
+        """
+        rows: Dict[int, List[tuple]] = {}
+
+        for (offset, local_id, gbhd_buffer, gbhd_base, data_offset, data_length) in self._grain_headers(local_ids):
+            row = self._scan_gbhd_row(gbhd_buffer, gbhd_base)
+            rows.setdefault(local_id, []).append((offset,) + row + (data_offset, data_length))
+
+        return {local_id: np.array(segment_rows, dtype=GSF_HEADER_DTYPE) for (local_id, segment_rows) in rows.items()}
+
+    def scan_segments(self, local_ids: Optional[Sequence[int]] = None) -> Dict[int, Tuple[np.ndarray, Grain]]:
+        """Read only the grain headers from the rest of the file, as for scan_headers, and also decode the first grain
+        of each segment with its data loaded, eg. to describe the flow of each segment without decoding every grain.
+
+        The first grains are decoded as they are reached, so that the grains of concatenated files are decoded with the
+        file header of the file they are in.
+
+        :param local_ids: A list of local-ids to include in the output. If None (the default) then all local-ids will
+                          be included
+        :returns: A dictionary mapping local ids to a (headers, grain) tuple, where headers is a structured array as
+                  returned by scan_headers and grain is the first grain of the segment in file order
+        :raises RuntimeError: If the input is not seekable
+        :raises GSFDecodeError: If a grain is invalid (e.g. no "gbhd" child)
+        """
+        if not self.file_data.seekable():
+            raise RuntimeError("Cannot scan the segments of a stream that is not seekable")
+
+        rows: Dict[int, List[tuple]] = {}
+        first_grains: Dict[int, Grain] = {}
+
+        for (offset, local_id, gbhd_buffer, gbhd_base, data_offset, data_length) in self._grain_headers(local_ids):
+            row = self._scan_gbhd_row(gbhd_buffer, gbhd_base)
+            rows.setdefault(local_id, []).append((offset,) + row + (data_offset, data_length))
+
+            if local_id not in first_grains:
+                data: Optional[bytes] = None
+                if data_length > 0:
+                    pos = self.file_data.tell()
+                    try:
+                        self.file_data.seek(data_offset)
+                        data = self.file_data.read(data_length)
+                    finally:
+                        self.file_data.seek(pos)
+                first_grains[local_id] = self.Grain(self._decode_gbhd(gbhd_buffer, gbhd_base), data)
+
+        return {local_id: (np.array(segment_rows, dtype=GSF_HEADER_DTYPE), first_grains[local_id])
+                for (local_id, segment_rows) in rows.items()}
+
     def grains(self,
                local_ids: Optional[Sequence[int]] = None,
-               loading_mode: GrainDataLoadingMode = GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE
+               loading_mode: GrainDataLoadingMode = GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE,
+               buffer_provider: Optional[Callable[[int], bytearray]] = None,
+               grain_types: Optional[Sequence[str]] = None,
+               timerange: Optional[TimeRange] = None,
+               key_frames_only: bool = False,
+               event_topics: Optional[Sequence[str]] = None,
+               follow: bool = False,
+               follow_timeout: Optional[float] = None
                ) -> Iterable[Tuple[Grain, int]]:
         """Generator to get grains from the GSF file. Skips blocks which aren't "grai".
 
@@ -1281,18 +2626,54 @@ class GSFSyncDecoderSession(BaseGSFDecoderSession):
                              by awaiting the grain object itself. as long as you are still inside this context manager.
                              When the context manager exits all grains are either implicitly loaded or rendered
                              permanently empty.
+        :param buffer_provider: If set, a callable taking a size and returning a bytearray of that size (such as a
+                                GrainBufferPool), used for the data of grains which are loaded immediately. The data
+                                is read into the bytearray rather than into a newly allocated bytes object
+        :param grain_types: If set, only grains with these grain types (eg. "video", "coded_audio" or "event") are
+                            included
+        :param timerange: If set, only grains with origin timestamps in this time range are included
+        :param key_frames_only: If True, only coded video grains flagged as key frames are included
+        :param event_topics: If set, only event grains with these topics are included. Their payloads are read
+                             immediately, whatever the loading mode, so that the topic can be checked
+        :param follow: If True, follow a file which is still being written (eg. by a streaming GSFEncoder). On
+                       reaching the end of the input before a terminator block, wait for more data to be written and
+                       continue decoding from the last complete block (including the file header of a concatenated
+                       file). The input must be seekable
+        :param follow_timeout: If following, stop once no new data has been written for this many seconds. If None
+                               (the default) wait until a terminator block is written
         :yields: (Grain, local_id) tuple for each grain
         :raises GSFDecodeError: If grain is invalid (e.g. no "gbhd" child)
+        :raises RuntimeError: If following an input which is not seekable
         """
+        if follow and not self.file_data.seekable():
+            raise RuntimeError("Cannot follow a stream that is not seekable")
+
+        filtered = (grain_types is not None or timerange is not None or key_frames_only or event_topics is not None)
         have_concatenation = False
+        file_length = 0
+        waiting_since: Optional[float] = None
+        delay = _FOLLOW_MIN_DELAY
 
         while True:
+            pos = self.file_data.tell()
             try:
                 if have_concatenation:
-                    self._decode_file_headers(head_tag="SSBBgrsg")
+                    self._decode_file_headers(head_tag="SSBBgrsg", allow_partial=follow)
                     have_concatenation = False
 
                 with SyncGSFBlock(self.file_data) as block:
+                    if follow:
+                        block_end = pos + max(8, cast(int, block.size))
+                        if block_end > file_length:
+                            header_end = self.file_data.tell()
+                            file_length = self.file_data.seek(0, SEEK_END)
+                            self.file_data.seek(header_end)
+                        if block_end > file_length:
+                            # The rest of the block hasn't been written yet
+                            raise EOFError
+                        waiting_since = None
+                        delay = _FOLLOW_MIN_DELAY
+
                     if block.tag != "grai":
                         if block.tag == "SSBB":
                             if not self._support_concatenation:
@@ -1303,7 +2684,7 @@ class GSFSyncDecoderSession(BaseGSFDecoderSession):
                     grai_block = block
                     if grai_block.size == 0:
                         # Terminator block reached
-                        if self._support_concatenation:
+                        if self._support_concatenation and not follow:
                             continue
                         break
 
@@ -1313,32 +2694,159 @@ class GSFSyncDecoderSession(BaseGSFDecoderSession):
                         continue
 
                     with SyncGSFBlock(grai_block, want_tag="gbhd", raise_on_wrong_tag=True) as gbhd_block:
-                        meta = self._sync_decode_gbhd(gbhd_block.read_remaining_block())
+                        gbhd_buffer = gbhd_block.read_remaining_bytes()
+                        gbhd_base = gbhd_block.block_start + 8
+
+                    # Filters are checked on the raw header so that excluded grains are never decoded or loaded
+                    unpacked: Optional[_UnpackedGBHD] = None
+                    if filtered:
+                        unpacked = self._match_grain_header(gbhd_buffer, gbhd_base, grain_types, timerange,
+                                                            key_frames_only, event_topics)
+                        if unpacked is None:
+                            continue
 
                     data: Optional[Union[bytes, Awaitable[Optional[bytes]]]] = None
 
                     if grai_block.has_child_block():
                         with SyncGSFBlock(grai_block, want_tag="grdt") as grdt_block:
                             if grdt_block.get_remaining() > 0:
-                                if self.file_data.seekable() and loading_mode in [
+                                mapped_data: Optional[memoryview] = None
+                                if (event_topics is None and self.file_data.seekable() and
+                                        loading_mode == GrainDataLoadingMode.MEMORY_MAP_IF_POSSIBLE):
+                                    mapped_data = self._mapped_data(self.file_data,
+                                                                    self.file_data.tell(),
+                                                                    grdt_block.get_remaining())
+
+                                if event_topics is not None:
+                                    data = self.file_data.read(grdt_block.get_remaining())
+                                elif mapped_data is not None:
+                                    data = cast(bytes, mapped_data)
+                                elif self.file_data.seekable() and loading_mode in [
                                  GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE,
-                                 GrainDataLoadingMode.ALWAYS_LOAD_DEFER_IF_POSSIBLE]:
+                                 GrainDataLoadingMode.ALWAYS_LOAD_DEFER_IF_POSSIBLE,
+                                 GrainDataLoadingMode.MEMORY_MAP_IF_POSSIBLE]:
                                     data = IOBytes(self.file_data,
                                                    self.file_data.tell(),
-                                                   grdt_block.get_remaining())
+                                                   grdt_block.get_remaining(),
+                                                   cache=self.data_cache)
                                 elif loading_mode == GrainDataLoadingMode.LOAD_NEVER:
-                                    if self.file_data.seekable():
-                                        self.file_data.seek(grdt_block.get_remaining(), SEEK_CUR)
-                                    else:
-                                        self.file_data.read(grdt_block.get_remaining())
+                                    _skip_forward(self.file_data, grdt_block.get_remaining())
+                                elif buffer_provider is not None:
+                                    buffer = buffer_provider(grdt_block.get_remaining())
+                                    _readinto_exactly(self.file_data, buffer)
+                                    data = cast(bytes, buffer)
                                 else:
                                     data = self.file_data.read(grdt_block.get_remaining())
 
-                grain = self.Grain(meta, data)
+                if event_topics is not None and (data is None or _event_topic(cast(bytes, data)) not in event_topics):
+                    continue
+
+                grain = self.Grain(self._decode_gbhd(gbhd_buffer, gbhd_base, unpacked), data)
+
+                yield (grain, local_id)
+            except EOFError:
+                if not follow:
+                    return  # We ran out of grains to read and hit EOF
+
+                # Wait for the writer to add more data, then try this block again
+                self.file_data.seek(pos)
+                now = time.monotonic()
+                if waiting_since is None:
+                    waiting_since = now
+                if follow_timeout is not None and now - waiting_since >= follow_timeout:
+                    return
+                time.sleep(delay)
+                delay = min(2*delay, _FOLLOW_MAX_DELAY)
+
+    def load_grains(self, grains: Iterable[Grain], max_gap: int = 1 << 16, max_read: int = 1 << 26) -> None:
+        """Load the data of several grains from this session which were decoded with deferred loading. The data of
+        grains which are close together in the file is loaded with a single larger read rather than one per grain.
+
+        :param grains: The grains to load. Grains that have already been loaded or weren't deferred are ignored
+        :param max_gap: The largest number of unwanted bytes between the data of two grains for them to be read together
+        :param max_read: The largest number of bytes to read at once, unless a single grain is larger
+        """
+        requests: List[Tuple[int, int, IOBytes]] = []
+        for grain in grains:
+            data = grain.data
+            if isinstance(data, IOBytes) and not data.loaded and data.istream is self.file_data:
+                requests.append((data.start, data.length, data))
+
+        for (start, end, members) in _coalesce_ranges(requests, max_gap, max_read):
+            oldpos = self.file_data.tell()
+            self.file_data.seek(start)
+            try:
+                buffer = memoryview(self.file_data.read(end - start))
+            finally:
+                self.file_data.seek(oldpos)
+
+            for (pos, length, iobytes) in members:
+                iobytes.fill(bytes(buffer[pos - start:pos - start + length]))
+
+    def seek(self, timestamp: Timestamp, local_id: Optional[int] = None) -> Optional["GSFIndexEntry"]:
+        """Position the session so that the next call to grains() starts from the earliest grain in the file from
+        which every grain with an origin timestamp at or after the given timestamp will be reached. Grains with
+        earlier timestamps may still be yielded if the file is not in timestamp order.
+
+        Uses the index in the `index` property. If it is None then the index stored at the end of the file is read,
+        or if there isn't one an index is built by scanning the grain headers.
+
+        :param timestamp: The timestamp to seek to
+        :param local_id: If set, only consider grains with this local id
+        :returns: The GSFIndexEntry of the grain seeked to, or None if there are no grains at or after the timestamp
+                  (in which case the session is positioned at the end of the file)
+        :raises RuntimeError: If the input is not seekable
+        """
+        if self.index is None:
+            self.index = self.read_index()
+        if self.index is None:
+            self.index = self.build_index()
+
+        entry = self.index.find(timestamp, local_id=local_id)
+        if entry is None:
+            self.file_data.seek(self.index.file_size)
+        else:
+            self._seek_to_grain(entry.offset)
+        return entry
+
+    def grains_in_range(self,
+                        timerange: TimeRange,
+                        local_ids: Optional[Sequence[int]] = None,
+                        loading_mode: GrainDataLoadingMode = GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE
+                        ) -> Iterable[Tuple[Grain, int]]:
+        """Generator to get the grains with origin timestamps in a time range. Only the region of the file which
+        contains those grains is decoded.
+
+        Uses the index in the `index` property. If it is None then the index stored at the end of the file is read,
+        or if there isn't one an index is built by scanning the grain headers.
+
+        :param timerange: The range of origin timestamps to include
+        :param local_ids: A list of local-ids to include in the output. If None (the default) then all local-ids will
+                          be included
+        :param loading_mode: The mode to use when loading grain data elements, as for grains()
+        :yields: (Grain, local_id) tuple for each grain
+        :raises RuntimeError: If the input is not seekable
+        """
+        if self.index is None:
+            self.index = self.read_index()
+        if self.index is None:
+            self.index = self.build_index()
+
+        span = self.index.span(timerange, local_ids=local_ids)
+        if span is None:
+            return
+
+        (first, last) = span
+        remaining = self.index.count(timerange, local_ids=local_ids)
+        self._seek_to_grain(first)
+
+        # Stop after the last grain in the range, without reading on through any grains which are filtered out
+        for (grain, local_id) in self.grains(local_ids=local_ids, loading_mode=loading_mode, timerange=timerange):
+            yield (grain, local_id)
 
-                yield (grain, local_id)
-            except EOFError:
-                return  # We ran out of grains to read and hit EOF
+            remaining -= 1
+            if remaining == 0 or self.file_data.tell() > last:
+                break
 
 
 class GSFDecoder(object):
@@ -1361,6 +2869,16 @@ class GSFDecoder(object):
 
         :param parse_grain: Function that takes a (metadata dict, buffer) and returns a grain representation
         :param file_data: BufferedReader (or similar) containing GSF data to decode
+        :param data_cache: (keyword only) A GrainDataCache limiting how much deferred grain data is kept loaded.
+                           Evicted data is loaded again when next needed (for async sessions, by awaiting the grain).
+                           When an async session exits its grains are removed from the cache, keeping their data
+        :param skip_metadata: (keyword only) GrainMetadataParts which won't be decoded, for callers which don't need
+                              them
+        :param follow: (keyword only) If True, the file is still being written (eg. by a streaming GSFEncoder), so on
+                       entering the context manager wait for the file header to be written if it isn't complete yet.
+                       Pass follow=True to grains() as well to follow the grains
+        :param follow_timeout: (keyword only) If following, raise GSFDecodeError if no more of an incomplete file header
+                               has been written for this many seconds. If None (the default) wait indefinitely
         """
         self._file_data: Optional[Union[RawIOBase, BufferedIOBase]]
         self._afile_data: Optional[AsyncBinaryIO]
@@ -1394,6 +2912,10 @@ class GSFDecoder(object):
 
         self._sync_compatibility_mode: bool = False
         self._support_concatenation = kwargs.get("support_concatenation", True)
+        self._data_cache: Optional[GrainDataCache] = kwargs.get("data_cache")
+        self._skip_metadata: GrainMetadataParts = kwargs.get("skip_metadata", GrainMetadataParts.NONE)
+        self._follow: bool = kwargs.get("follow", False)
+        self._follow_timeout: Optional[float] = kwargs.get("follow_timeout")
 
     def __enter__(self) -> GSFSyncDecoderSession:
         if self._file_data is None:
@@ -1401,12 +2923,18 @@ class GSFDecoder(object):
 
         self._open_session = GSFSyncDecoderSession(file_data=cast(IO[bytes], self._file_data),
                                                    parse_grain=self.Grain,
-                                                   support_concatenation=self._support_concatenation)
-        self._open_session._decode_file_headers()
+                                                   support_concatenation=self._support_concatenation,
+                                                   data_cache=self._data_cache,
+                                                   skip_metadata=self._skip_metadata)
+        if self._follow:
+            self._open_session._follow_file_headers(self._follow_timeout)
+        else:
+            self._open_session._decode_file_headers()
         return self._open_session
 
     def __exit__(self, *args, **kwargs):
         if self._open_session is not None:
+            self._open_session._release_memory_map()
             self._open_session = None
 
     async def __aenter__(self) -> GSFAsyncDecoderSession:
@@ -1420,13 +2948,19 @@ class GSFDecoder(object):
         self._open_asession = GSFAsyncDecoderSession(file_data=self._open_afile,
                                                      parse_grain=self.Grain,
                                                      sync_compatibility_mode=self._sync_compatibility_mode,
-                                                     support_concatenation=self._support_concatenation)
-        await self._open_asession._decode_file_headers()
+                                                     support_concatenation=self._support_concatenation,
+                                                     data_cache=self._data_cache,
+                                                     skip_metadata=self._skip_metadata)
+        if self._follow:
+            await self._open_asession._follow_file_headers(self._follow_timeout)
+        else:
+            await self._open_asession._decode_file_headers()
         return self._open_asession
 
     async def __aexit__(self, *args, **kwargs):
         if self._open_asession is not None:
             await self._open_asession._kill_unused_lazy_loaders()
+            self._open_asession._release_memory_map()
             self._open_asession = None
 
         if self._open_afile is not None and self._afile_data is not None:
@@ -1511,6 +3045,519 @@ class GSFDecoder(object):
         return self._synchronously_decode()
 
 
+class GSFIndexEntry(NamedTuple):
+    """The position and key metadata of a single grain in a GSF file
+
+    offset           -- The byte offset of the "grai" block in the file
+    local_id         -- The local id of the segment the grain belongs to
+    grain_type       -- The grain type as a string (eg. "video")
+    origin_timestamp -- The origin timestamp of the grain
+    sync_timestamp   -- The sync timestamp of the grain
+    data_offset      -- The byte offset of the grain data in the file
+    data_length      -- The length of the grain data in bytes
+    """
+    offset: int
+    local_id: int
+    grain_type: str
+    origin_timestamp: Timestamp
+    sync_timestamp: Timestamp
+    data_offset: int
+    data_length: int
+
+
+class GSFIndex(object):
+    """An index of the positions and timestamps of all the grains in a GSF file.
+
+    An index can be built by a header-only scan of the file (see `GSFSyncDecoderSession.build_index`) and can be
+    stored in a sidecar file next to the GSF file so that it doesn't need to be rebuilt each time the file is opened.
+    A GSFEncoder constructed with `index=True` instead writes the index into the file itself, as a "gidx" block just
+    before the terminator block, which can be found by reading the last few bytes of the file. Decoders which don't
+    know about "gidx" blocks skip over it.
+
+    Entries are held in file order. The sidecar format stores timestamps as 64-bit nanosecond counts, and since
+    version 1.2 it is followed by the offsets of the file headers. A "gidx" block holds the sidecar format followed by
+    a copy of the block size, so that it can be located from the end of the file.
+
+    properties:
+
+    entries
+        A tuple of GSFIndexEntry objects, one for each grain in the file, in file order
+
+    file_size
+        The size of the file when it was indexed, used to detect stale sidecar files
+
+    file_mtime
+        The modification time of the file in nanoseconds when it was indexed, or 0 if it isn't known. Used along with
+        the size to detect stale sidecar files
+
+    header_offsets
+        A tuple of the byte offsets of the file headers in the file (more than one if it is made of concatenated
+        files), or None if they weren't recorded when the index was written
+
+    local_ids
+        A sorted tuple of the segment local ids which have grains in the file
+    """
+    SIDECAR_SUFFIX = ".idx"
+
+    _FILE_TAG = b"SSBBgidx"
+    _HEADER = struct.Struct("<8sHHQQ")
+    _MTIME = struct.Struct("<q")
+    _ENTRY = struct.Struct("<QHBqqQQ")
+    _COUNT = struct.Struct("<Q")
+    _GRAIN_TYPES = GSF_GRAIN_TYPES
+
+    _BLOCK_TAG = b"gidx"
+    _TERMINATOR = b"grai\x00\x00\x00\x00"
+    _TRAILER = struct.Struct("<I8s")
+
+    def __init__(self,
+                 entries: Iterable[GSFIndexEntry] = (),
+                 file_size: int = 0,
+                 file_mtime: int = 0,
+                 header_offsets: Optional[Iterable[int]] = None):
+        self._entries = tuple(entries)
+        self.file_size = file_size
+        self.file_mtime = file_mtime
+        self.header_offsets = tuple(header_offsets) if header_offsets is not None else None
+
+        # Lazily built timestamp lookup tables, keyed by local id (None for all grains)
+        self._lookups: Dict[Optional[int], Tuple[List[int], List[int], List[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, n: int) -> GSFIndexEntry:
+        return self._entries[n]
+
+    @property
+    def entries(self) -> Tuple[GSFIndexEntry, ...]:
+        return self._entries
+
+    @property
+    def local_ids(self) -> Tuple[int, ...]:
+        return tuple(sorted(set(entry.local_id for entry in self._entries)))
+
+    def entries_for_local_id(self, local_id: int) -> List[GSFIndexEntry]:
+        """Get the entries for grains with a particular local id, in file order"""
+        return [entry for entry in self._entries if entry.local_id == local_id]
+
+    def _lookup(self, local_id: Optional[int]) -> Tuple[List[int], List[int], List[int]]:
+        """Get (or build) a lookup table for grains with a local id (or all grains if local_id is None)
+
+        :returns: A tuple of three lists: the origin timestamps in nanoseconds in ascending order, the index into
+                  self.entries of the grain with each of those timestamps, and for each position the lowest index
+                  into self.entries of any grain at or after that position.
+        """
+        if local_id not in self._lookups:
+            indices = [n for (n, entry) in enumerate(self._entries) if local_id is None or entry.local_id == local_id]
+            indices.sort(key=lambda n: self._entries[n].origin_timestamp)
+
+            timestamps = [self._entries[n].origin_timestamp.to_nanosec() for n in indices]
+
+            # Grains are not necessarily stored in timestamp order, so keep the earliest grain in the file from here on
+            earliest = list(indices)
+            for i in range(len(indices) - 2, -1, -1):
+                earliest[i] = min(earliest[i], earliest[i + 1])
+
+            self._lookups[local_id] = (timestamps, indices, earliest)
+
+        return self._lookups[local_id]
+
+    def find(self, timestamp: Timestamp, local_id: Optional[int] = None) -> Optional["GSFIndexEntry"]:
+        """Find the earliest grain in the file from which decoding will reach every grain with an origin timestamp at
+        or after the given timestamp
+
+        :param timestamp: The timestamp to look for
+        :param local_id: If set, only consider grains with this local id
+        :returns: A GSFIndexEntry, or None if there are no grains at or after the timestamp
+        """
+        (timestamps, _, earliest) = self._lookup(local_id)
+        n = bisect_left(timestamps, timestamp.to_nanosec())
+        if n == len(timestamps):
+            return None
+        return self._entries[earliest[n]]
+
+    def span(self, timerange: TimeRange, local_ids: Optional[Sequence[int]] = None) -> Optional[Tuple[int, int]]:
+        """Find the region of the file which must be decoded to get every grain with an origin timestamp in a range
+
+        :param timerange: The time range to look for
+        :param local_ids: If set, only consider grains with these local ids
+        :returns: A pair of the offsets of the first and last "grai" blocks with origin timestamps in the range, or
+                  None if there are no such grains
+        """
+        keys: Sequence[Optional[int]] = [None] if local_ids is None else local_ids
+        spans = [span for span in (self._span(timerange, key) for key in keys) if span is not None]
+        if len(spans) == 0:
+            return None
+
+        return (min(span[0] for span in spans), max(span[1] for span in spans))
+
+    def count(self, timerange: TimeRange, local_ids: Optional[Sequence[int]] = None) -> int:
+        """Count the grains with origin timestamps in a range
+
+        :param timerange: The time range to look for
+        :param local_ids: If set, only count grains with these local ids
+        """
+        keys: Iterable[Optional[int]] = [None] if local_ids is None else set(local_ids)
+        return sum(end - start for (start, end) in (self._bounds(timerange, key) for key in keys))
+
+    def _span(self, timerange: TimeRange, local_id: Optional[int]) -> Optional[Tuple[int, int]]:
+        (_, indices, earliest) = self._lookup(local_id)
+        (start, end) = self._bounds(timerange, local_id)
+
+        if start >= end:
+            return None
+
+        return (self._entries[earliest[start]].offset, self._entries[max(indices[start:end])].offset)
+
+    def _bounds(self, timerange: TimeRange, local_id: Optional[int]) -> Tuple[int, int]:
+        """Find the positions in the lookup table for a local id of the grains with origin timestamps in a range
+
+        :returns: A (start, end) pair, so that the grains in the range are at positions start to end - 1
+        """
+        (timestamps, _, _) = self._lookup(local_id)
+
+        start = 0
+        if timerange.bounded_before():
+            start_ns = cast(Timestamp, timerange.start).to_nanosec()
+            if timerange.includes_start():
+                start = bisect_left(timestamps, start_ns)
+            else:
+                start = bisect_right(timestamps, start_ns)
+
+        end = len(timestamps)
+        if timerange.bounded_after():
+            end_ns = cast(Timestamp, timerange.end).to_nanosec()
+            if timerange.includes_end():
+                end = bisect_right(timestamps, end_ns)
+            else:
+                end = bisect_left(timestamps, end_ns)
+
+        return (start, max(start, end))
+
+    def dump(self, fp: IO[bytes]) -> None:
+        """Write this index to a file in the sidecar format"""
+        self._dump(fp, minor=2)
+
+    def _dump(self, fp: IO[bytes], minor: int) -> None:
+        """Write this index in version 1.0 of the sidecar format, in version 1.1 which adds the modification time of
+        the file, or in version 1.2 which adds the offsets of the file headers after the entries, where older readers
+        ignore them"""
+        fp.write(self._HEADER.pack(self._FILE_TAG, 1, minor, self.file_size, len(self._entries)))
+        if minor >= 1:
+            fp.write(self._MTIME.pack(self.file_mtime))
+
+        for entry in self._entries:
+            fp.write(self._ENTRY.pack(entry.offset,
+                                      entry.local_id,
+                                      self._GRAIN_TYPES.index(entry.grain_type),
+                                      entry.origin_timestamp.to_nanosec(),
+                                      entry.sync_timestamp.to_nanosec(),
+                                      entry.data_offset,
+                                      entry.data_length))
+
+        if minor >= 2:
+            header_offsets = self.header_offsets if self.header_offsets is not None else ()
+            fp.write(self._COUNT.pack(len(header_offsets)))
+            for header_offset in header_offsets:
+                fp.write(self._COUNT.pack(header_offset))
+
+    def dumps(self) -> bytes:
+        """Serialise this index into a new bytes object in the sidecar format"""
+        b = BytesIO()
+        self.dump(b)
+        return b.getvalue()
+
+    @classmethod
+    def load(cls, fp: IO[bytes]) -> "GSFIndex":
+        """Read an index from a file in the sidecar format
+
+        :raises GSFDecodeBadFileTypeError: If this isn't a GSF index file
+        :raises GSFDecodeBadVersionError: If the index file version is not supported
+        :raises GSFDecodeError: If the index file is truncated
+        """
+        header = fp.read(cls._HEADER.size)
+        if len(header) != cls._HEADER.size or header[:8] != cls._FILE_TAG:
+            raise GSFDecodeBadFileTypeError("File lacks correct header", 0, header[:8].decode("utf-8", "replace"))
+
+        (_, major, minor, file_size, count) = cls._HEADER.unpack(header)
+        if major != 1:
+            raise GSFDecodeBadVersionError(f"Unknown Version {major}.{minor}", 0, major, minor)
+
+        file_mtime = 0
+        if minor >= 1:
+            mtime = fp.read(cls._MTIME.size)
+            if len(mtime) != cls._MTIME.size:
+                raise GSFDecodeError("Index file is truncated", cls._HEADER.size + len(mtime))
+            (file_mtime,) = cls._MTIME.unpack(mtime)
+
+        data = fp.read(count * cls._ENTRY.size)
+        if len(data) != count * cls._ENTRY.size:
+            raise GSFDecodeError("Index file is truncated", fp.tell())
+
+        entries = []
+        for (offset, local_id, grain_type, origin_ns, sync_ns, data_offset, data_length) in cls._ENTRY.iter_unpack(
+                data):
+            entries.append(GSFIndexEntry(offset=offset,
+                                         local_id=local_id,
+                                         grain_type=cls._GRAIN_TYPES[grain_type],
+                                         origin_timestamp=Timestamp.from_nanosec(origin_ns),
+                                         sync_timestamp=Timestamp.from_nanosec(sync_ns),
+                                         data_offset=data_offset,
+                                         data_length=data_length))
+
+        header_offsets: Optional[List[int]] = None
+        if minor >= 2:
+            header_count = fp.read(cls._COUNT.size)
+            if len(header_count) != cls._COUNT.size:
+                raise GSFDecodeError("Index file is truncated", fp.tell())
+            (header_count,) = cls._COUNT.unpack(header_count)
+
+            data = fp.read(header_count * cls._COUNT.size)
+            if len(data) != header_count * cls._COUNT.size:
+                raise GSFDecodeError("Index file is truncated", fp.tell())
+            # An index with no file headers recorded is one which didn't know them
+            if header_count > 0:
+                header_offsets = [header_offset for (header_offset,) in cls._COUNT.iter_unpack(data)]
+
+        return cls(entries, file_size=file_size, file_mtime=file_mtime, header_offsets=header_offsets)
+
+    @classmethod
+    def loads(cls, b: bytes) -> "GSFIndex":
+        """Read an index from a bytes object in the sidecar format"""
+        return cls.load(BytesIO(b))
+
+    @classmethod
+    def block_size(cls, count: int, header_count: int = 1) -> int:
+        """The size of a "gidx" block holding an index of `count` grains in a file with `header_count` file headers"""
+        return 12 + cls._HEADER.size + cls._MTIME.size + count*cls._ENTRY.size + (1 + header_count)*cls._COUNT.size
+
+    def dumps_block(self) -> bytes:
+        """Serialise this index into a "gidx" block, to be written immediately before the terminator block of a file"""
+        size = self.block_size(len(self._entries), len(self.header_offsets) if self.header_offsets is not None else 0)
+        b = BytesIO()
+        self._dump(b, minor=2)
+        return self._BLOCK_TAG + struct.pack("<I", size) + b.getvalue() + struct.pack("<I", size)
+
+    @classmethod
+    def _trailer_block_size(cls, trailer: bytes, file_size: int) -> Optional[int]:
+        """Get the size of the "gidx" block from the last bytes of a file, or None if the file doesn't end with one"""
+        if len(trailer) != cls._TRAILER.size:
+            return None
+        (size, terminator) = cls._TRAILER.unpack(trailer)
+        # Blocks written in version 1.0 of the format are smaller than any later ones
+        if terminator != cls._TERMINATOR or size < 12 + cls._HEADER.size or size > file_size - len(terminator):
+            return None
+        return size
+
+    @classmethod
+    def _from_block(cls, block: bytes, file_size: int) -> Optional["GSFIndex"]:
+        """Read an index from a "gidx" block, or return None if it isn't one or doesn't describe the whole file"""
+        if block[:4] != cls._BLOCK_TAG:
+            return None
+        try:
+            index = cls.loads(block[8:-4])
+        except GSFDecodeError:
+            return None
+        if index.file_size != file_size:
+            return None
+        return index
+
+    @classmethod
+    def load_from_gsf(cls, fp: IO[bytes]) -> Optional["GSFIndex"]:
+        """Read the index from the "gidx" block at the end of a seekable GSF file. The file position is restored
+        afterwards.
+
+        :returns: A GSFIndex, or None if the file doesn't end with a "gidx" block which describes the whole file (as
+                  is the case if other data has been appended to the file since it was written)
+        """
+        pos = fp.tell()
+        try:
+            file_size = fp.seek(0, SEEK_END)
+            fp.seek(max(0, file_size - cls._TRAILER.size))
+            size = cls._trailer_block_size(fp.read(cls._TRAILER.size), file_size)
+            if size is None:
+                return None
+
+            fp.seek(file_size - len(cls._TERMINATOR) - size)
+            return cls._from_block(fp.read(size), file_size)
+        finally:
+            fp.seek(pos)
+
+    @classmethod
+    def build(cls, fp: IO[bytes]) -> "GSFIndex":
+        """Build an index for a seekable GSF file object by scanning its grain headers"""
+        with GSFDecoder(file_data=fp) as dec:
+            return dec.build_index()
+
+    @classmethod
+    def sidecar_path(cls, path: str) -> str:
+        """The path of the sidecar index file for a GSF file"""
+        return path + cls.SIDECAR_SUFFIX
+
+    @classmethod
+    def for_file(cls, path: str, write_sidecar: bool = True) -> "GSFIndex":
+        """Get an index for a GSF file on disk, using the sidecar index file if there is an up to date one
+
+        An index stored in the GSF file itself is used in preference to a sidecar file. A sidecar file is up to date
+        if the size and modification time of the GSF file are the same as when it was indexed.
+
+        :param path: The path to the GSF file
+        :param write_sidecar: If True and the index had to be built then store it in a sidecar file
+        :returns: A GSFIndex
+        """
+        with open(path, "rb") as fp:
+            in_file_index = cls.load_from_gsf(fp)
+        if in_file_index is not None:
+            return in_file_index
+
+        sidecar_path = cls.sidecar_path(path)
+        stat = os.stat(path)
+
+        try:
+            with open(sidecar_path, "rb") as fp:
+                index = cls.load(fp)
+            if index.file_size == stat.st_size and index.file_mtime == stat.st_mtime_ns:
+                return index
+        except (OSError, GSFDecodeError):
+            pass
+
+        with open(path, "rb") as fp:
+            index = cls.build(fp)
+        index.file_mtime = stat.st_mtime_ns
+
+        if write_sidecar:
+            with open(sidecar_path, "wb") as fp:
+                index.dump(fp)
+
+        return index
+
+
+def _read_or_build_index(dec: GSFSyncDecoderSession) -> Tuple[GSFIndex, List[int]]:
+    """Get the index of a decoder session's input, reading the one stored in the file if there is one and otherwise
+    scanning the grain headers to build it, as seek() does. The index is kept as the session's index.
+
+    :returns: (index, header_offsets) tuple, where header_offsets are the positions of the file headers of all of the
+              concatenated files in the input
+    :raises RuntimeError: If the input is not seekable
+    """
+    if dec.index is None:
+        dec.index = dec.read_index()
+    if dec.index is None:
+        dec.index = dec.build_index()
+    dec._find_file_headers()
+    return (dec.index, list(dec._file_header_offsets))
+
+
+def _decode_grain_range(path: str,
+                        header_offset: int,
+                        start: int,
+                        count: int,
+                        func: Callable[[Grain, int], T],
+                        local_ids: Optional[Sequence[int]],
+                        loading_mode: GrainDataLoadingMode,
+                        parse_grain: ParseGrainType) -> List[T]:
+    """Decode `count` grains of a GSF file starting from the "grai" block at position `start`, and apply a function
+    to each of them. Run in the worker processes used by parallel_decode.
+
+    :param header_offset: The position of the file header which applies to the first grain
+    :returns: A list of the function results, in file order
+    """
+    results: List[T] = []
+    with open(path, "rb") as fp:
+        fp.seek(header_offset)
+        with GSFDecoder(file_data=fp, parse_grain=parse_grain) as dec:
+            fp.seek(start)
+            for (grain, local_id) in dec.grains(local_ids=local_ids, loading_mode=loading_mode):
+                results.append(func(grain, local_id))
+                if len(results) == count:
+                    break
+    return results
+
+
+def parallel_decode(path: str,
+                    func: Callable[[Grain, int], T],
+                    local_ids: Optional[Sequence[int]] = None,
+                    loading_mode: GrainDataLoadingMode = GrainDataLoadingMode.LOAD_IMMEDIATELY,
+                    parse_grain: ParseGrainType = GrainFactory,
+                    executor: Optional[Executor] = None,
+                    max_workers: Optional[int] = None,
+                    chunk_size: Optional[int] = None) -> Iterator[T]:
+    """Decode a GSF file on disk in several processes, calling func(grain, local_id) on each grain in the worker
+    processes, and yield the results in the order of the grains in the file.
+
+    The index stored in the file is used to split the file into ranges of whole grains, each of which is decoded by a
+    separate task, or the grain headers are scanned first to build an index if the file doesn't have one. func,
+    parse_grain and the results must be picklable (eg. module-level functions) and the grains are only valid during
+    the call to func.
+
+    :param path: The path to the GSF file
+    :param func: The function to apply to each (grain, local_id)
+    :param local_ids: A list of local-ids to include. If None (the default) then all local-ids will be included
+    :param loading_mode: The mode used to load grain data in the workers, as for grains()
+    :param parse_grain: Function that takes a (metadata dict, buffer) and returns a grain representation
+    :param executor: An existing executor to run the tasks on. By default a ProcessPoolExecutor is created
+    :param max_workers: The number of worker processes to create if no executor is given
+    :param chunk_size: The approximate number of bytes of the file to decode in each task. By default the file is
+                       split into several tasks per worker
+    :yields: The result of func for each grain
+    """
+    with open(path, "rb") as fp:
+        with GSFDecoder(file_data=fp) as dec:
+            (index, header_offsets) = _read_or_build_index(dec)
+
+    if len(index) == 0:
+        return
+
+    workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+    if chunk_size is None:
+        chunk_size = max(1, index.file_size // (4 * workers))
+
+    # Split the file into runs of whole grains of roughly chunk_size bytes, each starting at a "grai" block
+    ranges: List[Tuple[int, int, int]] = []
+    start = index[0].offset
+    count = 0
+    for entry in index:
+        if entry.offset - start >= chunk_size:
+            if count > 0:
+                ranges.append((header_offsets[bisect_right(header_offsets, start) - 1], start, count))
+            start = entry.offset
+            count = 0
+        if local_ids is None or entry.local_id in local_ids:
+            count += 1
+    if count > 0:
+        ranges.append((header_offsets[bisect_right(header_offsets, start) - 1], start, count))
+
+    own_executor = executor is None
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    try:
+        # Keep a bounded number of tasks in flight so that results are not accumulated faster than they are consumed
+        pending: Deque[Future] = deque()
+        remaining = iter(ranges)
+        while True:
+            while len(pending) < 2 * workers:
+                r = next(remaining, None)
+                if r is None:
+                    break
+                (header_offset, start, count) = r
+                pending.append(executor.submit(_decode_grain_range, path, header_offset, start, count, func,
+                                               local_ids, loading_mode, parse_grain))
+
+            if not pending:
+                break
+
+            for result in pending.popleft().result():
+                yield result
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
 class GSFEncodeError(GSFError):
     """A generic GSF Encoder error, all other GSF Encoder exceptions inherit from it."""
     pass
@@ -1523,11 +3570,7 @@ class GSFEncodeAddToActiveDump(GSFEncodeError):
 
 
 def _encode_uint(val: int, size: int) -> bytes:
-    d = bytearray(size)
-    for i in range(0, size):
-        d[i] = (val & 0xFF)
-        val >>= 8
-    return bytes(d)
+    return (val & ((1 << (8*size)) - 1)).to_bytes(size, 'little')
 
 
 def _encode_sint(val: int, size: int) -> bytes:
@@ -1555,6 +3598,38 @@ def _encode_ts(ts: Timestamp) -> bytes:
             _encode_uint(ts.ns, 4))
 
 
+def _data_buffer(data: GrainDataType) -> Union[bytes, bytearray, memoryview]:
+    """Get a bytes-like object holding grain data which can be written out, without copying the data if possible"""
+    if isinstance(data, (bytes, bytearray)):
+        return data
+
+    try:
+        view = memoryview(cast(bytes, data))
+        if view.format != 'B' or view.ndim != 1:
+            view = view.cast('B')
+        return view
+    except (TypeError, ValueError):
+        # Not a C-contiguous buffer (eg. an IOBytes), so fall back to a copy
+        return bytes(data)
+
+
+def _coalesce_parts(parts: Iterable[Union[bytes, bytearray, memoryview]],
+                    min_size: int = 1 << 16) -> Iterator[Union[bytes, bytearray, memoryview]]:
+    """Join runs of small buffers (such as block headers) together, passing larger ones (such as grain data) through
+    uncopied, so that they can be written out with fewer calls"""
+    pending = bytearray()
+    for part in parts:
+        if len(part) >= min_size:
+            if pending:
+                yield pending
+                pending = bytearray()
+            yield part
+        else:
+            pending += part
+    if pending:
+        yield pending
+
+
 def _encode_rational(value: RationalTypes) -> bytes:
     value = Fraction(value)
     return (_encode_uint(value.numerator, 4) +
@@ -1592,7 +3667,8 @@ class OpenGSFEncoderBase(object):
                  tags: List["GSFEncoderTag"],
                  segments: Dict[int, "GSFEncoderSegment"],
                  streaming: bool,
-                 next_local: int):
+                 next_local: int,
+                 index: bool = False):
         self.major = major
         self.minor = minor
         self._tags = tags
@@ -1603,6 +3679,10 @@ class OpenGSFEncoderBase(object):
         self._next_local = next_local
         self._active_dump = False
 
+        # The number of bytes written so far in the current dump, and the index entries of the grains written
+        self._pos = 0
+        self._index_entries: Optional[List[GSFIndexEntry]] = [] if index else None
+
     @property
     def tags(self) -> Tuple["GSFEncoderTag", ...]:
         return tuple(self._tags)
@@ -1695,11 +3775,36 @@ class OpenGSFEncoderBase(object):
 
         return (data, offsets)
 
-    def _encode_all_grains(self):
-        data = b''
+    def _encode_all_grains(self) -> List[Union[bytes, bytearray, memoryview]]:
+        """Encode all of the grains added so far as a list of buffers to be written out in order"""
+        parts: List[Union[bytes, bytearray, memoryview]] = []
         for seg in self._segments.values():
-            data += seg.encode_all_grains()
-        return data
+            for grain in seg._grains:
+                parts.extend(self._encode_grain(seg, grain))
+            seg._grains = []
+        return parts
+
+    def _encode_grain(self, segment: "GSFEncoderSegment", grain: Grain) -> List[Union[bytes, bytearray, memoryview]]:
+        """Encode a grain to be written at the current position in the dump, adding it to the index if there is one"""
+        parts = segment._encode_grain(grain)
+        if self._index_entries is not None:
+            self._index_entries.append(GSFIndexEntry(offset=self._pos,
+                                                     local_id=segment.local_id,
+                                                     grain_type=grain.grain_type,
+                                                     origin_timestamp=grain.origin_timestamp,
+                                                     sync_timestamp=grain.sync_timestamp,
+                                                     data_offset=self._pos + len(parts[0]),
+                                                     data_length=grain.length))
+        self._pos += sum(len(part) for part in parts)
+        return parts
+
+    def _encode_index_block(self) -> bytes:
+        """Encode the "gidx" block to be written immediately before the terminator block, if indexing is enabled"""
+        if self._index_entries is None:
+            return b""
+
+        file_size = self._pos + GSFIndex.block_size(len(self._index_entries)) + 8
+        return GSFIndex(self._index_entries, file_size=file_size, header_offsets=[0]).dumps_block()
 
 
 class OpenGSFEncoder(OpenGSFEncoderBase):
@@ -1712,8 +3817,9 @@ class OpenGSFEncoder(OpenGSFEncoderBase):
                  tags: List["GSFEncoderTag"],
                  segments: Dict[int, "GSFEncoderSegment"],
                  streaming: bool,
-                 next_local: int):
-        super().__init__(major, minor, id, created, tags, segments, streaming, next_local)
+                 next_local: int,
+                 index: bool = False):
+        super().__init__(major, minor, id, created, tags, segments, streaming, next_local, index=index)
         self.file = file
 
     def add_grain(self,
@@ -1742,7 +3848,7 @@ class OpenGSFEncoder(OpenGSFEncoderBase):
 
         if self._active_dump:
             for grain in grains:
-                self.file.write(segment.encode_grain(grain))
+                self.file.writelines(_coalesce_parts(self._encode_grain(segment, grain)))
         else:
             segment.add_grains(grains)
 
@@ -1761,10 +3867,9 @@ class OpenGSFEncoder(OpenGSFEncoderBase):
         (head_block, segment_offsets) = self._encode_head_block(all_at_once=all_at_once)
         if not all_at_once and self.file.seekable():
             self._set_segment_offsets(segment_offsets, self.file.tell() + len(file_header))
+        self._pos = len(file_header) + len(head_block)
 
-        self.file.write(file_header +
-                        head_block +
-                        self._encode_all_grains())
+        self.file.writelines(_coalesce_parts([file_header, head_block] + self._encode_all_grains()))
 
     def _end_dump(self):
         for seg in self._segments.values():
@@ -1775,7 +3880,8 @@ class OpenGSFEncoder(OpenGSFEncoderBase):
                 self.file.seek(curpos)
 
         if self._active_dump:
-            self.file.write(b"grai" +
+            self.file.write(self._encode_index_block() +
+                            b"grai" +
                             _encode_uint(0, 4))
             self._active_dump = False
 
@@ -1790,8 +3896,10 @@ class OpenAsyncGSFEncoder(OpenGSFEncoderBase):
                  tags: List["GSFEncoderTag"],
                  segments: Dict[int, "GSFEncoderSegment"],
                  streaming: bool,
-                 next_local: int):
-        super().__init__(major, minor, id, created, tags, segments, streaming, next_local)
+                 next_local: int,
+                 index: bool = False,
+                 write_queue_size: int = 0):
+        super().__init__(major, minor, id, created, tags, segments, streaming, next_local, index=index)
         self.file: Optional[AsyncBinaryIO]
         self._open_file: Optional[OpenAsyncBinaryIO]
 
@@ -1802,6 +3910,59 @@ class OpenAsyncGSFEncoder(OpenGSFEncoderBase):
             self.file = None
             self._open_file = file
 
+        self.write_queue_size = write_queue_size
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Future] = None
+        self._write_error: Optional[BaseException] = None
+        self._write_failed = False
+
+    @property
+    def pending_writes(self) -> int:
+        """The number of grains which have been added but are still waiting to be written by the write-behind task"""
+        if self._write_queue is None:
+            return 0
+        return self._write_queue.qsize()
+
+    async def _write_parts(self, parts: List[Union[bytes, bytearray, memoryview]]) -> None:
+        for part in _coalesce_parts(parts):
+            await cast(OpenAsyncBinaryIO, self._open_file).write(cast(bytes, part))
+
+    async def _write_behind(self) -> None:
+        """Task which writes out the encoded grains in the write queue until it receives None. After an error the rest
+        of the queue is discarded, so that producers waiting on a full queue are not blocked forever"""
+        queue = cast(asyncio.Queue, self._write_queue)
+        while True:
+            parts = await queue.get()
+            if parts is None:
+                break
+            if not self._write_failed:
+                try:
+                    await self._write_parts(parts)
+                except Exception as e:
+                    # Drop this task's own frame from the traceback, so that clearing the frames of the exception
+                    # after it has been raised elsewhere can't finalise this coroutine whilst it's still running
+                    self._write_failed = True
+                    self._write_error = e.with_traceback(e.__traceback__.tb_next if e.__traceback__ else None)
+
+    def _raise_write_error(self) -> None:
+        """Raise an error from the write-behind task, if there is one which hasn't been raised yet"""
+        if self._write_error is not None:
+            (e, self._write_error) = (self._write_error, None)
+            raise e
+
+    async def _flush_write_queue(self) -> None:
+        """Wait for the write-behind task to write out everything in the queue and stop
+
+        :raises: Any exception raised whilst writing which hasn't already been raised from add_grains
+        """
+        if self._writer is not None:
+            await cast(asyncio.Queue, self._write_queue).put(None)
+            await self._writer
+            self._writer = None
+            self._write_queue = None
+
+        self._raise_write_error()
+
     async def add_grain(self,
                         grain: Grain,
                         segment_id: Optional[UUID] = None,
@@ -1828,7 +3989,16 @@ class OpenAsyncGSFEncoder(OpenGSFEncoderBase):
 
         if self._open_file is not None and self._active_dump:
             for grain in grains:
-                await self._open_file.write(segment.encode_grain(grain))
+                if self._write_failed:
+                    self._raise_write_error()
+                    raise GSFEncodeError("Cannot add grains after an earlier write failed")
+
+                parts = self._encode_grain(segment, grain)
+                if self._write_queue is not None:
+                    # Waits for the write-behind task to catch up if the queue is full
+                    await self._write_queue.put(parts)
+                else:
+                    await self._write_parts(parts)
         else:
             segment.add_grains(grains)
 
@@ -1854,12 +4024,22 @@ class OpenAsyncGSFEncoder(OpenGSFEncoderBase):
 
         if not all_at_once and self._open_file.seekable():
             self._set_segment_offsets(segment_offsets, self._open_file.tell() + len(file_header))
+        self._pos = len(file_header) + len(head_block)
+
+        await self._write_parts([file_header, head_block] + self._encode_all_grains())
 
-        await self._open_file.write(file_header +
-                                    head_block +
-                                    self._encode_all_grains())
+        if not all_at_once and self.write_queue_size > 0:
+            self._write_queue = asyncio.Queue(maxsize=self.write_queue_size)
+            self._writer = asyncio.ensure_future(self._write_behind())
 
     async def _end_dump(self):
+        await self._flush_write_queue()
+
+        if self._write_failed:
+            # Some grains were never written, so don't finish the file as if it were complete
+            self._active_dump = False
+            return
+
         for seg in self._segments.values():
             if self._open_file.seekable() and seg._count_pos != -1:
                 curpos = self._open_file.tell()
@@ -1870,7 +4050,8 @@ class OpenAsyncGSFEncoder(OpenGSFEncoderBase):
                 self._open_file.seek(curpos)
 
         if self._active_dump:
-            await self._open_file.write(b"grai" +
+            await self._open_file.write(self._encode_index_block() +
+                                        b"grai" +
                                         _encode_uint(0, 4))
 
             self._active_dump = False
@@ -1911,6 +4092,17 @@ class GSFEncoder(object):
     tags     -- a tuple of tags
     segments -- a frozendict of GSFEncoderSegments
 
+    If the `index=True` parameter is passed to the constructor then an index of the positions and timestamps of all
+    the grains is written in a "gidx" block at the end of the file, so that decoders can seek without first scanning
+    the whole file (see GSFIndex.load_from_gsf).
+
+    When streaming with the asynchronous context manager, passing `write_queue_size=n` makes add_grain queue each
+    encoded grain for a background task to write, rather than waiting for it to be written. Only when n grains are
+    waiting to be written does add_grain wait for the writes to catch up. A queued grain's data is written without
+    being copied, so it must not be modified until it has been written (see the `pending_writes` property). An error
+    raised whilst writing is raised once, from a subsequent call to add_grain or on leaving the context manager, after
+    which no more grains are written and the file is left unfinished.
+
     The current version of the library is designed for compatibility with v.9.0 of the GSF format."""
     def __init__(self,
                  file: Union[IO[bytes], AsyncBinaryIO, OpenAsyncBinaryIO],
@@ -1920,12 +4112,16 @@ class GSFEncoder(object):
                  created: Optional[datetime] = None,
                  tags: Optional[Iterable[Tuple[str, str]]] = None,
                  segments: Iterable[SegmentDict] = [],
-                 streaming: bool = False):
+                 streaming: bool = False,
+                 index: bool = False,
+                 write_queue_size: int = 0):
         self.file = file
         self.major = major
         self.minor = minor
         self._tags: List["GSFEncoderTag"] = []
         self.streaming = streaming
+        self.index = index
+        self.write_queue_size = write_queue_size
         self._open_encoder: Optional[OpenGSFEncoder] = None
         self._open_async_encoder: Optional[OpenAsyncGSFEncoder] = None
         self._next_local = 1
@@ -1968,7 +4164,8 @@ class GSFEncoder(object):
                                             self._tags,
                                             self._segments,
                                             self.streaming,
-                                            self._next_local)
+                                            self._next_local,
+                                            index=self.index)
         if self.streaming:
             self._open_encoder._start_dump(all_at_once=False)
         return self._open_encoder
@@ -1994,7 +4191,9 @@ class GSFEncoder(object):
                                                        self._tags,
                                                        self._segments,
                                                        self.streaming,
-                                                       self._next_local)
+                                                       self._next_local,
+                                                       index=self.index,
+                                                       write_queue_size=self.write_queue_size)
         if self.streaming:
             await self._open_async_encoder._start_dump(all_at_once=False)
         return self._open_async_encoder
@@ -2104,7 +4303,8 @@ class GSFEncoder(object):
                                             self._tags,
                                             self._segments,
                                             self.streaming,
-                                            self._next_local)
+                                            self._next_local,
+                                            index=self.index)
         self._open_encoder._start_dump(all_at_once=all_at_once)
 
     @deprecated(version="2.7.0", reason="This mechanism is deprecated, use a context manager instead")
@@ -2117,6 +4317,202 @@ class GSFEncoder(object):
             self._open_encoder = None
 
 
+class GSFRollingEncoder(object):
+    """An encoder which records grains into a series of GSF files, closing each file and starting the next once it
+    reaches a maximum size or covers a maximum duration of media.
+
+    Each file is a complete streamed GSF file, with its own segment counts and terminator block, and every file has
+    the same segments (with the same ids, local ids, tags and flow metadata) so that the files can be processed
+    independently or joined back together. A new file is only started when a grain is added to it, so there are no
+    empty files.
+
+    The recommended interface is to use the encoder as a context manager, eg.:
+
+        with GSFRollingEncoder("recording-{:06d}.gsf", max_size=1 << 30, segments=[{'local_id': 1}]) as enc:
+            for grain in grains:
+                enc.add_grain(grain)
+
+    Segments must be added before the first grain, and their tags and flow metadata can be set through the
+    `segments` property. File-level metadata (major, minor, tags) and other GSFEncoder options (such as `index`)
+    apply to every file.
+
+    properties:
+
+    paths    -- The paths of the files started so far, in order
+    segments -- a frozendict of GSFEncoderSegments used as the template for the segments of each file
+    """
+    def __init__(self,
+                 path: Union[str, Callable[[int], str]],
+                 max_size: Optional[int] = None,
+                 max_duration: Optional[TimeOffset] = None,
+                 tags: Optional[Iterable[Tuple[str, str]]] = None,
+                 segments: Iterable[SegmentDict] = [],
+                 on_file_closed: Optional[Callable[[str], None]] = None,
+                 **kwargs):
+        """Constructor
+
+        :param path: A format string which gives the path of each file when formatted with its sequence number
+                     (starting from 0), or a callable which takes the sequence number and returns the path
+        :param max_size: If set, a file is closed once it is at least this many bytes long, so files may exceed it by
+                         up to one grain (plus the terminator and any index block)
+        :param max_duration: If set, a new file is started for the first grain with an origin timestamp at least this
+                             long after the earliest origin timestamp in the current file
+        :param tags: Tags to add to each file
+        :param segments: The segments of each file, as for GSFEncoder
+        :param on_file_closed: If set, called with the path of each file once it has been completely written
+        :param kwargs: Other keyword arguments are passed to the GSFEncoder for each file, except for `streaming` since
+                       every file is streamed
+        :raises TypeError: If `streaming` is passed
+        """
+        if "streaming" in kwargs:
+            raise TypeError("GSFRollingEncoder always streams each file, so does not take a streaming argument")
+
+        self.path = path
+        self.max_size = max_size
+        self.max_duration = max_duration
+        self.on_file_closed = on_file_closed
+        self.paths: List[str] = []
+        self._kwargs = kwargs
+        self._tags: List[Tuple[str, str]] = list(tags) if tags is not None else []
+        self._segments: Dict[int, GSFEncoderSegment] = {}
+        self._next_local = 1
+        self._started = False
+
+        self._file: Optional[IO[bytes]] = None
+        self._encoder: Optional[GSFEncoder] = None
+        self._open_encoder: Optional[OpenGSFEncoder] = None
+        self._start_ts: Optional[Timestamp] = None
+
+        for seg in segments:
+            try:
+                self.add_segment(**seg)
+            except (TypeError, IndexError):
+                raise GSFEncodeError("No idea how to turn {!r} into a segment".format(seg))
+
+    def __enter__(self) -> "GSFRollingEncoder":
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    @property
+    def segments(self) -> Mapping[int, "GSFEncoderSegment"]:
+        return frozendict(self._segments)
+
+    def add_segment(self, id: Optional[UUID] = None, local_id: Optional[int] = None,
+                    tags: Optional[Iterable[Tuple[str, str]]] = None) -> "GSFEncoderSegment":
+        """Add a segment to every file, if id is specified it should be a uuid, otherwise one will be generated. If
+        local_id is specified it should be an integer, otherwise the next available integer will be used. Returns the
+        newly created segment."""
+        if self._started:
+            raise GSFEncodeAddToActiveDump(
+                "Cannot add a new segment {} ({!s}) to an encoder that is currently dumping".format(local_id, id))
+
+        if local_id is None:
+            local_id = self._next_local
+        if local_id >= self._next_local:
+            self._next_local = local_id + 1
+        if local_id in self._segments:
+            raise GSFEncodeError("Segment local id {} already in use".format(local_id))
+
+        if id is None:
+            id = uuid1()
+
+        seg = GSFEncoderSegment(id, local_id, tags=tags)
+        self._segments[local_id] = seg
+        return seg
+
+    def add_grain(self,
+                  grain: Grain,
+                  segment_id: Optional[UUID] = None,
+                  segment_local_id: Optional[int] = None):
+        """Add a grain to one of the segments, starting a new file first if the current one is full. If no
+        local_segment_id is provided then a segment with id equal to segment_id will be used if one exists, or the
+        lowest numeric segment if segment_id was not provided.
+
+        If no segment matching the criteria exists and no grains have been added yet then one will be created.
+        """
+        self.add_grains((grain,), segment_id=segment_id, segment_local_id=segment_local_id)
+
+    def add_grains(self,
+                   grains: Iterable[Grain],
+                   segment_id: Optional[UUID] = None,
+                   segment_local_id: Optional[int] = None):
+        """Add several grains to one of the segments, as for add_grain"""
+        if segment_local_id is None:
+            local_ids = sorted([local_id for local_id in self._segments if
+                                segment_id is None or self._segments[local_id].id == segment_id])
+            if len(local_ids) > 0:
+                segment_local_id = local_ids[0]
+        if segment_local_id is None or segment_local_id not in self._segments:
+            if self._started:
+                raise GSFEncodeError("Cannot add a segment to a progressive dump")
+            segment_local_id = self.add_segment(id=segment_id, local_id=segment_local_id).local_id
+
+        for grain in grains:
+            if self._file_is_full(grain):
+                self._close_file()
+            if self._open_encoder is None:
+                self._open_file()
+
+            open_encoder = cast(OpenGSFEncoder, self._open_encoder)
+            open_encoder.add_grain(grain, segment_local_id=segment_local_id)
+            if self._start_ts is None or grain.origin_timestamp < self._start_ts:
+                self._start_ts = grain.origin_timestamp
+
+    def close(self) -> None:
+        """Finish writing the current file, if there is one"""
+        self._close_file()
+
+    def _file_is_full(self, grain: Grain) -> bool:
+        if self._open_encoder is None:
+            return False
+        if self.max_size is not None and self._open_encoder._pos >= self.max_size:
+            return True
+        if (self.max_duration is not None and self._start_ts is not None and
+                grain.origin_timestamp >= self._start_ts + self.max_duration):
+            return True
+        return False
+
+    def _open_file(self) -> None:
+        n = len(self.paths)
+        path = self.path(n) if callable(self.path) else self.path.format(n)
+
+        file = open(path, "wb")
+        try:
+            encoder = GSFEncoder(file, tags=self._tags, streaming=True, **self._kwargs)
+            for seg in self._segments.values():
+                file_seg = encoder.add_segment(id=seg.id, local_id=seg.local_id,
+                                               tags=[(tag.key, tag.value) for tag in seg.tags])
+                file_seg._gsf_flow = seg._gsf_flow
+            open_encoder = encoder.__enter__()
+        except BaseException:
+            file.close()
+            raise
+
+        self.paths.append(path)
+        self._started = True
+        self._file = file
+        self._encoder = encoder
+        self._open_encoder = open_encoder
+        self._start_ts = None
+
+    def _close_file(self) -> None:
+        if self._encoder is None or self._file is None:
+            return
+
+        try:
+            self._encoder.__exit__(None, None, None)
+        finally:
+            self._file.close()
+            self._encoder = None
+            self._open_encoder = None
+            self._file = None
+
+        if self.on_file_closed is not None:
+            self.on_file_closed(self.paths[-1])
+
+
 class GSFEncoderFlow(NamedTuple):
     src_id: UUID
     flow_id: UUID
@@ -2163,9 +4559,30 @@ class GSFEncoderTag(object):
         return other == (self.key, self.value)
 
 
+class _GrainHeaderTemplate(NamedTuple):
+    """The pre-encoded headers of a grain, shared by subsequent grains in the segment with the same flow-constant
+    metadata (see GSFEncoderSegment._header_template)
+
+    key    -- The flow-constant metadata the template was encoded from
+    prefix -- The "grai" block header up to the end of the "gbhd" duration, with the block sizes and timestamps still
+              to be filled in
+    suffix -- The grain type header block (eg. "vghd") followed by the "grdt" block header, with the data size still to
+              be filled in, or None if the grain type header differs from grain to grain
+    ts_pos -- The position of the origin timestamp in prefix
+    """
+    key: tuple
+    prefix: bytes
+    suffix: Optional[bytes]
+    ts_pos: int
+
+
 class GSFEncoderSegment(object):
     """A class to represent a segment within a GSF file, used for constructing them."""
 
+    # The metadata key holding the fields of the grain type header block which don't vary from grain to grain, for the
+    # grain types which have such a block
+    _TEMPLATE_TYPE_KEYS = {"video": "cog_frame", "audio": "cog_audio", "coded_audio": "cog_coded_audio"}
+
     def __init__(self,
                  id: UUID,
                  local_id: int,
@@ -2180,6 +4597,7 @@ class GSFEncoderSegment(object):
         self._gsf_flow: Optional[GSFEncoderFlow] = None
         self._grains: List[Grain] = []
         self._parent = parent
+        self._template: Optional[_GrainHeaderTemplate] = None
 
         if tags is not None:
             for tag in tags:
@@ -2252,98 +4670,140 @@ class GSFEncoderSegment(object):
         self._count_pos = pos
 
     def encode_all_grains(self) -> bytes:
-        data = b''
+        return b"".join(self._encode_all_grains())
+
+    def _encode_all_grains(self) -> List[Union[bytes, bytearray, memoryview]]:
+        """Encode all of the grains added to this segment as a list of buffers to be written out in order"""
+        parts: List[Union[bytes, bytearray, memoryview]] = []
         for grain in self._grains:
-            data += self.encode_grain(grain)
+            parts.extend(self._encode_grain(grain))
 
         self._grains = []
-        return data
+        return parts
 
     def encode_grain(self, grain: Grain) -> bytes:
-        gbhd_size = self._gbhd_size_for_grain(grain)
+        return b"".join(self._encode_grain(grain))
+
+    def _encode_grain(self, grain: Grain) -> List[Union[bytes, bytearray, memoryview]]:
+        """Encode a grain as a list of buffers to be written out in order: the block headers, followed by the grain
+        data (if any), which isn't copied if it is already held in a contiguous buffer"""
+        template = self._header_template(grain)
+
+        encode_ts_f = _encode_ts
+        if self._parent is not None and self._parent.major == 7:
+            encode_ts_f = _encode_ts_v7
+
+        tils = self._encode_tils_for_grain(grain)
+        if template.suffix is not None:
+            suffix = template.suffix
+        else:
+            suffix = self._encode_type_header_for_grain(grain) + b"grdt" + _encode_uint(0, 4)
+
+        # The "gbhd" block runs from after the local_id in the prefix to the end of the grain type header
+        gbhd_size = len(template.prefix) - 10 + len(tils) + len(suffix) - 8
+        length = grain.length
+        origin_ts = encode_ts_f(grain.origin_timestamp)
+        sync_ts = encode_ts_f(grain.sync_timestamp)
+        ts_pos = template.ts_pos
+
+        data = bytearray(template.prefix)
+        data[4:8] = _encode_uint(10 + gbhd_size + 8 + length, 4)
+        data[14:18] = _encode_uint(gbhd_size, 4)
+        data[ts_pos:ts_pos + len(origin_ts)] = origin_ts
+        data[ts_pos + len(origin_ts):ts_pos + 2*len(origin_ts)] = sync_ts
+        data += tils
+        data += suffix
+        data[-4:] = _encode_uint(8 + length, 4)
 
+        self._write_count += 1
+
+        if grain.data is not None:
+            return [data, _data_buffer(grain.data)]
+        return [data]
+
+    def _header_template(self, grain: Grain) -> _GrainHeaderTemplate:
+        """Get the header template for a grain, reusing the one for the previous grain if the flow-constant metadata
+        (ids, rate, duration and the fixed fields of the grain type header) is unchanged"""
+        meta = grain.meta['grain']
+        type_key = self._TEMPLATE_TYPE_KEYS.get(grain.grain_type)
+        key = (self._parent.major if self._parent is not None else None,
+               grain.grain_type,
+               meta.get('source_id'),
+               meta.get('flow_id'),
+               meta.get('rate'),
+               meta.get('duration'),
+               meta.get(type_key) if type_key is not None else None)
+
+        if self._template is None or self._template.key != key:
+            self._template = self._encode_header_template(grain, deepcopy(key))
+
+        return self._template
+
+    def _encode_header_template(self, grain: Grain, key: tuple) -> _GrainHeaderTemplate:
         encode_ts_f = _encode_ts
         version_7_deprecated_bytes = b""
         if self._parent is not None and self._parent.major == 7:
             encode_ts_f = _encode_ts_v7
             version_7_deprecated_bytes = b"\x00"*16
 
-        data = (
+        prefix = (
             b"grai" +
-            _encode_uint(10 + gbhd_size + 8 + grain.length, 4) +
+            _encode_uint(0, 4) +
             _encode_uint(self.local_id, 2) +
 
             b"gbhd" +
-            _encode_uint(gbhd_size, 4) +
+            _encode_uint(0, 4) +
 
             _encode_uuid(grain.source_id) +
             _encode_uuid(grain.flow_id) +
-            version_7_deprecated_bytes +
-            encode_ts_f(grain.origin_timestamp) +
-            encode_ts_f(grain.sync_timestamp) +
+            version_7_deprecated_bytes)
+        ts_pos = len(prefix)
+        prefix += (
+            2*encode_ts_f(Timestamp()) +
             _encode_rational(grain.rate) +
             _encode_rational(grain.duration))
 
-        if len(grain.timelabels) > 0:
-            data += (
-                b"tils" +
-                _encode_uint(10 + 29*len(grain.timelabels), 4) +
-
-                _encode_uint(len(grain.timelabels), 2))
+        suffix: Optional[bytes] = None
+        if grain.grain_type != "coded_video":
+            suffix = self._encode_type_header_for_grain(grain) + b"grdt" + _encode_uint(0, 4)
 
-            for label in grain.timelabels:
-                tag = (label['tag'].encode('utf-8') + (b"\x00" * 16))[:16]
-                data += (
-                    tag +
-                    _encode_uint(label['timelabel']['frames_since_midnight'], 4) +
-                    _encode_uint(label['timelabel']['frame_rate_numerator'], 4) +
-                    _encode_uint(label['timelabel']['frame_rate_denominator'], 4) +
-                    _encode_uint(1 if label['timelabel']['drop_frame'] else 0, 1))
+        return _GrainHeaderTemplate(key=key, prefix=prefix, suffix=suffix, ts_pos=ts_pos)
 
-        if grain.grain_type == "video":
-            data += self._encode_vghd_for_grain(cast(VideoGrain, grain))
-        elif grain.grain_type == "coded_video":
-            data += self._encode_cghd_for_grain(cast(CodedVideoGrain, grain))
-        elif grain.grain_type == "audio":
-            data += self._encode_aghd_for_grain(cast(AudioGrain, grain))
-        elif grain.grain_type == "coded_audio":
-            data += self._encode_cahd_for_grain(cast(CodedAudioGrain, grain))
-        elif grain.grain_type == "event":
-            data += self._encode_eghd_for_grain(cast(EventGrain, grain))
-        elif grain.grain_type != "empty":  # pragma: no cover (should be unreachable)
-            raise GSFEncodeError("Unknown grain type: {}".format(grain.grain_type))
+    def _encode_tils_for_grain(self, grain: Grain) -> bytes:
+        if len(grain.timelabels) == 0:
+            return b""
 
-        data += (
-            b"grdt" +
-            _encode_uint(8 + grain.length, 4))
+        data = (
+            b"tils" +
+            _encode_uint(10 + 29*len(grain.timelabels), 4) +
 
-        if grain.data is not None:
-            data += bytes(grain.data)
+            _encode_uint(len(grain.timelabels), 2))
 
-        self._write_count += 1
+        for label in grain.timelabels:
+            tag = (label['tag'].encode('utf-8') + (b"\x00" * 16))[:16]
+            data += (
+                tag +
+                _encode_uint(label['timelabel']['frames_since_midnight'], 4) +
+                _encode_uint(label['timelabel']['frame_rate_numerator'], 4) +
+                _encode_uint(label['timelabel']['frame_rate_denominator'], 4) +
+                _encode_uint(1 if label['timelabel']['drop_frame'] else 0, 1))
 
         return data
 
-    def _gbhd_size_for_grain(self, grain: Grain) -> int:
-        size = 78
-        if self._parent is not None and self._parent.major == 7:
-            size += 16  # deprecated bytes
-            size -= 2  # No sign byte in 2 x Timestamp
-        if len(grain.timelabels) > 0:
-            size += 10 + 29*len(grain.timelabels)
+    def _encode_type_header_for_grain(self, grain: Grain) -> bytes:
         if grain.grain_type == "video":
-            size += self._vghd_size_for_grain(cast(VideoGrain, grain))
+            return self._encode_vghd_for_grain(cast(VideoGrain, grain))
         elif grain.grain_type == "coded_video":
-            size += self._cghd_size_for_grain(cast(CodedVideoGrain, grain))
+            return self._encode_cghd_for_grain(cast(CodedVideoGrain, grain))
         elif grain.grain_type == "audio":
-            size += self._aghd_size_for_grain(cast(AudioGrain, grain))
+            return self._encode_aghd_for_grain(cast(AudioGrain, grain))
         elif grain.grain_type == "coded_audio":
-            size += self._cahd_size_for_grain(cast(CodedAudioGrain, grain))
+            return self._encode_cahd_for_grain(cast(CodedAudioGrain, grain))
         elif grain.grain_type == "event":
-            size += self._eghd_size_for_grain(cast(EventGrain, grain))
-        elif grain.grain_type != "empty":
+            return self._encode_eghd_for_grain(cast(EventGrain, grain))
+        elif grain.grain_type != "empty":  # pragma: no cover (should be unreachable)
             raise GSFEncodeError("Unknown grain type: {}".format(grain.grain_type))
-        return size
+        return b""
 
     def _vghd_size_for_grain(self, grain: VideoGrain) -> int:
         size = 44
@@ -2484,3 +4944,375 @@ class GSFEncoderSegment(object):
         else:
             for grain in grains:
                 self.add_grain(grain)
+
+
+class FileRangeCopier(object):
+    """Copies ranges of one file to the current position of another, in the kernel where possible (eg. to copy grain
+    data found with scan_headers or a GSFIndex out of a GSF file without reading it into Python).
+
+    os.copy_file_range is tried first, then os.sendfile (which also works when the output is a pipe), and finally the
+    data is read and written through a reusable buffer, which is also used for file objects which have no file
+    descriptor. Once a method has failed it is not tried again. The position of the input file is not changed by the
+    kernel methods, and the output file object is kept in step with its file descriptor.
+    """
+    _FALLBACK_ERRNOS = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF, errno.ESPIPE)
+
+    def __init__(self, src: IO[bytes], dst: IO[bytes], chunk_size: int = 1 << 20):
+        self.src = src
+        self.dst = dst
+        self._chunk_size = chunk_size
+        self._buffer: Optional[bytearray] = None
+        self._src_fd: Optional[int] = None
+        self._dst_fd: Optional[int] = None
+        self._use_copy_file_range = hasattr(os, "copy_file_range")
+        self._use_sendfile = hasattr(os, "sendfile")
+
+        try:
+            self._src_fd = src.fileno()
+            self._dst_fd = dst.fileno()
+        except (AttributeError, OSError, UnsupportedOperation):
+            self._use_copy_file_range = False
+            self._use_sendfile = False
+
+    def copy(self, offset: int, length: int) -> None:
+        """Copy `length` bytes from position `offset` of the input to the output
+
+        :raises EOFError: If the input ends before the end of the range
+        """
+        if self._use_copy_file_range or self._use_sendfile:
+            self.dst.flush()
+            try:
+                copied = self._kernel_copy(offset, length)
+            finally:
+                if self.dst.seekable():
+                    self.dst.seek(os.lseek(cast(int, self._dst_fd), 0, SEEK_CUR))
+            offset += copied
+            length -= copied
+
+        if length > 0:
+            self._buffered_copy(offset, length)
+
+    def _kernel_copy(self, offset: int, length: int) -> int:
+        src_fd = cast(int, self._src_fd)
+        dst_fd = cast(int, self._dst_fd)
+        copied = 0
+        while copied < length:
+            try:
+                if self._use_copy_file_range:
+                    n = os.copy_file_range(src_fd, dst_fd, length - copied, offset + copied)
+                elif self._use_sendfile:
+                    n = os.sendfile(dst_fd, src_fd, offset + copied, length - copied)
+                else:
+                    break
+            except OSError as e:
+                if e.errno not in self._FALLBACK_ERRNOS or copied > 0:
+                    raise
+                if self._use_copy_file_range:
+                    self._use_copy_file_range = False
+                else:
+                    self._use_sendfile = False
+                continue
+
+            if n == 0:
+                raise EOFError
+            copied += n
+        return copied
+
+    def _buffered_copy(self, offset: int, length: int) -> None:
+        if self._buffer is None:
+            self._buffer = bytearray(min(self._chunk_size, length))
+        view = memoryview(self._buffer)
+
+        self.src.seek(offset)
+        while length > 0:
+            chunk = view[:min(len(view), length)]
+            _readinto_exactly(self.src, cast(bytearray, chunk))
+            self.dst.write(chunk)
+            length -= len(chunk)
+
+
+def _remux_head_block(head: bytes, segments: Mapping[int, bytes], counts: Mapping[int, int]) -> bytes:
+    """Rewrite the contents of a "head" block, replacing its segments with the given ones and setting their local ids
+    and counts. All other blocks are copied unchanged.
+
+    :param head: The contents of the "head" block, after the block header
+    :param segments: The "segm" blocks of the new file, including their block headers, by their new local ids
+    :param counts: The number of grains in each segment of the new file
+    :returns: The new "head" block, including its block header
+    """
+    data = bytearray(head[:23])  # File id and creation time
+    for (local_id, block) in segments.items():
+        data += block[:8] + _encode_uint(local_id, 2) + block[10:26] + _encode_sint(counts.get(local_id, 0), 8)
+        data += block[34:]
+    for (tag, start, end) in _child_blocks(head, 23, len(head), "head", 0):
+        if tag != "segm":
+            data += head[start - 8:end]
+
+    return b"head" + _encode_uint(8 + len(data), 4) + bytes(data)
+
+
+def remux(input: Union[str, IO[bytes]],
+          output: Union[str, IO[bytes]],
+          local_ids: Optional[Sequence[int]] = None,
+          timerange: Optional[TimeRange] = None,
+          max_grains: Optional[int] = None) -> Dict[int, int]:
+    """Copy selected grains from a GSF file into a new GSF file without decoding them.
+
+    The "grai" blocks of the selected grains are copied byte for byte, runs of adjacent blocks at a time, using
+    os.copy_file_range or os.sendfile where the files allow it. Only the "head" block is rewritten, to remove the
+    segments which aren't selected and to set the segment counts. The grains are found with the index stored in the
+    input file if it has one, and otherwise by scanning its grain headers.
+
+    If the input is made of several concatenated files then the segments of all of their "head" blocks are written to
+    the new file, as for merge(): segments with the same id share a local id, and a segment whose local id is already
+    used by another segment is given the next unused one, in which case the local ids of its grains are rewritten as
+    they are copied. The concatenated files must all be of the same version.
+
+    :param input: The path of the GSF file to read, or a seekable binary file object
+    :param output: The path of the GSF file to write, or a binary file object (which need not be seekable)
+    :param local_ids: If set, only copy the segments with these local ids (in the file which contains them)
+    :param timerange: If set, only copy grains with origin timestamps in this time range
+    :param max_grains: If set, copy at most this many grains (the first ones selected, in file order)
+    :returns: A dictionary mapping each local id in the new file to the number of grains copied
+    :raises RuntimeError: If the input is not seekable
+    :raises GSFDecodeError: If the concatenated files are of different versions, or a grain is for a segment which
+                            isn't in the "head" block of its file
+    """
+    with ExitStack() as stack:
+        in_fp = stack.enter_context(open(input, "rb")) if isinstance(input, str) else input
+        out_fp = stack.enter_context(open(output, "wb")) if isinstance(output, str) else output
+
+        with GSFDecoder(file_data=in_fp) as dec:
+            (index, header_offsets) = _read_or_build_index(dec)
+
+        file_header = b""
+        head = b""
+        segments: Dict[int, bytes] = {}
+        segment_local_ids: Dict[bytes, int] = {}
+        local_id_maps: List[Dict[int, Optional[int]]] = []
+        for header_offset in header_offsets:
+            in_fp.seek(header_offset)
+            part_header = in_fp.read(12)
+            if file_header and part_header[8:10] != file_header[8:10]:
+                raise GSFDecodeError("Cannot remux concatenated files of different versions", header_offset)
+            with SyncGSFBlock(in_fp, want_tag="head") as head_block:
+                part_head = head_block.read_remaining_bytes()
+            if not file_header:
+                (file_header, head) = (part_header, part_head)
+
+            # Local ids which map to None are for segments which aren't selected
+            local_id_map: Dict[int, Optional[int]] = {}
+            for (tag, start, end) in _child_blocks(part_head, 23, len(part_head), "head", 0):
+                if tag != "segm":
+                    continue
+                local_id = int.from_bytes(part_head[start:start + 2], 'little')
+                segment_id = part_head[start + 2:start + 18]
+                if local_ids is not None and local_id not in local_ids:
+                    local_id_map[local_id] = None
+                    continue
+                if segment_id not in segment_local_ids:
+                    new_local_id = local_id if local_id not in segments else max(segments) + 1
+                    segments[new_local_id] = part_head[start - 8:end]
+                    segment_local_ids[segment_id] = new_local_id
+                local_id_map[local_id] = segment_local_ids[segment_id]
+            local_id_maps.append(local_id_map)
+
+        selected: List[Tuple[GSFIndexEntry, int]] = []
+        for entry in index:
+            local_id_map = local_id_maps[bisect_right(header_offsets, entry.offset) - 1]
+            if entry.local_id not in local_id_map:
+                raise GSFDecodeError("Grain for unknown segment {} at {}".format(entry.local_id, entry.offset),
+                                     entry.offset)
+            out_local_id = local_id_map[entry.local_id]
+            if out_local_id is not None and (timerange is None or entry.origin_timestamp in timerange):
+                selected.append((entry, out_local_id))
+        if max_grains is not None:
+            selected = selected[:max_grains]
+
+        counts: Dict[int, int] = {}
+        for (_, local_id) in selected:
+            counts[local_id] = counts.get(local_id, 0) + 1
+
+        out_fp.write(file_header)
+        out_fp.write(_remux_head_block(head, segments, counts))
+
+        # Each "grai" block is copied whole, using the size in its own block header. The blocks of grains whose local
+        # id changes are copied on their own after writing the start of the block with the new local id
+        runs: List[Tuple[int, int, Optional[bytes]]] = []
+        for (entry, local_id) in selected:
+            in_fp.seek(entry.offset)
+            block_header = in_fp.read(_BLOCK_HEADER.size)
+            if len(block_header) < _BLOCK_HEADER.size:
+                raise GSFDecodeError("File ended in the middle of a grain at {}".format(entry.offset), entry.offset)
+            (tag, size) = _BLOCK_HEADER.unpack(block_header)
+            if tag != b"grai":
+                raise GSFDecodeError("Expected a grai block at {} but found {!r}".format(entry.offset, tag),
+                                     entry.offset)
+            end = entry.offset + size
+            if local_id != entry.local_id:
+                runs.append((entry.offset + 10, end, block_header + _encode_uint(local_id, 2)))
+            elif runs and runs[-1][1] == entry.offset and runs[-1][2] is None:
+                runs[-1] = (runs[-1][0], end, None)
+            else:
+                runs.append((entry.offset, end, None))
+
+        copier = FileRangeCopier(in_fp, out_fp)
+        for (start, end, prefix) in runs:
+            if prefix is not None:
+                out_fp.write(prefix)
+            try:
+                copier.copy(start, end - start)
+            except EOFError:
+                raise GSFDecodeError("File ended in the middle of a grain at {}".format(start), start)
+
+        out_fp.write(b"grai" + _encode_uint(0, 4))
+        out_fp.flush()
+
+    return {local_id: counts.get(local_id, 0) for local_id in segments}
+
+
+def _concatenated_file_headers(session: GSFSyncDecoderSession) -> List[GSFFileHeaderDict]:
+    """Decode the file headers of all of the concatenated files in a decoder session's input, using the index stored
+    in the input if it has one to find them. Only the first file header is returned if the input isn't seekable or the
+    session doesn't support concatenation. The session is left at the first grain of the first file."""
+    first_headers = cast(GSFFileHeaderDict, session.file_headers)
+    if not (session._support_concatenation and session.file_data.seekable()):
+        return [first_headers]
+
+    pos = session.file_data.tell()
+    if session.index is None:
+        session.index = session.read_index()
+    session._find_file_headers()
+    header_offsets = list(session._file_header_offsets)
+    if len(header_offsets) == 1:
+        return [first_headers]
+
+    file_headers = []
+    for header_offset in header_offsets:
+        session.file_data.seek(header_offset)
+        session._decode_file_headers()
+        file_headers.append(cast(GSFFileHeaderDict, session.file_headers))
+
+    # Restore the first file header, for the grains of the first file
+    session.file_data.seek(header_offsets[0])
+    session._decode_file_headers()
+    session.file_data.seek(pos)
+    return file_headers
+
+
+def merge(inputs: Sequence[Union[str, IO[bytes]]],
+          output: Union[str, IO[bytes]],
+          lookahead: int = 64,
+          tags: Optional[Iterable[Tuple[str, str]]] = None,
+          **kwargs) -> List[Dict[int, int]]:
+    """Merge several GSF files into one, interleaving their grains by origin timestamp.
+
+    The inputs are decoded as streams and the output is written as a streamed GSF file, so only a bounded number of
+    grains are held at once however long the files are. Up to `lookahead` grains are read ahead from each input, and
+    the earliest of all the grains read ahead is written next (grains with equal timestamps are written in input
+    order). So the output is in origin timestamp order provided that no grain in an input comes `lookahead` or more
+    grains after a grain in the same input with a later timestamp, which allows for inputs whose segments are
+    interleaved with some skew. With seekable inputs the grain data is only read when the grain is written.
+
+    Each segment of each input becomes a segment of the output, keeping its local id where that is still free and
+    otherwise being given the next unused local id, along with its tags and flow metadata. Segments with the same id
+    in several inputs (eg. the files of a GSFRollingEncoder) are merged into a single segment.
+
+    If a seekable input is made of several concatenated files then the segments of all of their "head" blocks are
+    found before any output is written, and the grains of each file are mapped by the segments of the file they are
+    in. Only the first "head" block of an input which isn't seekable can be read up front, so a later file in such an
+    input whose segments aren't all in the first one causes a GSFDecodeError part-way through the output.
+
+    :param inputs: The paths of the GSF files to merge, or binary file objects
+    :param output: The path of the GSF file to write, or a binary file object (which need not be seekable)
+    :param lookahead: The number of grains to read ahead from each input
+    :param tags: Tags for the output file. If None the tags of all the inputs are used
+    :param kwargs: Other keyword arguments are passed to the GSFEncoder (eg. `index=True`)
+    :returns: A list with a dictionary for each input, mapping the local ids of its segments to the local ids of the
+              corresponding segments in the output (for a local id used by different segments in the concatenated
+              files of an input, the segment in the first of those files)
+    :raises ValueError: If lookahead is less than 1
+    :raises GSFDecodeError: If an input contains a grain for a segment which isn't in the "head" block of its file
+    """
+    if lookahead < 1:
+        raise ValueError("lookahead must be at least 1, not {}".format(lookahead))
+
+    with ExitStack() as stack:
+        sessions = []
+        for input in inputs:
+            in_fp = stack.enter_context(open(input, "rb")) if isinstance(input, str) else input
+            sessions.append(stack.enter_context(GSFDecoder(file_data=in_fp)))
+        out_fp = stack.enter_context(open(output, "wb")) if isinstance(output, str) else output
+
+        local_id_maps: List[Dict[int, int]] = []
+        segments: Dict[int, SegmentDict] = {}
+        segment_local_ids: Dict[UUID, int] = {}
+        flows: Dict[int, dict] = {}
+        file_tags: List[Tuple[str, str]] = []
+        for session in sessions:
+            local_id_map: Dict[int, int] = {}
+            for head in _concatenated_file_headers(session):
+                for seg in head['segments']:
+                    if seg['id'] not in segment_local_ids:
+                        local_id = seg['local_id']
+                        if local_id in segments:
+                            local_id = max(segments) + 1
+                        segments[local_id] = {'id': seg['id'], 'local_id': local_id, 'tags': seg['tags']}
+                        segment_local_ids[seg['id']] = local_id
+                    local_id_map.setdefault(seg['local_id'], segment_local_ids[seg['id']])
+                    if 'flow' in seg:
+                        flows.setdefault(segment_local_ids[seg['id']], seg['flow'])
+                file_tags += [tag for tag in head['tags'] if tag not in file_tags]
+            local_id_maps.append(local_id_map)
+
+        encoder = GSFEncoder(out_fp,
+                             tags=file_tags if tags is None else tags,
+                             segments=[segments[local_id] for local_id in sorted(segments)],
+                             streaming=True,
+                             **kwargs)
+        for (local_id, flow) in flows.items():
+            encoder.segments[local_id].add_flow(src_id=flow['source_id'], flow_id=flow['flow_id'],
+                                                format=flow['format'], data=flow['data'])
+
+        with encoder as enc:
+            grain_iters = [iter(session.grains()) for session in sessions]
+            pending = [0]*len(sessions)
+            heap: List[Tuple[Timestamp, int, int, Grain, int]] = []
+            n = 0
+
+            # The local ids of the grains are mapped by the segments of the file they are in, which the session
+            # decodes as it reaches each of the concatenated files
+            part_heads: List[Optional[GSFFileHeaderDict]] = [None]*len(sessions)
+            part_maps: List[Dict[int, int]] = [{}]*len(sessions)
+
+            def _read_ahead(i: int) -> None:
+                nonlocal n
+                while pending[i] < lookahead:
+                    try:
+                        (grain, local_id) = next(grain_iters[i])
+                    except StopIteration:
+                        return
+                    head = cast(GSFFileHeaderDict, sessions[i].file_headers)
+                    if head is not part_heads[i]:
+                        part_heads[i] = head
+                        part_maps[i] = {seg['local_id']: segment_local_ids[seg['id']] for seg in head['segments']
+                                        if seg['id'] in segment_local_ids}
+                    if local_id not in part_maps[i]:
+                        raise GSFDecodeError("Grain for unknown segment {} in input {} of merge".format(local_id, i),
+                                             sessions[i].file_data.tell())
+                    heappush(heap, (grain.origin_timestamp, i, n, grain, part_maps[i][local_id]))
+                    pending[i] += 1
+                    n += 1
+
+            for i in range(0, len(sessions)):
+                _read_ahead(i)
+
+            while heap:
+                (_, i, _, grain, local_id) = heappop(heap)
+                enc.add_grain(grain, segment_local_id=local_id)
+                pending[i] -= 1
+                _read_ahead(i)
+
+        out_fp.flush()
+
+    return local_id_maps
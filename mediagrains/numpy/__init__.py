@@ -19,6 +19,7 @@ Library for handling mediagrains in numpy arrays
 
 from .numpy_grains.VideoGrain import VideoGrain
 from .numpy_grains.AudioGrain import AudioGrain
+from .numpy_grains.GrainFactory import GrainFactory
 from . import convert  # noqa: F401
 
-__all__ = ['VideoGrain', 'AudioGrain']
+__all__ = ['VideoGrain', 'AudioGrain', 'GrainFactory']
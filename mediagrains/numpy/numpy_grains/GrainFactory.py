@@ -0,0 +1,46 @@
+from typing import Optional, cast
+
+import mediagrains.grains as bytesgrain
+from ...typing import (
+    GrainMetadataDict,
+    VideoGrainMetadataDict,
+    AudioGrainMetadataDict,
+    GrainDataParameterType)
+from ...utils.iobytes import IOBytes
+
+from .VideoGrain import VideoGrain
+from .AudioGrain import AudioGrain
+
+
+def GrainFactory(meta: Optional[GrainMetadataDict] = None,
+                 data: GrainDataParameterType = None,
+                 **kwargs) -> bytesgrain.Grain:
+    """A drop-in replacement for mediagrains.grains.GrainFactory which constructs numpy VideoGrains and AudioGrains
+    directly over the data buffer passed in, so that it can be used as the parse_grain function of a GSF decoder
+    without any further copying of the grain data. The component_data or channel_data views are created once, when the
+    grain is constructed.
+
+    Lazily loaded data (an IOBytes object) is loaded when the grain is constructed since a numpy array cannot wrap it
+    before then, whilst awaitable data is wrapped when the grain is awaited. Other grain types, and video and audio
+    formats which have no numpy representation, are constructed as ordinary grains.
+
+    Any other keyword arguments are passed on to mediagrains.grains.GrainFactory whenever it is used. As there, they
+    only affect the grain constructed when meta is None.
+    """
+    if meta is None:
+        return bytesgrain.GrainFactory(meta=meta, data=data, **kwargs)
+
+    if isinstance(data, IOBytes):
+        # This returns the loaded bytes object itself rather than a copy of it
+        data = bytes(data)
+
+    grain_type = meta.get('grain', {}).get('grain_type')
+    try:
+        if grain_type == 'video':
+            return VideoGrain(meta=cast(VideoGrainMetadataDict, meta), data=data)
+        elif grain_type == 'audio':
+            return AudioGrain(meta=cast(AudioGrainMetadataDict, meta), data=data)
+    except NotImplementedError:
+        pass
+
+    return bytesgrain.GrainFactory(meta=meta, data=data, **kwargs)
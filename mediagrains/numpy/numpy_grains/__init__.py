@@ -1,4 +1,5 @@
 from .AudioGrain import AudioGrain
 from .VideoGrain import VideoGrain
+from .GrainFactory import GrainFactory
 
-__all__ = ["VideoGrain", "AudioGrain"]
+__all__ = ["VideoGrain", "AudioGrain", "GrainFactory"]
@@ -14,6 +14,9 @@
 
 from .wrap_in_gsf import wrap_video_in_gsf, wrap_audio_in_gsf
 from .extract_from_gsf import extract_gsf_essence, gsf_probe
+from .remux_gsf import remux_gsf
+from .merge_gsf import merge_gsf
 from ._file_or_pipe import file_or_pipe
 
-__all__ = ["wrap_video_in_gsf", "wrap_audio_in_gsf", "extract_gsf_essence", "gsf_probe", "file_or_pipe"]
+__all__ = ["wrap_video_in_gsf", "wrap_audio_in_gsf", "extract_gsf_essence", "gsf_probe", "remux_gsf", "merge_gsf",
+           "file_or_pipe"]
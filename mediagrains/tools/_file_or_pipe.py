@@ -20,25 +20,54 @@ from contextlib import contextmanager
 
 
 class InputStreamWrapper(BufferedIOBase):
-    def __init__(self, fp: typing.IO[bytes]):
-        self._file = fp
+    """Wraps a forward-only input stream (eg. stdin) to track the read position and allow seeking forwards
+
+    Seeking forwards reads and discards data in chunks of at most `skip_chunk_size` bytes, using a reusable buffer.
+    """
+    def __init__(self, fp: typing.IO[bytes], skip_chunk_size: int = 1 << 20):
+        self._file = typing.cast(BufferedIOBase, fp)
         self._pos = 0
+        self._skip_chunk_size = skip_chunk_size
+        self._skip_buffer: typing.Optional[bytearray] = None
 
     def tell(self) -> int:
         return self._pos
 
+    def readable(self) -> bool:
+        return True
+
+    def _readinto_fully(self, b: memoryview) -> int:
+        """Fill a buffer from the stream, returning the number of bytes read, which is only short at the end"""
+        filled = 0
+        while filled < len(b):
+            n = self._file.readinto(b[filled:])
+            if not n:
+                break
+            filled += n
+        return filled
+
+    def readinto(self, b) -> int:
+        n = self._readinto_fully(memoryview(b).cast('B'))
+        self._pos += n
+        return n
+
     def read(self, size=-1) -> bytes:
-        out = b""
-        if size == -1:
-            out = self._file.read(-1)
+        if size is None or size < 0:
+            out = self._file.read()
         else:
-            s = size
-            while len(out) < size:
-                b = self._file.read(s)
-                if len(b) == 0:
-                    raise EOFError
-                s -= len(b)
-                out += b
+            out = self._file.read(size)
+            if len(out) < size:
+                # Raw streams may return less than was asked for, so collect the rest and join once
+                parts = [out]
+                remaining = size - len(out)
+                while remaining > 0:
+                    b = self._file.read(remaining)
+                    if not b:
+                        self._pos += size - remaining
+                        raise EOFError
+                    parts.append(b)
+                    remaining -= len(b)
+                out = b"".join(parts)
 
         self._pos += len(out)
         return out
@@ -51,9 +80,19 @@ class InputStreamWrapper(BufferedIOBase):
 
         if offset < 0:
             raise NotImplementedError("Cannot seek backwards in a stream")
+
         if offset > 0:
-            self._file.read(offset)
-        self._pos += offset
+            if self._skip_buffer is None:
+                self._skip_buffer = bytearray(self._skip_chunk_size)
+            skip_view = memoryview(self._skip_buffer)
+
+            while offset > 0:
+                n = self._readinto_fully(skip_view[:min(offset, len(skip_view))])
+                self._pos += n
+                offset -= n
+                if n == 0:
+                    break
+
         return self._pos
 
 
@@ -18,9 +18,15 @@
 
 import argparse
 import sys
+import time
 import mediajson
+import numpy as np
 
-from ..gsf import GSFDecoder
+from typing import IO, Dict, List, Optional, Tuple, cast
+from mediatimestamp.immutable import Timestamp, TimeRange
+
+from ..gsf import GSFDecoder, GSFFileHeaderDict, GSFSyncDecoderSession, GrainDataLoadingMode, FileRangeCopier
+from ..utils import GrainBufferPool
 from ._file_or_pipe import file_or_pipe
 
 
@@ -35,17 +41,72 @@ def extract_gsf_essence():
 
     parser.add_argument("--only-id", help="Only include Grains with this GSF local ID. May be specified more than once",
                         type=int, action="append", default=None)
+    parser.add_argument("-s", "--summary", help="Print the amount of essence extracted and the throughput to stderr",
+                        action="store_true")
 
     args = parser.parse_args()
 
-    with file_or_pipe(args.input_file, "rb") as input_data, file_or_pipe(args.output_file, "wb") as output_data:
-        decoder = GSFDecoder(file_data=input_data)
-        decoder.decode_file_headers()
+    start_time = time.perf_counter()
 
-        for grain, local_id in decoder.grains(local_ids=args.only_id):
-            print("Got grain with local_id {} at {}".format(local_id, grain.origin_timestamp.to_sec_nsec()),
-                  file=sys.stderr)
-            output_data.write(grain.data)
+    with file_or_pipe(args.input_file, "rb") as input_data, file_or_pipe(args.output_file, "wb") as output_data:
+        with GSFDecoder(file_data=input_data) as dec:
+            if input_data.seekable():
+                (grain_count, byte_count) = _copy_essence(dec, output_data, args.only_id)
+            else:
+                (grain_count, byte_count) = _write_essence(dec, output_data, args.only_id)
+        output_data.flush()
+
+    if args.summary:
+        duration = time.perf_counter() - start_time
+        print("Extracted {} bytes of essence from {} grains in {:.3f}s ({:.1f} MB/s)".format(
+              byte_count, grain_count, duration, byte_count / duration / 1000000 if duration > 0 else 0.0),
+              file=sys.stderr)
+
+
+def _copy_essence(dec: GSFSyncDecoderSession,
+                  output_data: IO[bytes],
+                  local_ids: Optional[List[int]]) -> Tuple[int, int]:
+    """Find the grain data in a seekable input from the grain headers and copy it to the output without decoding the
+    grains, using os.copy_file_range or os.sendfile where possible
+
+    :returns: A (grain count, byte count) tuple
+    """
+    segments = dec.scan_headers(local_ids=local_ids)
+    if not segments:
+        return (0, 0)
+
+    headers = np.concatenate(list(segments.values()))
+    headers = headers[np.argsort(headers["offset"], kind="stable")]
+
+    copier = FileRangeCopier(dec.file_data, output_data)
+    for (data_offset, data_length) in zip(headers["data_offset"].tolist(), headers["data_length"].tolist()):
+        if data_length > 0:
+            copier.copy(data_offset, data_length)
+
+    return (len(headers), int(headers["data_length"].sum()))
+
+
+def _write_essence(dec: GSFSyncDecoderSession,
+                   output_data: IO[bytes],
+                   local_ids: Optional[List[int]]) -> Tuple[int, int]:
+    """Read the grain data from an input which can't be seeked back over as the grains are decoded, reusing the
+    buffers it is read into
+
+    :returns: A (grain count, byte count) tuple
+    """
+    pool = GrainBufferPool()
+    grain_count = byte_count = 0
+
+    for grain, _ in dec.grains(local_ids=local_ids, loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY,
+                               buffer_provider=pool):
+        if grain.data is not None:
+            output_data.write(cast(bytes, grain.data))
+            byte_count += grain.length
+            if isinstance(grain.data, bytearray):
+                pool.release(grain.data)
+        grain_count += 1
+
+    return (grain_count, byte_count)
 
 
 def gsf_probe():
@@ -62,40 +123,73 @@ def gsf_probe():
 
     args = parser.parse_args()
 
-    with file_or_pipe(args.input_file, "rb") as input_data:
-        decoder = GSFDecoder(file_data=input_data)
-        file_data = decoder.decode_file_headers()
+    with file_or_pipe(args.input_file, "rb") as input_data, GSFDecoder(file_data=input_data) as dec:
+        file_data = dict(cast(GSFFileHeaderDict, dec.file_headers))
 
         file_data["segments"] = {segment["local_id"]: segment for segment in file_data["segments"]}
         file_data["created"] = str(file_data["created"])  # Work around mediajson's inability to serialize datetimes
 
-        for grain, local_id in decoder.grains(load_lazily=True):
-            this_segment = file_data["segments"][local_id]
-
-            if args.all_grains:
-                try:
-                    this_segment["grain_data"].append(grain.meta["grain"])
-                except KeyError:
-                    this_segment["grain_data"] = [grain.meta["grain"]]
-
-            try:
-                this_segment["timerange"] = \
-                    this_segment["timerange"].extend_to_encompass_timerange(grain.origin_timerange())
-            except KeyError:
-                this_segment["timerange"] = grain.origin_timerange()
-                if not args.all_grains:
-                    this_segment["grain_data"] = grain.meta["grain"]
-
-            if args.all_timestamps:
-                grain_ts_data = {
-                    "origin_timestamp": grain.origin_timestamp,
-                    "sync_timestamp": grain.sync_timestamp,
-                    "creation_timestamp": grain.creation_timestamp
-                }
-
-                try:
-                    this_segment["grain_timestamps"].append(grain_ts_data)
-                except KeyError:
-                    this_segment["grain_timestamps"] = [grain_ts_data]
+        if args.all_grains or args.all_timestamps or not input_data.seekable():
+            _probe_grains(dec, file_data["segments"], args.all_grains, args.all_timestamps)
+        else:
+            _probe_headers(dec, file_data["segments"])
 
         print(mediajson.dumps(file_data, indent=True))
+
+
+def _segment_timerange(headers: np.ndarray) -> TimeRange:
+    """Get the range of origin timestamps covered by the grains of a segment, as found by combining the
+    origin_timerange of each grain, from the rows returned by scan_headers"""
+    origin = headers["origin_timestamp"]
+    samples = headers["samples"].astype(np.int64)
+    sample_rate = headers["sample_rate"].astype(np.int64)
+
+    # Audio grains end at their last sample, rounded down to the nanosecond as by TimeOffset.from_count
+    is_audio = sample_rate > 0
+    rate = np.where(is_audio, sample_rate, 1)
+    last_sample = np.where(samples > 0, ((samples - 1) * 1000000000) // rate, -(1000000000 // rate))
+    final = np.where(is_audio, origin + last_sample, origin)
+
+    return TimeRange(Timestamp.from_nanosec(int(origin.min())), Timestamp.from_nanosec(int(final.max())),
+                     TimeRange.INCLUSIVE)
+
+
+def _probe_headers(dec: GSFSyncDecoderSession, segments: dict) -> None:
+    """Fill in the segment information from the grain headers, decoding only the first grain of each segment"""
+    for (local_id, (headers, grain)) in dec.scan_segments().items():
+        this_segment = segments[local_id]
+        this_segment["timerange"] = _segment_timerange(headers)
+        this_segment["grain_count"] = len(headers)
+        this_segment["grain_data"] = grain.meta["grain"]
+
+
+def _probe_grains(dec: GSFSyncDecoderSession, segments: dict, all_grains: bool, all_timestamps: bool) -> None:
+    """Fill in the segment information by decoding every grain, for when the grains or their timestamps are wanted
+    or the input can't be scanned and then revisited"""
+    ranges: Dict[int, Tuple[Timestamp, Timestamp]] = {}
+
+    for grain, local_id in dec.grains():
+        this_segment = segments[local_id]
+
+        if all_grains:
+            this_segment.setdefault("grain_data", []).append(grain.meta["grain"])
+
+        (start, end) = (grain.origin_timestamp, grain.final_origin_timestamp())
+        if local_id not in ranges:
+            ranges[local_id] = (start, end)
+            this_segment["grain_count"] = 0
+            if not all_grains:
+                this_segment["grain_data"] = grain.meta["grain"]
+        else:
+            ranges[local_id] = (min(ranges[local_id][0], start), max(ranges[local_id][1], end))
+        this_segment["grain_count"] += 1
+
+        if all_timestamps:
+            this_segment.setdefault("grain_timestamps", []).append({
+                "origin_timestamp": grain.origin_timestamp,
+                "sync_timestamp": grain.sync_timestamp,
+                "creation_timestamp": grain.creation_timestamp
+            })
+
+    for (local_id, (start, end)) in ranges.items():
+        segments[local_id]["timerange"] = TimeRange(start, end, TimeRange.INCLUSIVE)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+#
+# Copyright 2019 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Given several GSF files, interleave their grains by origin timestamp into a single GSF file"""
+
+import argparse
+import sys
+from contextlib import ExitStack
+
+from ..gsf import merge
+from ._file_or_pipe import file_or_pipe
+
+
+def merge_gsf():
+    """Provide a utility to merge GSF files"""
+    parser = argparse.ArgumentParser(
+        description="A utility to merge GSF files into a single GSF file, with the grains in origin timestamp order"
+    )
+
+    parser.add_argument("input_files", help="Input GSF files. Specify - for stdin", type=str, nargs="+")
+    parser.add_argument("output_file", help="Output GSF file path. Specify - for stdout", type=str)
+
+    parser.add_argument("--lookahead", help="The number of grains to read ahead from each input file", type=int,
+                        default=64)
+
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        inputs = [stack.enter_context(file_or_pipe(path, "rb")) for path in args.input_files]
+        output_data = stack.enter_context(file_or_pipe(args.output_file, "wb"))
+        local_id_maps = merge(inputs, output_data, lookahead=args.lookahead)
+
+    for (path, local_id_map) in zip(args.input_files, local_id_maps):
+        for (local_id, output_local_id) in local_id_map.items():
+            print("{} local_id {} -> local_id {}".format(path, local_id, output_local_id), file=sys.stderr)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+#
+# Copyright 2019 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Given a GSF file, copy some of its grains into a new GSF file without decoding them"""
+
+import argparse
+import sys
+
+from mediatimestamp.immutable import Timestamp, TimeRange
+
+from ..gsf import remux
+from ._file_or_pipe import file_or_pipe
+
+
+def remux_gsf():
+    """Provide a utility to trim, filter and split GSF files"""
+    parser = argparse.ArgumentParser(
+        description="A utility to copy selected grains from a GSF file into a new GSF file, without decoding the "
+                    "grain data"
+    )
+
+    parser.add_argument("input_file", help="Input GSF file, which must be seekable", type=str)
+    parser.add_argument("output_file", help="Output GSF file path. Specify - for stdout", type=str)
+
+    parser.add_argument("--only-id", help="Only include Grains with this GSF local ID. May be specified more than once",
+                        type=int, action="append", default=None)
+    parser.add_argument("--start-ts", help="Only include Grains with origin timestamps at or after this timestamp",
+                        type=Timestamp.from_str, default=None)
+    parser.add_argument("--end-ts", help="Only include Grains with origin timestamps before this timestamp",
+                        type=Timestamp.from_str, default=None)
+    parser.add_argument("--count", help="Include at most this many Grains", type=int, default=None)
+
+    args = parser.parse_args()
+
+    timerange = None
+    if args.start_ts is not None or args.end_ts is not None:
+        timerange = TimeRange(args.start_ts, args.end_ts, TimeRange.INCLUDE_START)
+
+    with open(args.input_file, "rb") as input_data, file_or_pipe(args.output_file, "wb") as output_data:
+        counts = remux(input_data, output_data, local_ids=args.only_id, timerange=timerange, max_grains=args.count)
+
+    for (local_id, count) in counts.items():
+        print("Copied {} grains with local_id {}".format(count, local_id), file=sys.stderr)
@@ -13,9 +13,9 @@
 # limitations under the License.
 #
 
-from .iobytes import IOBytes
+from .iobytes import IOBytes, GrainDataCache, GrainBufferPool
 from .grain_wrapper import GrainWrapper
 from .h264_grain_wrapper import H264GrainWrapper
 from .adts_aac_grain_wrapper import ADTSAACGrainWrapper
 
-__all__ = ["IOBytes", "GrainWrapper", "H264GrainWrapper", "ADTSAACGrainWrapper"]
+__all__ = ["IOBytes", "GrainDataCache", "GrainBufferPool", "GrainWrapper", "H264GrainWrapper", "ADTSAACGrainWrapper"]
@@ -17,12 +17,102 @@
 A simple wrapper class IOBytes which is a conceptual inverse to the standard
 library's io.BytesIO, taking an io stream and wrapping it to appear as a
 bytes object, lazily loading as necessary.
+
+Also provides GrainDataCache, which limits how much lazily loaded data is kept
+in memory, and GrainBufferPool, which recycles the buffers grain data is read
+into.
 """
 
+from collections import OrderedDict
 from collections.abc import Sequence
-from typing import List
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+__all__ = ["IOBytes", "GrainDataCache", "GrainBufferPool"]
+
+
+class GrainBufferPool (object):
+    """A pool of reusable bytearrays to read grain data into, which can be used as the buffer_provider of a GSF
+    decoder session.
+
+    Calling the pool with a size returns a bytearray of exactly that size, reusing a released one if there is one.
+    Buffers should be released once nothing refers to the grain data they hold any longer.
+    """
+
+    def __init__(self, max_free_buffers: int = 16):
+        """
+        :param max_free_buffers: The largest number of released buffers of each size to keep for reuse
+        """
+        self.max_free_buffers = max_free_buffers
+        self._free: Dict[int, List[bytearray]] = {}
+
+    def __call__(self, size: int) -> bytearray:
+        free = self._free.get(size)
+        if free:
+            return free.pop()
+        return bytearray(size)
+
+    def release(self, buffer: bytearray) -> None:
+        """Return a buffer to the pool for reuse"""
+        free = self._free.setdefault(len(buffer), [])
+        if len(free) < self.max_free_buffers and not any(b is buffer for b in free):
+            free.append(buffer)
+
+
+class GrainDataCache (object):
+    """A cache of lazily loaded data which keeps the most recently used items within a total size in bytes.
+
+    Each item is added with a callable which discards the item's data when it is evicted, after which the data will be
+    loaded again the next time it is needed. The most recently added item is never evicted to make room for itself.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: The largest total size of the data to keep
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, Tuple[int, Callable[[], None]]]" = OrderedDict()
 
-__all__ = ["IOBytes"]
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def add(self, key: Hashable, size: int, evict: Callable[[], None]) -> None:
+        """Add an item which has just been loaded as the most recently used, evicting the least recently used items
+        if the cache is now too large
+
+        :param key: A key for the item
+        :param size: The size of the item's data in bytes
+        :param evict: A callable taking no parameters which discards the item's data
+        """
+        self.discard(key)
+        self._entries[key] = (size, evict)
+        self.size += size
+
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            (_, (old_size, old_evict)) = self._entries.popitem(last=False)
+            self.size -= old_size
+            old_evict()
+
+    def touch(self, key: Hashable) -> None:
+        """Mark an item as the most recently used"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+    def discard(self, key: Hashable) -> None:
+        """Remove an item from the cache without evicting its data"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[0]
+
+    def clear(self) -> None:
+        """Evict every item"""
+        while self._entries:
+            (_, (size, evict)) = self._entries.popitem(last=False)
+            self.size -= size
+            evict()
 
 
 class LazyLoader (object):
@@ -36,7 +126,7 @@ class LazyLoader (object):
     Upon construction this "loader" callable is not called, but the first call to any method or access to any attribute
     of the LazyLoader object will cause the loader to be called, its return value stored inside the object, and the
     attribute/method/etc ... of that object with the same name to be returned instead. All future access is
-    transparently passed through to the stored object.
+    transparently passed through to the stored object, and calls the _touch method (which subclasses may override).
     """
 
     _attributes: List[str] = []
@@ -49,11 +139,13 @@ class LazyLoader (object):
         self._loader = loader
 
     def __getattribute__(self, attr):
-        if attr in (['_object', '_loader', '__repr__', '__class__'] + type(self)._attributes):
+        if attr in (['_object', '_loader', '_touch', '__repr__', '__class__'] + type(self)._attributes):
             return object.__getattribute__(self, attr)
         else:
             if object.__getattribute__(self, '_object') is None:
                 self._object = object.__getattribute__(self, '_loader')()
+            else:
+                object.__getattribute__(self, '_touch')()
             return getattr(object.__getattribute__(self, '_object'), attr)
 
     def __repr__(self):
@@ -62,12 +154,18 @@ class LazyLoader (object):
         else:
             return repr(object.__getattribute__(self, '_object'))
 
+    def _touch(self):
+        """Called whenever the already loaded object is used"""
+        pass
+
     def __setattr__(self, attr, value):
         if attr in ['_object', '_loader'] + type(self)._attributes:
             return object.__setattr__(self, attr, value)
         else:
             if object.__getattribute__(self, '_object') is None:
                 self._object = object.__getattribute__(self, '_loader')()
+            else:
+                object.__getattribute__(self, '_touch')()
             return setattr(object.__getattribute__(self, '_object'), attr, value)
 
     # In python2.7 some special methods may bypass __getattribute__, so need to be specifically redefined
@@ -125,15 +223,23 @@ class IOBytes (LazyLoader, Sequence):
     Current behaviour is to read the whole of the data segment into a bytes-like object, but *only* the
     first time the data actually needs to be accessed. Notably calls to __len__ and __repr__ do not cause the
     data to be read from the stream. The location of the stream pointer is restored to its previous location
-    after this read so it should be transparent."""
+    after this read so it should be transparent.
 
-    _attributes = ['_istream', '_start', '_length', '__len__']
+    If a GrainDataCache is supplied the loaded data is only kept while it is in the cache, and is read from the
+    stream again if it is needed after being evicted, so the stream must remain open.
 
-    def __init__(self, istream, start, length):
+    The istream, start, length and loaded properties and the fill method don't cause the data to be read, so that
+    the data of several IOBytes can be read from the stream together and then filled in."""
+
+    _attributes = ['_istream', '_start', '_length', '_cache', '_evict', '__len__',
+                   'istream', 'start', 'length', 'loaded', 'fill']
+
+    def __init__(self, istream, start, length, cache: Optional[GrainDataCache] = None):
         """
         :param istream: An instance of a seekable IOBase
         :param start: The value to pass to istream.seek to get to the start of this data
         :param start: The length of the data
+        :param cache: An optional GrainDataCache which limits how long the loaded data is kept
         """
         def __loadbytes():
             loc = self._istream.tell()
@@ -142,16 +248,58 @@ class IOBytes (LazyLoader, Sequence):
                 _bytes = self._istream.read(self._length)
             finally:
                 self._istream.seek(loc)
+            self.fill(_bytes)
             return _bytes
 
         LazyLoader.__init__(self, __loadbytes)
         self._istream = istream
         self._start = start
         self._length = length
+        self._cache = cache
+
+    @property
+    def istream(self):
+        """The stream the data is read from"""
+        return self._istream
+
+    @property
+    def start(self) -> int:
+        """The position of the data in the stream"""
+        return self._start
+
+    @property
+    def length(self) -> int:
+        """The length of the data in the stream"""
+        return self._length
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the data is currently loaded"""
+        return self._object is not None
+
+    def fill(self, data: bytes) -> None:
+        """Set the loaded data without reading it from the stream (eg. when it has been read along with the data of
+        other IOBytes), adding it to the cache if there is one as though it had just been loaded
+
+        :param data: The data, which should be the bytes at the position of this object in the stream
+        """
+        self._object = data
+        if self._cache is not None:
+            self._cache.add(id(self), len(data), self._evict)
+
+    def _evict(self):
+        self._object = None
+
+    def _touch(self):
+        # Keep the data in the cache for longer since it is being used
+        if self._cache is not None:
+            self._cache.touch(id(self))
 
     def __bytes__(self):
         if self._object is None:
             self._object = object.__getattribute__(self, '_loader')()
+        else:
+            self._touch()
         return self._object
 
     def __len__(self):
@@ -65,7 +65,9 @@ console_scripts = [
     'wrap_video_in_gsf=mediagrains.tools:wrap_video_in_gsf',
     'wrap_audio_in_gsf=mediagrains.tools:wrap_audio_in_gsf',
     'extract_gsf_essence=mediagrains.tools:extract_gsf_essence',
-    'gsf_probe=mediagrains.tools:gsf_probe'
+    'gsf_probe=mediagrains.tools:gsf_probe',
+    'remux_gsf=mediagrains.tools:remux_gsf',
+    'merge_gsf=mediagrains.tools:merge_gsf'
 ]
 
 setup(name=name,
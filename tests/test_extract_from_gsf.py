@@ -0,0 +1,220 @@
+#
+# Copyright 2019 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from unittest import TestCase, mock
+from uuid import UUID
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+import os
+import re
+import sys
+
+from mediagrains.grains import AudioGrain, EventGrain
+from mediagrains.gsf import GSFDecoder, GSFEncoder, GrainDataLoadingMode
+from mediagrains.cogenums import CogAudioFormat
+from mediagrains.tools import extract_gsf_essence
+from mediagrains.tools.extract_from_gsf import _probe_headers, _probe_grains
+from mediatimestamp.immutable import Timestamp, TimeOffset
+
+
+EXAMPLE_FILES = ["video_8.gsf", "coded_video_9.gsf", "audio_7.gsf", "audio_8.gsf", "coded_audio_8.gsf", "event_8.gsf",
+                 "interleaved_8.gsf", "concat_coded_video_9.gsf"]
+
+SRC_ID = UUID('e14e9d58-1567-11e8-8dd3-831a068eb034')
+AUDIO_FLOW_ID = UUID('ee1eed58-1567-11e8-a971-3b901a2dd8ab')
+EVENT_FLOW_ID = UUID('8f36ab6e-1568-11e8-b0ea-5fbcc1d1a0d0')
+SEGMENT_IDS = [UUID('80af875c-1565-11e8-8f44-87ef081b48cd'), UUID('80af875c-1565-11e8-8f44-87ef081b48ce')]
+START_TS = Timestamp(1420102800, 0)
+
+
+def _audio_grain(n: int, samples: int = 1920) -> AudioGrain:
+    grain = AudioGrain(src_id=SRC_ID, flow_id=AUDIO_FLOW_ID, origin_timestamp=START_TS + TimeOffset.from_count(n, 25),
+                       cog_audio_format=CogAudioFormat.S16_INTERLEAVED, channels=2, samples=samples,
+                       sample_rate=48000)
+    grain.data = bytes([n]) * (4 * samples)
+    return grain
+
+
+def _event_grain(n: int) -> EventGrain:
+    grain = EventGrain(src_id=SRC_ID, flow_id=EVENT_FLOW_ID, origin_timestamp=START_TS + TimeOffset.from_count(n, 25),
+                       event_type="urn:x-ipstudio:format:event.test", topic="/{}".format(n % 2))
+    grain.append("/value", post=n)
+    return grain
+
+
+def _encode(major: int, grains) -> bytes:
+    """Encode a file with an audio segment (local id 1) and an event segment (local id 2)"""
+    f = BytesIO()
+    with GSFEncoder(f, major=major, segments=[{'id': SEGMENT_IDS[0], 'local_id': 1},
+                                              {'id': SEGMENT_IDS[1], 'local_id': 2}]) as enc:
+        for (local_id, grain) in grains:
+            enc.add_grain(grain, segment_local_id=local_id)
+    return f.getvalue()
+
+
+class TestGSFProbe (TestCase):
+    def _probe(self, data, probe):
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            segments = {seg['local_id']: dict(seg) for seg in dec.file_headers['segments']}
+            probe(dec, segments)
+
+        # The creation timestamps of the grains are set when they are decoded
+        for seg in segments.values():
+            if 'grain_data' in seg:
+                seg['grain_data'] = {key: value for (key, value) in seg['grain_data'].items()
+                                     if key != 'creation_timestamp'}
+        return {local_id: (seg.get('timerange'), seg.get('grain_data'), seg.get('grain_count'))
+                for (local_id, seg) in segments.items()}
+
+    def assertProbesMatch(self, data):
+        """Check that probing from the grain headers finds the same timeranges, first grain metadata and grain counts
+        as decoding every grain"""
+        expected = self._probe(data, lambda dec, segments: _probe_grains(dec, segments, False, False))
+        self.assertEqual(self._probe(data, _probe_headers), expected)
+
+    def test_probe_headers_matches_probe_grains(self):
+        for filename in EXAMPLE_FILES:
+            with self.subTest(filename=filename):
+                with open("examples/{}".format(filename), "rb") as f:
+                    self.assertProbesMatch(f.read())
+
+    def test_probe_audio_with_no_samples(self):
+        # A grain with no samples ends before it starts, and the segment's timerange must be the same either way
+        for last_samples in (0, 1, 1920):
+            with self.subTest(last_samples=last_samples):
+                data = _encode(8, [(1, _audio_grain(n)) for n in range(0, 4)] + [(1, _audio_grain(4, last_samples))])
+                self.assertProbesMatch(data)
+
+        self.assertProbesMatch(_encode(8, [(1, _audio_grain(0, 0))]))
+
+    def test_probe_concatenated_versions(self):
+        # The event segment's first grain is in the second file, which has a different grain header layout
+        data = (_encode(7, [(1, _audio_grain(n)) for n in range(0, 5)]) +
+                _encode(8, [(2, _event_grain(n)) for n in range(0, 5)]))
+
+        probed = self._probe(data, _probe_headers)
+        self.assertEqual(probed[2][1]['event_payload']['topic'], "/0")
+        self.assertEqual(probed[2][2], 5)
+        self.assertProbesMatch(data)
+
+
+class TestExtractGSFEssence (TestCase):
+    def _data(self):
+        return _encode(8, [(local_id, grain) for n in range(0, 5)
+                           for (local_id, grain) in ((1, _audio_grain(n)), (2, _event_grain(n)))])
+
+    def _grain_data(self, data, local_ids=None):
+        """The concatenated data of the grains in a file, as decoded"""
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            return b"".join(bytes(grain.data) for (grain, _) in dec.grains(
+                local_ids=local_ids, loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY) if grain.data is not None)
+
+    def _extract(self, data, args=[], pipe=False):
+        """Run extract_gsf_essence on the data, from a file or through stdin, and return the output and stderr"""
+        stderr = StringIO()
+        with TemporaryDirectory() as tmpdir:
+            in_path = os.path.join(tmpdir, "in.gsf")
+            out_path = os.path.join(tmpdir, "out.raw")
+            with open(in_path, "wb") as f:
+                f.write(data)
+
+            with open(in_path, "rb") as f, \
+                    mock.patch.object(sys, "stdin", mock.MagicMock(buffer=f)), \
+                    mock.patch.object(sys, "stderr", stderr), \
+                    mock.patch.object(sys, "argv", ["extract_gsf_essence", "-" if pipe else in_path, out_path] + args):
+                extract_gsf_essence()
+
+            with open(out_path, "rb") as f:
+                return (f.read(), stderr.getvalue())
+
+    def test_extract_from_file(self):
+        for filename in ["video_8.gsf", "coded_video_9.gsf", "audio_8.gsf", "coded_audio_8.gsf",
+                         "concat_coded_video_9.gsf"]:
+            with self.subTest(filename=filename):
+                with open("examples/{}".format(filename), "rb") as f:
+                    data = f.read()
+
+                (out, stderr) = self._extract(data)
+
+                self.assertEqual(out, self._grain_data(data))
+                self.assertEqual(stderr, "")
+
+    def test_extract_from_file_copies_in_kernel(self):
+        data = self._data()
+        name = "copy_file_range" if hasattr(os, "copy_file_range") else "sendfile"
+        if not hasattr(os, name):
+            self.skipTest("No kernel copy available")
+
+        with mock.patch.object(os, name, wraps=getattr(os, name)) as copy:
+            (out, _) = self._extract(data, ["--only-id", "1"])
+
+        self.assertEqual(out, self._grain_data(data, local_ids=[1]))
+        self.assertEqual(copy.call_count, 5)
+
+    def test_extract_from_pipe(self):
+        for filename in ["video_8.gsf", "coded_video_9.gsf", "audio_8.gsf", "coded_audio_8.gsf",
+                         "concat_coded_video_9.gsf"]:
+            with self.subTest(filename=filename):
+                with open("examples/{}".format(filename), "rb") as f:
+                    data = f.read()
+
+                with mock.patch("mediagrains.tools.extract_from_gsf._copy_essence") as copy_essence:
+                    (out, _) = self._extract(data, pipe=True)
+
+                self.assertEqual(out, self._grain_data(data))
+                copy_essence.assert_not_called()
+
+    def test_extract_only_id(self):
+        data = self._data()
+
+        for pipe in (False, True):
+            with self.subTest(pipe=pipe):
+                (out, _) = self._extract(data, ["--only-id", "1"], pipe=pipe)
+                self.assertEqual(out, self._grain_data(data, local_ids=[1]))
+
+                (out, _) = self._extract(data, ["--only-id", "3"], pipe=pipe)
+                self.assertEqual(out, b"")
+
+    def test_extract_summary(self):
+        data = self._data()
+        expected = self._grain_data(data, local_ids=[1])
+
+        for pipe in (False, True):
+            with self.subTest(pipe=pipe):
+                (_, stderr) = self._extract(data, ["--only-id", "1", "--summary"], pipe=pipe)
+
+                match = re.match(r"Extracted (\d+) bytes of essence from (\d+) grains in ", stderr)
+                self.assertIsNotNone(match)
+                self.assertEqual((int(match.group(1)), int(match.group(2))), (len(expected), 5))
+
+    def test_extract_event_grains(self):
+        # From a seekable file the event payloads are copied as they are stored in the file, whereas from a pipe the
+        # decoded event grains are serialised again, which changes the bytes of this older file
+        with open("examples/event_7.gsf", "rb") as f:
+            data = f.read()
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            headers = dec.scan_headers()[1]
+        stored = b"".join(data[offset:offset + length]
+                          for (offset, length) in zip(headers["data_offset"].tolist(), headers["data_length"].tolist()))
+        decoded = self._grain_data(data)
+        self.assertNotEqual(stored, decoded)
+
+        (out, _) = self._extract(data)
+        self.assertEqual(out, stored)
+
+        (out, _) = self._extract(data, pipe=True)
+        self.assertEqual(out, decoded)
@@ -0,0 +1,121 @@
+#
+# Copyright 2019 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from unittest import TestCase
+
+from io import RawIOBase
+
+from mediagrains.tools._file_or_pipe import InputStreamWrapper
+
+
+TEST_DATA = bytes(x % 251 for x in range(0, 1000))
+
+
+class ShortReadStream (RawIOBase):
+    """A forward-only stream which returns at most `max_read` bytes from each call, like a pipe"""
+    def __init__(self, data: bytes, max_read: int = 7):
+        self._data = data
+        self._pos = 0
+        self._max_read = max_read
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def readinto(self, b):
+        n = min(len(b), self._max_read, len(self._data) - self._pos)
+        b[:n] = self._data[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.readall()
+        out = bytearray(min(size, self._max_read))
+        n = self.readinto(out)
+        return bytes(out[:n])
+
+    def readall(self):
+        out = self._data[self._pos:]
+        self._pos = len(self._data)
+        return out
+
+
+class TestInputStreamWrapper (TestCase):
+    def test_read(self):
+        stream = InputStreamWrapper(ShortReadStream(TEST_DATA))
+
+        self.assertEqual(stream.read(100), TEST_DATA[:100])
+        self.assertEqual(stream.tell(), 100)
+        self.assertEqual(stream.read(3), TEST_DATA[100:103])
+        self.assertEqual(stream.tell(), 103)
+        self.assertEqual(stream.read(), TEST_DATA[103:])
+        self.assertEqual(stream.tell(), len(TEST_DATA))
+
+    def test_read_past_end(self):
+        stream = InputStreamWrapper(ShortReadStream(TEST_DATA))
+        stream.read(990)
+
+        with self.assertRaises(EOFError):
+            stream.read(20)
+        self.assertEqual(stream.tell(), len(TEST_DATA))
+
+    def test_readinto(self):
+        stream = InputStreamWrapper(ShortReadStream(TEST_DATA))
+
+        b = bytearray(100)
+        self.assertEqual(stream.readinto(b), 100)
+        self.assertEqual(bytes(b), TEST_DATA[:100])
+        self.assertEqual(stream.tell(), 100)
+
+        b = bytearray(1000)
+        self.assertEqual(stream.readinto(b), 900)
+        self.assertEqual(bytes(b[:900]), TEST_DATA[100:])
+        self.assertEqual(stream.tell(), len(TEST_DATA))
+        self.assertEqual(stream.readinto(b), 0)
+
+    def test_seek_forwards(self):
+        stream = InputStreamWrapper(ShortReadStream(TEST_DATA), skip_chunk_size=16)
+
+        self.assertEqual(stream.seek(100), 100)
+        self.assertEqual(stream.tell(), 100)
+        self.assertEqual(stream.read(10), TEST_DATA[100:110])
+
+        self.assertEqual(stream.seek(45, 1), 155)
+        self.assertEqual(stream.read(10), TEST_DATA[155:165])
+
+        self.assertEqual(stream.seek(165), 165)
+        self.assertEqual(stream.read(10), TEST_DATA[165:175])
+
+    def test_seek_past_end(self):
+        stream = InputStreamWrapper(ShortReadStream(TEST_DATA), skip_chunk_size=16)
+
+        self.assertEqual(stream.seek(2000), len(TEST_DATA))
+        self.assertEqual(stream.tell(), len(TEST_DATA))
+        self.assertEqual(stream.read(), b"")
+
+    def test_seek_backwards_fails(self):
+        stream = InputStreamWrapper(ShortReadStream(TEST_DATA))
+        stream.read(100)
+
+        with self.assertRaises(NotImplementedError):
+            stream.seek(50)
+        with self.assertRaises(NotImplementedError):
+            stream.seek(-1, 1)
+        with self.assertRaises(NotImplementedError):
+            stream.seek(0, 2)
@@ -19,24 +19,35 @@ from unittest import IsolatedAsyncioTestCase, mock
 from uuid import UUID
 from mediagrains.grains import VideoGrain, AudioGrain, CodedVideoGrain, CodedAudioGrain, EventGrain
 from mediagrains.grains import GrainFactory as Grain
-from mediagrains.gsf import loads, load, dumps
+from mediagrains.gsf import loads, load, dumps, scan_headers, parallel_decode, remux, merge, GSF_HEADER_DTYPE
+from mediagrains.gsf import GSF_GRAIN_TYPES
 from mediagrains.gsf import GSFEncoder, GSFDecoder, SyncGSFBlock, AsyncGSFBlock, GrainDataLoadingMode
+from mediagrains.gsf import GSFEncoderSegment, GSFRollingEncoder, GSFSyncDecoderSession
+from mediagrains.gsf import GrainMetadataParts
+from mediagrains.gsf import GSFIndex
+from mediagrains.utils import GrainDataCache, GrainBufferPool
 from mediagrains.gsf import GSFDecodeError
 from mediagrains.gsf import GSFEncodeError
 from mediagrains.gsf import GSFDecodeBadVersionError
 from mediagrains.gsf import GSFDecodeBadFileTypeError
 from mediagrains.gsf import GSFEncodeAddToActiveDump
-from mediagrains.gsf import _ensure_utc_datetime
+from mediagrains.gsf import _ensure_utc_datetime, FileRangeCopier
 from mediagrains.comparison import compare_grain, compare_grains_pairwise
 from mediagrains.cogenums import CogFrameFormat, CogFrameLayout, CogAudioFormat
-from mediatimestamp.immutable import Timestamp, TimeOffset
+from mediatimestamp.immutable import Timestamp, TimeOffset, TimeRange
 from datetime import datetime, timezone
 from fractions import Fraction
-from io import BytesIO
-from mediagrains.utils.asyncbinaryio import AsyncBytesIO
+from io import BytesIO, SEEK_END
+from mediagrains.utils.asyncbinaryio import AsyncBytesIO, AsyncFileWrapper, OpenAsyncBytesIO
 from frozendict import frozendict
 from os import SEEK_SET
+from tempfile import TemporaryDirectory
+import asyncio
 import json
+import os
+import threading
+import time
+import numpy as np
 
 from .fixtures import suppress_deprecation_warnings
 
@@ -84,6 +95,35 @@ with open('examples/concat_coded_video_9.gsf', 'rb') as f:
     CONCAT_CODED_VIDEO_DATA_9 = f.read()
 
 
+def _two_segment_gsf_data(count=10, **kwargs):
+    """Build a file with an audio segment (local id 1) and an event segment (local id 2), with the grains of the
+    two segments interleaved and the event grains lagging the audio grains by five grains. Other keyword arguments
+    (including other `segments` with those local ids) are passed to the GSFEncoder"""
+    src_id = UUID('e14e9d58-1567-11e8-8dd3-831a068eb034')
+    audio_flow_id = UUID('ee1eed58-1567-11e8-a971-3b901a2dd8ab')
+    event_flow_id = UUID('8f36ab6e-1568-11e8-b0ea-5fbcc1d1a0d0')
+    start_ts = Timestamp(1420102800, 0)
+
+    f = BytesIO()
+    kwargs.setdefault('segments', [{'local_id': 1}, {'local_id': 2}])
+    with GSFEncoder(f, streaming=True, **kwargs) as enc:
+        for n in range(0, count):
+            ots = start_ts + TimeOffset.from_count(n, 25)
+            audio_grain = AudioGrain(src_id=src_id, flow_id=audio_flow_id, origin_timestamp=ots,
+                                     cog_audio_format=CogAudioFormat.S16_INTERLEAVED, channels=2, samples=1920,
+                                     sample_rate=48000)
+            audio_grain.data = bytes([n & 0xFF]) * 7680
+            enc.add_grain(audio_grain, segment_local_id=1)
+
+            ots = start_ts + TimeOffset.from_count(n - 5, 25)
+            event_grain = EventGrain(src_id=src_id, flow_id=event_flow_id, origin_timestamp=ots,
+                                     event_type="urn:x-ipstudio:format:event.test", topic="/{}".format(n % 2))
+            event_grain.append("/value", post=n)
+            enc.add_grain(event_grain, segment_local_id=2)
+
+    return f.getvalue()
+
+
 class TestGSFDumps(IsolatedAsyncioTestCase):
     def test_dumps_no_grains(self):
         uuids = [UUID('7920b394-1565-11e8-86e0-8b42d4647ba8'), UUID('80af875c-1565-11e8-8f44-87ef081b48cd')]
@@ -1261,6 +1301,162 @@ class TestGSFDumps(IsolatedAsyncioTestCase):
         self.assertEqual(len(segments2[1]), 2)
         self.assertEqual(len(segments3[1]), 2)
 
+    def test_dump_progressively_writes_grain_data_without_copying(self):
+        class RecordingBytesIO(BytesIO):
+            def __init__(self):
+                super().__init__()
+                self.parts = []
+
+            def writelines(self, parts):
+                parts = list(parts)
+                self.parts.extend(parts)
+                super().writelines(parts)
+
+        src_id = UUID('e14e9d58-1567-11e8-8dd3-831a068eb034')
+        flow_id = UUID('ee1eed58-1567-11e8-a971-3b901a2dd8ab')
+        grain = VideoGrain(src_id=src_id, flow_id=flow_id, cog_frame_format=CogFrameFormat.U8_420, width=480,
+                           height=270)
+        grain.data[:] = bytes(range(256)) * (len(grain.data) // 256) + bytes(len(grain.data) % 256)
+
+        file = RecordingBytesIO()
+        with GSFEncoder(file, streaming=True, segments=[{}]) as enc:
+            enc.add_grain(grain)
+            self.assertTrue(any(part is grain.data for part in file.parts))
+
+        (head, segments) = loads(file.getvalue())
+        self.assertEqual(len(segments[1]), 1)
+        self.assertEqual(bytes(segments[1][0].data), bytes(grain.data))
+
+    def test_dumps_reuses_header_templates(self):
+        src_id = UUID('e14e9d58-1567-11e8-8dd3-831a068eb034')
+        flow_id = UUID('ee1eed58-1567-11e8-a971-3b901a2dd8ab')
+        start_ts = Timestamp(1420102800, 0)
+
+        grains = []
+        for n in range(0, 6):
+            grain = AudioGrain(src_id=src_id, flow_id=flow_id, origin_timestamp=start_ts + TimeOffset.from_count(n, 25),
+                               cog_audio_format=CogAudioFormat.S16_INTERLEAVED, channels=2, samples=1920,
+                               sample_rate=48000)
+            grain.data = bytes([n]) * 7680
+            grains.append(grain)
+
+        # Timelabels are per-grain so don't need a new template, but a change in samples does
+        grains[2].add_timelabel('tmp', 7, Fraction(25, 1))
+        grains[4].samples = 960
+        grains[4].data = bytes([4]) * 3840
+
+        original = GSFEncoderSegment._encode_header_template
+        with mock.patch.object(GSFEncoderSegment, "_encode_header_template", autospec=True,
+                               side_effect=original) as encode_header_template:
+            data = dumps(grains)
+
+        self.assertEqual(encode_header_template.call_count, 3)
+
+        (head, segments) = loads(data)
+        self.assertEqual(len(segments[1]), 6)
+        for (decoded, grain) in zip(segments[1], grains):
+            self.assertTrue(compare_grain(grain, decoded), msg=str(compare_grain(grain, decoded)))
+
+    def _write_behind_grains(self, count):
+        src_id = UUID('e14e9d58-1567-11e8-8dd3-831a068eb034')
+        flow_id = UUID('ee1eed58-1567-11e8-a971-3b901a2dd8ab')
+        start_ts = Timestamp(1420102800, 0)
+
+        grains = []
+        for n in range(0, count):
+            grain = AudioGrain(src_id=src_id, flow_id=flow_id, origin_timestamp=start_ts + TimeOffset.from_count(n, 25),
+                               cog_audio_format=CogAudioFormat.S16_INTERLEAVED, channels=2, samples=1920,
+                               sample_rate=48000)
+            grain.data = bytes([n]) * 7680
+            grains.append(grain)
+        return grains
+
+    async def test_async_encode_write_behind(self):
+        class GatedAsyncBytesIO(OpenAsyncBytesIO):
+            def __init__(self):
+                super().__init__(b"")
+                self.gate = asyncio.Event()
+                self.gate.set()
+
+            async def write(self, b):
+                await self.gate.wait()
+                return await super().write(b)
+
+        grains = self._write_behind_grains(5)
+        file_id = UUID('7920b394-1565-11e8-86e0-8b42d4647ba8')
+        segment_id = UUID('80af875c-1565-11e8-8f44-87ef081b48cd')
+        created = datetime(1983, 3, 29, 15, 15, tzinfo=timezone.utc)
+
+        expected = BytesIO()
+        with GSFEncoder(expected, id=file_id, created=created, streaming=True, segments=[{'id': segment_id}]) as enc:
+            enc.add_grains(grains)
+
+        file = GatedAsyncBytesIO()
+        async with GSFEncoder(file, id=file_id, created=created, streaming=True, segments=[{'id': segment_id}],
+                              write_queue_size=2) as enc:
+            file.gate.clear()
+
+            # The first grain is taken off the queue by the writer, which then waits, so two more fill the queue
+            await enc.add_grains(grains[:3])
+            await asyncio.sleep(0)
+            self.assertEqual(enc.pending_writes, 2)
+
+            # With the queue full adding another grain waits for the writer
+            add = asyncio.ensure_future(enc.add_grains(grains[3:]))
+            await asyncio.sleep(0.05)
+            self.assertFalse(add.done())
+
+            file.gate.set()
+            await add
+
+        self.assertEqual(file.getvalue(), expected.getvalue())
+
+    async def test_async_encode_write_behind_raises_write_errors(self):
+        class FailingAsyncBytesIO(OpenAsyncBytesIO):
+            def __init__(self):
+                super().__init__(b"")
+                self.fail = False
+
+            async def write(self, b):
+                if self.fail:
+                    raise OSError("Disk full")
+                return await super().write(b)
+
+        grains = self._write_behind_grains(3)
+
+        file = FailingAsyncBytesIO()
+        with self.assertRaises(OSError):
+            async with GSFEncoder(file, streaming=True, segments=[{}], write_queue_size=1) as enc:
+                file.fail = True
+                for grain in grains:
+                    await enc.add_grain(grain)
+                    await asyncio.sleep(0)
+
+    async def test_async_encode_write_behind_raises_write_errors_once(self):
+        class FailingAsyncBytesIO(OpenAsyncBytesIO):
+            def __init__(self):
+                super().__init__(b"")
+                self.fail = False
+
+            async def write(self, b):
+                if self.fail:
+                    raise OSError("Disk full")
+                return await super().write(b)
+
+        grains = self._write_behind_grains(3)
+
+        file = FailingAsyncBytesIO()
+        async with GSFEncoder(file, streaming=True, segments=[{}], write_queue_size=1) as enc:
+            file.fail = True
+            with self.assertRaises(OSError):
+                for grain in grains:
+                    await enc.add_grain(grain)
+                    await asyncio.sleep(0)
+
+            # Later grains can't be written, but the error which was handled isn't raised again on exit
+            with self.assertRaises(GSFEncodeError):
+                await enc.add_grain(grains[0])
+
     @suppress_deprecation_warnings
     def test_end_dump_without_start_does_nothing(self):
         uuids = [UUID('7920b394-1565-11e8-86e0-8b42d4647ba8'),
@@ -1429,6 +1625,89 @@ class TestGSFDumps(IsolatedAsyncioTestCase):
         self.assertEqual(expected, _ensure_utc_datetime(value))
 
 
+class TestGSFRollingEncoder(IsolatedAsyncioTestCase):
+    def test_rolls_over_on_size(self):
+        (head, grains) = loads(_two_segment_gsf_data(), loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)
+        closed = []
+
+        with TemporaryDirectory() as tmpdir:
+            with GSFRollingEncoder(os.path.join(tmpdir, "chunk{:03d}.gsf"), max_size=30000,
+                                   segments=[{'local_id': 1, 'tags': [('kind', 'audio')]}, {'local_id': 2}],
+                                   tags=[('potato', 'harvest')], on_file_closed=closed.append) as enc:
+                enc.segments[2].add_flow(src_id=grains[2][0].source_id, flow_id=grains[2][0].flow_id,
+                                         format="urn:x-nmos:format:data", data="{}")
+                for (audio_grain, event_grain) in zip(grains[1], grains[2]):
+                    enc.add_grain(audio_grain, segment_local_id=1)
+                    enc.add_grain(event_grain, segment_local_id=2)
+
+            self.assertEqual(enc.paths, [os.path.join(tmpdir, "chunk{:03d}.gsf".format(n)) for n in range(0, 3)])
+            self.assertEqual(closed, enc.paths)
+
+            decoded: dict = {1: [], 2: []}
+            for path in enc.paths:
+                with open(path, "rb") as f:
+                    data = f.read()
+                (file_head, file_grains) = loads(data)
+
+                if path != enc.paths[-1]:
+                    self.assertGreaterEqual(len(data), 30000)
+                self.assertEqual(file_head['tags'], [('potato', 'harvest')])
+                self.assertEqual([(seg['local_id'], seg['id']) for seg in file_head['segments']],
+                                 [(local_id, seg.id) for (local_id, seg) in enc.segments.items()])
+                self.assertEqual(file_head['segments'][0]['tags'], [('kind', 'audio')])
+                self.assertEqual(file_head['segments'][1]['flow']['format'], "urn:x-nmos:format:data")
+                for seg in file_head['segments']:
+                    self.assertEqual(seg['count'], len(file_grains[seg['local_id']]))
+                    decoded[seg['local_id']].extend(file_grains[seg['local_id']])
+
+        for local_id in (1, 2):
+            self.assertEqual([grain.origin_timestamp for grain in decoded[local_id]],
+                             [grain.origin_timestamp for grain in grains[local_id]])
+
+    def test_rolls_over_on_duration(self):
+        (head, grains) = loads(_two_segment_gsf_data(), loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)
+
+        with TemporaryDirectory() as tmpdir:
+            with GSFRollingEncoder(lambda n: os.path.join(tmpdir, "{}.gsf".format(n)),
+                                   max_duration=TimeOffset.from_count(4, 25)) as enc:
+                enc.add_grains(grains[1])
+
+                with self.assertRaises(GSFEncodeError):
+                    enc.add_grain(grains[2][0], segment_local_id=2)
+
+            counts = []
+            for path in enc.paths:
+                with open(path, "rb") as f:
+                    (file_head, file_grains) = load(f)
+                counts.append(len(file_grains[1]))
+                self.assertEqual(file_head['segments'][0]['count'], len(file_grains[1]))
+
+        self.assertEqual(counts, [4, 4, 2])
+
+    def test_closes_file_when_encoder_fails(self):
+        (head, grains) = loads(_two_segment_gsf_data(), loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)
+        opened = []
+
+        def _open(*args, **kwargs):
+            opened.append(open(*args, **kwargs))
+            return opened[-1]
+
+        with TemporaryDirectory() as tmpdir:
+            with mock.patch("mediagrains.gsf.open", _open, create=True):
+                enc = GSFRollingEncoder(os.path.join(tmpdir, "{}.gsf"), potato=True)
+                with self.assertRaises(TypeError):
+                    enc.add_grain(grains[1][0])
+
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].closed)
+        self.assertEqual(enc.paths, [])
+
+    def test_rejects_streaming(self):
+        with TemporaryDirectory() as tmpdir:
+            with self.assertRaises(TypeError):
+                GSFRollingEncoder(os.path.join(tmpdir, "{}.gsf"), streaming=False)
+
+
 class TestGSFBlock(IsolatedAsyncioTestCase):
     """Test the GSF decoder block handler correctly parses various types"""
 
@@ -2084,6 +2363,492 @@ class TestGSFDecoder(IsolatedAsyncioTestCase):
                 self.assertEqual(bytes_read, grain_data_size)
                 self.assertEqual(grain.length, grain_data_size)
 
+    def test_memory_mapped_grain_data(self):
+        """Test that the MEMORY_MAP_IF_POSSIBLE mode gives grains views onto the input buffer without reading it"""
+        grain_data_size = 194400  # Parsed from examples/video.gsf hex dump
+
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            grains = [grain for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+
+        video_data_stream = BytesIO(VIDEO_DATA_8)
+        reader_mock = mock.MagicMock(side_effect=video_data_stream.read)
+        with mock.patch.object(video_data_stream, "read", new=reader_mock):
+            with GSFDecoder(file_data=video_data_stream) as dec:
+                reader_mock.reset_mock()
+
+                for (n, (grain, local_id)) in enumerate(
+                        dec.grains(loading_mode=GrainDataLoadingMode.MEMORY_MAP_IF_POSSIBLE)):
+                    bytes_read = 0
+                    for args, _ in reader_mock.call_args_list:
+                        bytes_read += args[0]
+                    reader_mock.reset_mock()
+
+                    self.assertLess(bytes_read, grain_data_size)
+                    self.assertIsInstance(grain.data, memoryview)
+                    self.assertTrue(grain.data.readonly)
+                    self.assertEqual(grain.length, grain_data_size)
+                    self.assertEqual(bytes(grain.data), bytes(grains[n].data))
+
+    def test_memory_mapped_grain_data_from_file(self):
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            grains = [grain for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "video.gsf")
+            with open(path, "wb") as f:
+                f.write(VIDEO_DATA_8)
+
+            with open(path, "rb") as f:
+                with GSFDecoder(file_data=f) as dec:
+                    mapped_grains = [
+                        grain for (grain, local_id) in dec.grains(
+                            loading_mode=GrainDataLoadingMode.MEMORY_MAP_IF_POSSIBLE)]
+
+            self.assertEqual(len(mapped_grains), 10)
+            for (grain, mapped_grain) in zip(grains, mapped_grains):
+                self.assertIsInstance(mapped_grain.data, memoryview)
+                self.assertEqual(bytes(grain.data), bytes(mapped_grain.data))
+
+    def test_memory_mapped_grain_data_does_not_lock_bytesio(self):
+        video_data_stream = BytesIO(VIDEO_DATA_8)
+
+        with GSFDecoder(file_data=video_data_stream) as dec:
+            grains = [grain for (grain, local_id) in dec.grains(
+                loading_mode=GrainDataLoadingMode.MEMORY_MAP_IF_POSSIBLE)]
+
+        # The views onto the grain data don't stop the BytesIO being changed or closed, and aren't changed by it
+        expected = [bytes(grain.data) for grain in grains]
+        video_data_stream.seek(0)
+        video_data_stream.write(bytes(len(VIDEO_DATA_8)))
+        video_data_stream.close()
+        self.assertEqual([bytes(grain.data) for grain in grains], expected)
+
+    def test_memory_map_grows_with_file(self):
+        data_stream = BytesIO(VIDEO_DATA_8[:1000])
+
+        with GSFDecoder(file_data=data_stream) as dec:
+            # A region past the end of the file can't be mapped yet, but can be once the file has grown
+            self.assertIsNone(dec._mapped_data(data_stream, 500, 1000))
+            data_stream.seek(0, SEEK_END)
+            data_stream.write(VIDEO_DATA_8[1000:])
+            self.assertEqual(bytes(dec._mapped_data(data_stream, 500, 1000)), VIDEO_DATA_8[500:1500])
+
+    async def test_async_memory_mapped_grain_data(self):
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            grains = [grain for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+
+        async with GSFDecoder(file_data=AsyncFileWrapper(BytesIO(VIDEO_DATA_8))) as dec:
+            mapped_grains = [
+                grain async for (grain, local_id) in dec.grains(
+                    loading_mode=GrainDataLoadingMode.MEMORY_MAP_IF_POSSIBLE)]
+
+        self.assertEqual(len(mapped_grains), 10)
+        for (grain, mapped_grain) in zip(grains, mapped_grains):
+            self.assertIsInstance(mapped_grain.data, memoryview)
+            self.assertEqual(bytes(grain.data), bytes(mapped_grain.data))
+
+    def test_load_grains_coalesces_reads(self):
+        video_data_stream = BytesIO(VIDEO_DATA_8)
+
+        with GSFDecoder(file_data=video_data_stream) as dec:
+            grains = [grain for (grain, local_id) in dec.grains()]
+            pos = video_data_stream.tell()
+
+            reader_mock = mock.MagicMock(side_effect=video_data_stream.read)
+            with mock.patch.object(video_data_stream, "read", new=reader_mock):
+                dec.load_grains(grains[2:8])
+                self.assertEqual(reader_mock.call_count, 1)
+                self.assertEqual(video_data_stream.tell(), pos)
+
+                dec.load_grains(grains[2:8], max_read=1)
+                self.assertEqual(reader_mock.call_count, 1)
+
+                dec.load_grains(grains, max_gap=0)
+                self.assertEqual(reader_mock.call_count, 5)
+
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            expected = [grain for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+        for (grain, expected_grain) in zip(grains, expected):
+            self.assertEqual(bytes(grain.data), bytes(expected_grain.data))
+
+    async def test_async_load_grains_coalesces_reads(self):
+        video_data_stream = BytesIO(VIDEO_DATA_8)
+
+        async with GSFDecoder(file_data=AsyncFileWrapper(video_data_stream)) as dec:
+            grains = [grain async for (grain, local_id) in dec.grains()]
+
+            reader_mock = mock.MagicMock(side_effect=video_data_stream.read)
+            with mock.patch.object(video_data_stream, "read", new=reader_mock):
+                await dec.load_grains(grains)
+                self.assertEqual(reader_mock.call_count, 1)
+
+                # Already loaded, so no more reads are needed
+                await dec.load_grains(grains)
+                for grain in grains:
+                    await grain
+                self.assertEqual(reader_mock.call_count, 1)
+
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            expected = [grain for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+        for (grain, expected_grain) in zip(grains, expected):
+            self.assertEqual(bytes(grain.data), bytes(expected_grain.data))
+
+    def test_buffer_provider(self):
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            expected = [grain for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+
+        pool = GrainBufferPool()
+        buffers = []
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            for ((grain, local_id), expected_grain) in zip(
+                    dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY, buffer_provider=pool),
+                    expected):
+                self.assertIsInstance(grain.data, bytearray)
+                self.assertEqual(bytes(grain.data), bytes(expected_grain.data))
+                buffers.append(grain.data)
+                pool.release(grain.data)
+
+        # Every grain is the same size, so the one buffer is recycled
+        self.assertTrue(all(buffer is buffers[0] for buffer in buffers))
+
+    async def test_async_buffer_provider(self):
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            expected = [grain for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+
+        provider = mock.MagicMock(side_effect=bytearray)
+        async with GSFDecoder(file_data=AsyncBytesIO(VIDEO_DATA_8)) as dec:
+            grains = [grain async for (grain, local_id) in dec.grains(
+                loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY, buffer_provider=provider)]
+
+        self.assertEqual(provider.call_count, 10)
+        for (grain, expected_grain) in zip(grains, expected):
+            self.assertIsInstance(grain.data, bytearray)
+            self.assertEqual(bytes(grain.data), bytes(expected_grain.data))
+
+    async def test_async_data_cache(self):
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            expected = [grain for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+        grain_data_size = len(expected[0].data)
+
+        cache = GrainDataCache(3 * grain_data_size)
+        async with GSFDecoder(file_data=AsyncBytesIO(VIDEO_DATA_8), data_cache=cache) as dec:
+            grains = [grain async for (grain, local_id) in dec.grains()]
+
+            for grain in grains:
+                await grain
+            self.assertEqual(len(cache), 3)
+            self.assertEqual(cache.size, 3 * grain_data_size)
+            self.assertIsNone(grains[0].data)
+            self.assertIsNotNone(grains[9].data)
+
+            # Evicted data is loaded again by awaiting the grain
+            await grains[0]
+            self.assertEqual(bytes(grains[0].data), bytes(expected[0].data))
+            self.assertIsNone(grains[7].data)
+
+        # Once the session has exited its grains are no longer in the cache, so using the cache for another session
+        # doesn't evict data which couldn't be loaded again
+        self.assertEqual(len(cache), 0)
+        async with GSFDecoder(file_data=AsyncBytesIO(VIDEO_DATA_8), data_cache=cache) as dec:
+            async for (grain, local_id) in dec.grains():
+                await grain
+            self.assertEqual(len(cache), 3)
+        self.assertEqual(len(cache), 0)
+        for i in [0, 8, 9]:
+            self.assertEqual(bytes(grains[i].data), bytes(expected[i].data))
+
+        # Grains which are to be loaded on exit are still loaded on exit after their data has been evicted
+        cache = GrainDataCache(3 * grain_data_size)
+        async with GSFDecoder(file_data=AsyncBytesIO(VIDEO_DATA_8), data_cache=cache) as dec:
+            grains = [grain async for (grain, local_id) in dec.grains(
+                loading_mode=GrainDataLoadingMode.ALWAYS_LOAD_DEFER_IF_POSSIBLE)]
+            for grain in grains:
+                await grain
+            self.assertIsNone(grains[0].data)
+        self.assertEqual(len(cache), 0)
+        for (grain, expected_grain) in zip(grains, expected):
+            self.assertEqual(bytes(grain.data), bytes(expected_grain.data))
+
+    async def test_async_prefetch(self):
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            grains = [grain for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+
+        for loading_mode in [GrainDataLoadingMode.LOAD_IMMEDIATELY, GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE]:
+            with self.subTest(loading_mode=loading_mode):
+                async with GSFDecoder(file_data=AsyncBytesIO(VIDEO_DATA_8)) as dec:
+                    prefetched_grains = []
+                    async for (grain, local_id) in dec.grains(loading_mode=loading_mode, prefetch=3):
+                        # Loading deferred data here happens while later grains are being read ahead
+                        await grain
+                        prefetched_grains.append(grain)
+
+                self.assertEqual(len(prefetched_grains), 10)
+                for (grain, prefetched_grain) in zip(grains, prefetched_grains):
+                    self.assertEqual(grain.origin_timestamp, prefetched_grain.origin_timestamp)
+                    self.assertEqual(bytes(grain.data), bytes(prefetched_grain.data))
+
+    async def test_async_prefetch_raises_decode_errors(self):
+        data = VIDEO_DATA_8 + b"grai\x12\x00\x00\x00\x01\x00dumy\x08\x00\x00\x00"
+        async with GSFDecoder(file_data=AsyncBytesIO(data)) as dec:
+            with self.assertRaises(GSFDecodeError):
+                async for (grain, local_id) in dec.grains(prefetch=2):
+                    pass
+
+    def _grain_filter_cases(self):
+        """Yield (data, filter kwargs, predicate on grains) cases for the grains() filters"""
+        start_ts = Timestamp(1420102800, 0)
+        timerange = TimeRange(start_ts, start_ts + TimeOffset.from_count(3, 25))
+        yield (_two_segment_gsf_data(), {'grain_types': ["event"]}, lambda g: g.grain_type == "event")
+        yield (_two_segment_gsf_data(), {'timerange': timerange}, lambda g: g.origin_timestamp in timerange)
+        yield (_two_segment_gsf_data(), {'event_topics': ["/1"]}, lambda g: g.grain_type == "event" and g.topic == "/1")
+        yield (_two_segment_gsf_data(), {'grain_types': ["audio"], 'event_topics': ["/1"]}, lambda g: False)
+        yield (CODED_VIDEO_DATA_8, {'key_frames_only': True}, lambda g: g.is_key_frame is True)
+
+    def test_grain_filters(self):
+        for (data, kwargs, predicate) in self._grain_filter_cases():
+            with self.subTest(kwargs=kwargs):
+                with GSFDecoder(file_data=BytesIO(data)) as dec:
+                    grains = list(dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY))
+                    expected = [(grain, local_id) for (grain, local_id) in grains if predicate(grain)]
+
+                for loading_mode in [GrainDataLoadingMode.LOAD_IMMEDIATELY,
+                                     GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE]:
+                    with GSFDecoder(file_data=BytesIO(data)) as dec:
+                        with mock.patch.object(dec, "_decode_gbhd", wraps=dec._decode_gbhd) as decode_gbhd, \
+                                mock.patch.object(dec, "_unpack_gbhd", wraps=dec._unpack_gbhd) as unpack_gbhd:
+                            filtered = list(dec.grains(loading_mode=loading_mode, **kwargs))
+
+                        # Metadata is only decoded for the grains which pass the filters, and each grain header is
+                        # only unpacked once
+                        self.assertEqual(decode_gbhd.call_count, len(expected))
+                        self.assertEqual(unpack_gbhd.call_count, len(grains))
+                        self.assertEqual(len(filtered), len(expected))
+                        for ((grain, local_id), (expected_grain, expected_local_id)) in zip(filtered, expected):
+                            self.assertEqual(local_id, expected_local_id)
+                            comp = compare_grain(expected_grain, grain)
+                            self.assertTrue(comp, msg=str(comp))
+
+    async def test_async_grain_filters(self):
+        for (data, kwargs, predicate) in self._grain_filter_cases():
+            with self.subTest(kwargs=kwargs):
+                with GSFDecoder(file_data=BytesIO(data)) as dec:
+                    expected = [(grain, local_id) for (grain, local_id) in
+                                dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY) if predicate(grain)]
+
+                for prefetch in [0, 2]:
+                    async with GSFDecoder(file_data=AsyncBytesIO(data)) as dec:
+                        filtered = [(grain, local_id) async for (grain, local_id) in dec.grains(
+                            loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY, prefetch=prefetch, **kwargs)]
+
+                    self.assertEqual(len(filtered), len(expected))
+                    for ((grain, local_id), (expected_grain, expected_local_id)) in zip(filtered, expected):
+                        self.assertEqual(local_id, expected_local_id)
+                        comp = compare_grain(expected_grain, grain)
+                        self.assertTrue(comp, msg=str(comp))
+
+    def test_skip_metadata(self):
+        (_, segments) = loads(VIDEO_DATA_8)
+        video_grain = segments[1][0]
+        video_grain.timelabels = [{
+            'tag': 'tiggle',
+            'timelabel': {
+                'frames_since_midnight': 7,
+                'frame_rate_numerator': 300,
+                'frame_rate_denominator': 1,
+                'drop_frame': False
+            }
+        }]
+
+        for data in [dumps([video_grain]), CODED_VIDEO_DATA_8]:
+            (_, segments) = loads(data)
+            expected_meta = segments[1][0].meta
+
+            for skip_metadata in [GrainMetadataParts.TIMELABELS,
+                                  GrainMetadataParts.COMPONENTS,
+                                  GrainMetadataParts.UNIT_OFFSETS,
+                                  GrainMetadataParts.ALL]:
+                with self.subTest(size=len(data), skip_metadata=skip_metadata):
+                    (_, segments) = loads(data, skip_metadata=skip_metadata)
+                    meta = segments[1][0].meta
+
+                    self.assertEqual(meta['grain']['origin_timestamp'], expected_meta['grain']['origin_timestamp'])
+                    self.assertEqual(meta['grain']['grain_type'], expected_meta['grain']['grain_type'])
+                    if GrainMetadataParts.TIMELABELS in skip_metadata:
+                        self.assertNotIn('timelabels', meta['grain'])
+                    else:
+                        self.assertEqual(meta['grain'].get('timelabels'), expected_meta['grain'].get('timelabels'))
+                    if 'cog_frame' in expected_meta['grain']:
+                        if GrainMetadataParts.COMPONENTS in skip_metadata:
+                            self.assertEqual(meta['grain']['cog_frame']['components'], [])
+                        else:
+                            self.assertEqual(meta['grain']['cog_frame'], expected_meta['grain']['cog_frame'])
+                    if 'cog_coded_frame' in expected_meta['grain']:
+                        if GrainMetadataParts.UNIT_OFFSETS in skip_metadata:
+                            self.assertNotIn('unit_offsets', meta['grain']['cog_coded_frame'])
+                        else:
+                            self.assertEqual(meta['grain']['cog_coded_frame'],
+                                             expected_meta['grain']['cog_coded_frame'])
+
+    def _write_gradually(self, path, data, start, delay=0):
+        """Start a thread which appends data[start:] to the file at path a few bytes at a time, after `delay` seconds"""
+        def _writer():
+            time.sleep(delay)
+            with open(path, "ab") as f:
+                for pos in range(start, len(data), 997):
+                    f.write(data[pos:pos + 997])
+                    f.flush()
+                    time.sleep(0.001)
+
+        writer = threading.Thread(target=_writer)
+        writer.start()
+        return writer
+
+    def test_follow(self):
+        data = _two_segment_gsf_data()
+        (_, expected) = loads(data)
+        start = data.index(b"grai") + 100
+
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "live.gsf")
+            with open(path, "wb") as f:
+                f.write(data[:start])
+
+            writer = self._write_gradually(path, data, start)
+            try:
+                with open(path, "rb") as fp:
+                    with GSFDecoder(file_data=fp) as dec:
+                        grains = [(grain, local_id) for (grain, local_id) in
+                                  dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY, follow=True,
+                                             follow_timeout=10)]
+            finally:
+                writer.join()
+
+        for local_id in expected:
+            followed = [grain for (grain, grain_local_id) in grains if grain_local_id == local_id]
+            comp = compare_grains_pairwise(expected[local_id], followed)
+            self.assertTrue(comp, msg=str(comp))
+
+    def test_follow_timeout(self):
+        # Without the terminator block the file is treated as still being written to
+        data = _two_segment_gsf_data()[:-8]
+        last_grain_end = len(data)
+        data += b"grai\x40\x00"
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            grains = list(dec.grains(follow=True, follow_timeout=0.05))
+            self.assertEqual(len(grains), 20)
+            # The session is left at the start of the incomplete block
+            self.assertEqual(dec.file_data.tell(), last_grain_end)
+
+    def test_follow_before_head_block_is_written(self):
+        data = _two_segment_gsf_data()
+        (_, expected) = loads(data)
+        start = 20  # Part of the way through the "head" block
+
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "live.gsf")
+            with open(path, "wb") as f:
+                f.write(data[:start])
+
+            with open(path, "rb") as fp:
+                writer = self._write_gradually(path, data, start, delay=0.1)
+                try:
+                    with GSFDecoder(file_data=fp, follow=True, follow_timeout=10) as dec:
+                        head = dec.file_headers
+                        grains = [(grain, local_id) for (grain, local_id) in
+                                  dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY, follow=True,
+                                             follow_timeout=10)]
+                finally:
+                    writer.join()
+
+        self.assertEqual([seg['local_id'] for seg in head['segments']], [1, 2])
+        self.assertEqual(len(grains), sum(len(grains) for grains in expected.values()))
+
+    def test_follow_head_block_timeout(self):
+        data = _two_segment_gsf_data()
+
+        for length in (0, 6, 20):
+            with self.subTest(length=length):
+                with self.assertRaises(GSFDecodeError):
+                    with GSFDecoder(file_data=BytesIO(data[:length]), follow=True, follow_timeout=0.05):
+                        pass
+
+    def test_follow_partial_concatenated_head_block(self):
+        # The second file's header has only been partly written, which is waited for rather than being an error
+        data = _two_segment_gsf_data()[:-8]
+        data += _two_segment_gsf_data()[:20]
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            grains = list(dec.grains(follow=True, follow_timeout=0.05))
+            self.assertEqual(len(grains), 20)
+
+    async def test_async_follow_before_head_block_is_written(self):
+        data = _two_segment_gsf_data()
+        (_, expected) = loads(data)
+        start = 20
+
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "live.gsf")
+            with open(path, "wb") as f:
+                f.write(data[:start])
+
+            with open(path, "rb") as fp:
+                writer = self._write_gradually(path, data, start, delay=0.1)
+                try:
+                    async with GSFDecoder(file_data=AsyncFileWrapper(fp), follow=True, follow_timeout=10) as dec:
+                        grains = [(grain, local_id) async for (grain, local_id) in
+                                  dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY, follow=True,
+                                             follow_timeout=10)]
+                finally:
+                    writer.join()
+
+        self.assertEqual(len(grains), sum(len(grains) for grains in expected.values()))
+
+    async def test_async_follow(self):
+        data = _two_segment_gsf_data()
+        (_, expected) = loads(data)
+        start = data.index(b"grai") + 100
+
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "live.gsf")
+            with open(path, "wb") as f:
+                f.write(data[:start])
+
+            writer = self._write_gradually(path, data, start)
+            try:
+                with open(path, "rb") as fp:
+                    async with GSFDecoder(file_data=AsyncFileWrapper(fp)) as dec:
+                        grains = [(grain, local_id) async for (grain, local_id) in
+                                  dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY, follow=True,
+                                             follow_timeout=10)]
+            finally:
+                writer.join()
+
+        for local_id in expected:
+            followed = [grain for (grain, grain_local_id) in grains if grain_local_id == local_id]
+            comp = compare_grains_pairwise(expected[local_id], followed)
+            self.assertTrue(comp, msg=str(comp))
+
+    async def test_async_follow_prefetch_deferred(self):
+        # Without the terminator block the file is treated as still being written to, so the prefetcher waits for more
+        # data after the last grain, which mustn't hold up loading the data of the grains already read
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            expected = [grain for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+
+        follow_timeout = 2
+        async with GSFDecoder(file_data=AsyncBytesIO(VIDEO_DATA_8[:-8])) as dec:
+            grains = []
+            async for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.ALWAYS_DEFER_LOAD_IF_POSSIBLE,
+                                                      prefetch=3, follow=True, follow_timeout=follow_timeout):
+                start = time.monotonic()
+                await grain
+                self.assertLess(time.monotonic() - start, follow_timeout / 2)
+                grains.append(grain)
+
+        self.assertEqual(len(grains), 10)
+        for (grain, expected_grain) in zip(grains, expected):
+            self.assertEqual(bytes(grain.data), bytes(expected_grain.data))
+
     @suppress_deprecation_warnings
     def test_lazy_load_grain_data__deprecated(self):
         """Test that the `load_lazily` parameter causes grain data to be seeked over,
@@ -2147,6 +2912,771 @@ class TestGSFDecoder(IsolatedAsyncioTestCase):
 
         self.assertEqual(10, grain_count)  # There are 5 grains in each of the concatenated files
 
+    def test_seek(self):
+        start_ts = Timestamp(1420102800, 0)
+
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            entry = dec.seek(start_ts + TimeOffset.from_nanosec(20000000*4))
+
+            self.assertEqual(entry, dec.index[4])
+            timestamps = [grain.origin_timestamp for (grain, local_id) in dec.grains()]
+            self.assertEqual(timestamps, [start_ts + TimeOffset.from_nanosec(20000000*n) for n in range(4, 10)])
+
+            # Seeking backwards reuses the index
+            with mock.patch.object(dec, "build_index") as build_index:
+                dec.seek(start_ts)
+                build_index.assert_not_called()
+            self.assertEqual(len(list(dec.grains())), 10)
+
+            self.assertIsNone(dec.seek(start_ts + TimeOffset(10)))
+            self.assertEqual(len(list(dec.grains())), 0)
+
+    def test_seek_with_local_id(self):
+        start_ts = Timestamp(1420102800, 0)
+
+        with GSFDecoder(file_data=BytesIO(_two_segment_gsf_data())) as dec:
+            dec.seek(start_ts + TimeOffset.from_count(2, 25), local_id=2)
+            grains = [grain for (grain, local_id) in dec.grains(local_ids=[2])]
+
+        self.assertEqual(len(grains), 3)
+        self.assertEqual(grains[0].origin_timestamp, start_ts + TimeOffset.from_count(2, 25))
+
+    def test_grains_in_range(self):
+        start_ts = Timestamp(1420102800, 0)
+        timerange = TimeRange(start_ts + TimeOffset.from_count(2, 25), start_ts + TimeOffset.from_count(4, 25),
+                              TimeRange.INCLUDE_START)
+        data = _two_segment_gsf_data()
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            grains = [(grain.origin_timestamp, local_id) for (grain, local_id) in dec.grains_in_range(timerange)]
+            self.assertEqual(grains, [(start_ts + TimeOffset.from_count(2, 25), 1),
+                                      (start_ts + TimeOffset.from_count(3, 25), 1),
+                                      (start_ts + TimeOffset.from_count(2, 25), 2),
+                                      (start_ts + TimeOffset.from_count(3, 25), 2)])
+
+            # Decoding stops after the last grain in the range, which is followed by the tenth audio grain
+            self.assertEqual(dec.file_data.tell(), dec.index.entries_for_local_id(1)[9].offset)
+
+            grains = [(grain.origin_timestamp, local_id)
+                      for (grain, local_id) in dec.grains_in_range(timerange, local_ids=[1])]
+            self.assertEqual(grains, [(start_ts + TimeOffset.from_count(2, 25), 1),
+                                      (start_ts + TimeOffset.from_count(3, 25), 1)])
+
+            self.assertEqual(len(list(dec.grains_in_range(TimeRange.eternity()))), 20)
+            self.assertEqual(len(list(dec.grains_in_range(TimeRange.from_start(start_ts + TimeOffset(10))))), 0)
+
+    async def test_async_grains_in_range(self):
+        start_ts = Timestamp(1420102800, 0)
+        timerange = TimeRange(start_ts + TimeOffset.from_count(2, 25), start_ts + TimeOffset.from_count(4, 25),
+                              TimeRange.INCLUDE_START)
+
+        async with GSFDecoder(file_data=AsyncBytesIO(_two_segment_gsf_data())) as dec:
+            grains = [(grain.origin_timestamp, local_id)
+                      async for (grain, local_id) in dec.grains_in_range(
+                          timerange, local_ids=[2], loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+            self.assertEqual(grains, [(start_ts + TimeOffset.from_count(2, 25), 2),
+                                      (start_ts + TimeOffset.from_count(3, 25), 2)])
+
+            entry = await dec.seek(start_ts + TimeOffset.from_count(8, 25))
+            self.assertEqual(entry, dec.index.entries_for_local_id(1)[8])
+            grains = [grain async for (grain, local_id) in dec.grains(local_ids=[1])]
+            self.assertEqual(len(grains), 2)
+
+    def test_grains_in_range_stops_before_other_local_ids(self):
+        start_ts = Timestamp(1420102800, 0)
+        timerange = TimeRange.from_start(start_ts + TimeOffset.from_count(9, 25))
+
+        with GSFDecoder(file_data=BytesIO(_two_segment_gsf_data())) as dec:
+            grains = [(grain.origin_timestamp, local_id)
+                      for (grain, local_id) in dec.grains_in_range(timerange, local_ids=[1])]
+            self.assertEqual(grains, [(start_ts + TimeOffset.from_count(9, 25), 1)])
+
+            # The last audio grain is followed by an event grain, which isn't read
+            self.assertEqual(dec.file_data.tell(), dec.index.entries_for_local_id(2)[9].offset)
+
+    def _concatenated_versions_data(self):
+        """A version 7 audio file followed by a version 8 event file, whose grain headers have different layouts"""
+        data = AUDIO_DATA_7 + EVENT_DATA_8
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            expected = [(grain.grain_type, grain.origin_timestamp, bytes(grain.data))
+                        for (grain, _) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+        return (data, expected)
+
+    def test_seek_concatenated_versions(self):
+        (data, expected) = self._concatenated_versions_data()
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            dec.seek(expected[10][1])
+            self.assertEqual(dec.major, 8)
+            grains = [(grain.grain_type, grain.origin_timestamp, bytes(grain.data))
+                      for (grain, _) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+            self.assertEqual(grains, expected[10:])
+
+            dec.seek(expected[5][1])
+            self.assertEqual(dec.major, 7)
+            grains = [(grain.grain_type, grain.origin_timestamp, bytes(grain.data))
+                      for (grain, _) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+            self.assertEqual(grains, expected[5:])
+
+    def test_seek_concatenated_without_header_offsets(self):
+        (data, expected) = self._concatenated_versions_data()
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            dec.index = GSFIndex(dec.build_index().entries, file_size=len(data))
+
+            # The walk for file headers stops at the grain seeked to
+            entry = dec.seek(expected[5][1])
+            self.assertEqual(dec.major, 7)
+            self.assertFalse(dec._found_all_file_headers)
+            self.assertLessEqual(dec._header_walk_pos, entry.offset)
+
+            dec.seek(expected[10][1])
+            self.assertEqual(dec.major, 8)
+            grains = [(grain.grain_type, grain.origin_timestamp, bytes(grain.data))
+                      for (grain, _) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+            self.assertEqual(grains, expected[10:])
+
+    def test_seek_with_header_offsets_does_not_walk(self):
+        (data, expected) = self._concatenated_versions_data()
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            dec.index = dec.build_index()
+            dec.seek(expected[10][1])
+            self.assertEqual(dec.major, 8)
+            self.assertIsNone(dec._header_walk_pos)
+
+    async def test_async_grains_in_range_concatenated_versions(self):
+        (data, expected) = self._concatenated_versions_data()
+        timerange = TimeRange(expected[12][1], expected[15][1], TimeRange.INCLUSIVE)
+
+        async with GSFDecoder(file_data=AsyncBytesIO(data)) as dec:
+            grains = [(grain.grain_type, grain.origin_timestamp, bytes(grain.data))
+                      async for (grain, _) in dec.grains_in_range(
+                          timerange, loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+            self.assertEqual(grains, expected[12:16])
+
+            await dec.seek(expected[0][1])
+            grains = [grain async for (grain, _) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+            self.assertEqual(len(grains), 20)
+            self.assertEqual(grains[0].grain_type, "audio")
+
+
+class TestGSFIndex(IsolatedAsyncioTestCase):
+    def test_build_index(self):
+        data = _two_segment_gsf_data()
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            index = dec.build_index()
+            grains = [(grain, local_id) for (grain, local_id) in dec.grains(
+                loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+
+        self.assertEqual(len(index), 20)
+        self.assertEqual(index.file_size, len(data))
+        self.assertEqual(index.local_ids, (1, 2))
+        self.assertEqual(len(index.entries_for_local_id(2)), 10)
+
+        for (entry, (grain, local_id)) in zip(index, grains):
+            self.assertEqual(entry.local_id, local_id)
+            self.assertEqual(entry.grain_type, grain.grain_type)
+            self.assertEqual(entry.origin_timestamp, grain.origin_timestamp)
+            self.assertEqual(entry.sync_timestamp, grain.sync_timestamp)
+            self.assertEqual(entry.data_length, grain.length)
+            self.assertEqual(data[entry.offset:entry.offset + 4], b"grai")
+            self.assertEqual(data[entry.data_offset:entry.data_offset + entry.data_length], bytes(grain.data))
+
+    def test_build_index_preserves_position(self):
+        video_data_stream = BytesIO(VIDEO_DATA_8)
+
+        with GSFDecoder(file_data=video_data_stream) as dec:
+            grains = dec.grains()
+            next(grains)
+            pos = video_data_stream.tell()
+
+            index = dec.build_index()
+
+            self.assertEqual(video_data_stream.tell(), pos)
+            self.assertEqual(len(index), 10)
+            self.assertEqual(len(list(grains)), 9)
+
+    def test_build_index_concatenated(self):
+        with GSFDecoder(file_data=BytesIO(CONCAT_CODED_VIDEO_DATA_9)) as dec:
+            index = dec.build_index()
+            self.assertEqual(dec.major, 9)
+
+        self.assertEqual(len(index), 10)
+        for entry in index:
+            self.assertEqual(entry.grain_type, "coded_video")
+
+    def test_build_index_version_7(self):
+        with GSFDecoder(file_data=BytesIO(AUDIO_DATA_7)) as dec:
+            index = dec.build_index()
+
+        self.assertEqual(len(index), 10)
+        self.assertEqual(index[0].origin_timestamp, Timestamp(1420102800, 0))
+
+    async def test_async_build_index(self):
+        data = _two_segment_gsf_data()
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            index = dec.build_index()
+
+        async with GSFDecoder(file_data=AsyncBytesIO(data)) as dec:
+            async_index = await dec.build_index()
+
+        self.assertEqual(async_index.entries, index.entries)
+        self.assertEqual(async_index.file_size, index.file_size)
+
+    def test_find(self):
+        start_ts = Timestamp(1420102800, 0)
+
+        with GSFDecoder(file_data=BytesIO(_two_segment_gsf_data())) as dec:
+            index = dec.build_index()
+
+        # The event grains lag the audio grains by five grains, so the first event grain at this time is further
+        # into the file than the first audio grain.
+        ts = start_ts + TimeOffset.from_count(2, 25)
+        self.assertEqual(index.find(ts), index.entries_for_local_id(1)[2])
+        self.assertEqual(index.find(ts, local_id=1), index.entries_for_local_id(1)[2])
+        self.assertEqual(index.find(ts, local_id=2), index.entries_for_local_id(2)[7])
+
+        self.assertEqual(index.find(start_ts - TimeOffset(10)), index[0])
+        self.assertIsNone(index.find(start_ts + TimeOffset(10)))
+        self.assertIsNone(index.find(start_ts, local_id=3))
+
+    def test_dumps_and_loads(self):
+        with GSFDecoder(file_data=BytesIO(_two_segment_gsf_data())) as dec:
+            index = dec.build_index()
+
+        loaded_index = GSFIndex.loads(index.dumps())
+
+        self.assertEqual(loaded_index.entries, index.entries)
+        self.assertEqual(loaded_index.file_size, index.file_size)
+
+        index.file_mtime = 1234567890123456789
+        self.assertEqual(GSFIndex.loads(index.dumps()).file_mtime, index.file_mtime)
+
+    def test_loads_version_1_0(self):
+        with GSFDecoder(file_data=BytesIO(_two_segment_gsf_data())) as dec:
+            index = dec.build_index()
+
+        # Version 1.0 has no modification time or file header offsets
+        index_data = index.dumps()
+        index_data = index_data[:10] + b"\x00\x00" + index_data[12:GSFIndex._HEADER.size] + index_data[
+            GSFIndex._HEADER.size + GSFIndex._MTIME.size:-2*GSFIndex._COUNT.size]
+        loaded_index = GSFIndex.loads(index_data)
+
+        self.assertEqual(loaded_index.entries, index.entries)
+        self.assertEqual(loaded_index.file_mtime, 0)
+        self.assertIsNone(loaded_index.header_offsets)
+
+    def test_header_offsets(self):
+        with GSFDecoder(file_data=BytesIO(AUDIO_DATA_7 + EVENT_DATA_8)) as dec:
+            index = dec.build_index()
+
+        self.assertEqual(index.header_offsets, (0, len(AUDIO_DATA_7)))
+        self.assertEqual(GSFIndex.loads(index.dumps()).header_offsets, index.header_offsets)
+        self.assertEqual(GSFIndex._from_block(index.dumps_block(), index.file_size).header_offsets,
+                         index.header_offsets)
+        self.assertEqual(len(index.dumps_block()), GSFIndex.block_size(len(index), 2))
+
+        self.assertEqual(GSFIndex.load_from_gsf(BytesIO(_two_segment_gsf_data(index=True))).header_offsets, (0,))
+
+    def test_loads_rejects_bad_files(self):
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            index_data = dec.build_index().dumps()
+
+        with self.assertRaises(GSFDecodeBadFileTypeError):
+            GSFIndex.loads(VIDEO_DATA_8)
+
+        with self.assertRaises(GSFDecodeBadVersionError):
+            GSFIndex.loads(index_data[:8] + b"\x02\x00" + index_data[10:])
+
+        with self.assertRaises(GSFDecodeError):
+            GSFIndex.loads(index_data[:-1])
+
+    def test_for_file_uses_sidecar(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "video.gsf")
+            with open(path, "wb") as f:
+                f.write(VIDEO_DATA_8)
+
+            index = GSFIndex.for_file(path)
+            self.assertTrue(os.path.exists(GSFIndex.sidecar_path(path)))
+
+            with mock.patch.object(GSFIndex, "build") as build:
+                self.assertEqual(GSFIndex.for_file(path).entries, index.entries)
+                build.assert_not_called()
+
+            # A change in file size means the sidecar is stale
+            with open(path, "ab") as f:
+                f.write(b"\x00" * 8)
+            self.assertEqual(GSFIndex.for_file(path).file_size, len(VIDEO_DATA_8) + 8)
+
+            # So does a change in modification time, as when the file is rewritten at the same size
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1000000000))
+            with mock.patch.object(GSFIndex, "build", wraps=GSFIndex.build) as build:
+                GSFIndex.for_file(path)
+                build.assert_called_once()
+            with mock.patch.object(GSFIndex, "build") as build:
+                GSFIndex.for_file(path)
+                build.assert_not_called()
+
+    def test_in_file_index(self):
+        data = _two_segment_gsf_data(index=True)
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            built_index = dec.build_index()
+            grains = list(dec.grains())
+
+        index = GSFIndex.load_from_gsf(BytesIO(data))
+
+        self.assertIsNotNone(index)
+        self.assertEqual(index.entries, built_index.entries)
+        self.assertEqual(index.file_size, len(data))
+        self.assertEqual(len(grains), 20)
+        self.assertEqual(data[-8:], b"grai\x00\x00\x00\x00")
+
+        # Files written without an index don't have one
+        self.assertIsNone(GSFIndex.load_from_gsf(BytesIO(_two_segment_gsf_data())))
+        self.assertIsNone(GSFIndex.load_from_gsf(BytesIO(VIDEO_DATA_8)))
+
+    def test_in_file_index_all_at_once(self):
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            grains = [grain for (grain, _) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+
+        data = dumps(grains, index=True)
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            built_index = dec.build_index()
+
+        index = GSFIndex.load_from_gsf(BytesIO(data))
+        self.assertIsNotNone(index)
+        self.assertEqual(len(index), 10)
+        self.assertEqual(index.entries, built_index.entries)
+
+    def test_in_file_index_ignored_when_stale(self):
+        data = _two_segment_gsf_data(index=True)
+
+        self.assertIsNone(GSFIndex.load_from_gsf(BytesIO(data + CONCAT_CODED_VIDEO_DATA_9)))
+        self.assertIsNone(GSFIndex.load_from_gsf(BytesIO(data[:-1])))
+
+    def test_seek_uses_in_file_index(self):
+        data = _two_segment_gsf_data(index=True)
+        start_ts = Timestamp(1420102800, 0)
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            with mock.patch.object(dec, "build_index") as build_index:
+                entry = dec.seek(start_ts + TimeOffset.from_count(2, 25), local_id=1)
+                build_index.assert_not_called()
+
+            (grain, local_id) = next(iter(dec.grains()))
+
+        self.assertEqual(entry.offset, dec.index.entries_for_local_id(1)[2].offset)
+        self.assertEqual(local_id, 1)
+        self.assertEqual(grain.origin_timestamp, start_ts + TimeOffset.from_count(2, 25))
+
+    def test_for_file_uses_in_file_index(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "indexed.gsf")
+            with open(path, "wb") as f:
+                f.write(_two_segment_gsf_data(index=True))
+
+            with mock.patch.object(GSFIndex, "build") as build:
+                self.assertEqual(len(GSFIndex.for_file(path)), 20)
+                build.assert_not_called()
+            self.assertFalse(os.path.exists(GSFIndex.sidecar_path(path)))
+
+    async def test_async_in_file_index(self):
+        with GSFDecoder(file_data=BytesIO(VIDEO_DATA_8)) as dec:
+            grains = [grain for (grain, _) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+
+        f = AsyncBytesIO()
+        async with GSFEncoder(f, segments=[{}], index=True, streaming=True) as enc:
+            await enc.add_grains(grains)
+        data = f.getvalue()
+
+        async with GSFDecoder(file_data=AsyncBytesIO(data)) as dec:
+            index = await dec.read_index()
+            built_index = await dec.build_index()
+
+        self.assertIsNotNone(index)
+        self.assertEqual(index.entries, built_index.entries)
+        self.assertEqual(index.file_size, len(data))
+
+        async with GSFDecoder(file_data=AsyncBytesIO(VIDEO_DATA_8)) as dec:
+            self.assertIsNone(await dec.read_index())
+
+
+class TestGSFScanHeaders(IsolatedAsyncioTestCase):
+    def assertHeadersMatchGrains(self, data):
+        segments = scan_headers(BytesIO(data))
+        (head, grains) = loads(data)
+
+        self.assertEqual(sorted(segments.keys()), sorted(grains.keys()))
+        for (local_id, headers) in segments.items():
+            self.assertEqual(headers.dtype, GSF_HEADER_DTYPE)
+            self.assertEqual(len(headers), len(grains[local_id]))
+            for (row, grain) in zip(headers, grains[local_id]):
+                (offset, data_offset, data_length) = (int(row['offset']), int(row['data_offset']),
+                                                      int(row['data_length']))
+                self.assertEqual(data[offset:offset + 4], b"grai")
+                self.assertEqual(int(row['origin_timestamp']), grain.origin_timestamp.to_nanosec())
+                self.assertEqual(int(row['sync_timestamp']), grain.sync_timestamp.to_nanosec())
+                self.assertEqual(Fraction(int(row['rate_numerator']), int(row['rate_denominator'])), grain.rate)
+                self.assertEqual(Fraction(int(row['duration_numerator']), int(row['duration_denominator'])),
+                                 grain.duration)
+                self.assertEqual(GSF_GRAIN_TYPES[row["grain_type"]], grain.grain_type)
+                self.assertEqual(data_length, grain.length)
+                self.assertEqual(data[data_offset:data_offset + data_length], bytes(grain.data))
+                header = {"video": "cog_frame", "coded_video": "cog_coded_frame",
+                          "audio": "cog_audio", "coded_audio": "cog_coded_audio"}.get(grain.grain_type)
+                if header is not None:
+                    self.assertEqual(int(row['format']), grain.meta['grain'][header]['format'])
+                if grain.grain_type in ("audio", "coded_audio"):
+                    self.assertEqual(int(row['samples']), grain.samples)
+                    self.assertEqual(int(row['sample_rate']), grain.sample_rate)
+                else:
+                    self.assertEqual((int(row['samples']), int(row['sample_rate'])), (0, 0))
+                if grain.grain_type == "coded_video" and grain.is_key_frame is not None:
+                    self.assertEqual(int(row['is_key_frame']), int(grain.is_key_frame))
+                else:
+                    self.assertEqual(int(row['is_key_frame']), -1)
+
+    def test_scan_headers(self):
+        for data in [VIDEO_DATA_7, VIDEO_DATA_8, CODED_VIDEO_DATA_8, CODED_VIDEO_DATA_9, AUDIO_DATA_8,
+                     CODED_AUDIO_DATA_8, EVENT_DATA_8, CONCAT_CODED_VIDEO_DATA_9, _two_segment_gsf_data()]:
+            with self.subTest(size=len(data)):
+                self.assertHeadersMatchGrains(data)
+
+    def test_scan_headers_from_path_with_local_ids(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "interleaved.gsf")
+            with open(path, "wb") as f:
+                f.write(_two_segment_gsf_data())
+
+            segments = scan_headers(path, local_ids=[2])
+
+        self.assertEqual(list(segments.keys()), [2])
+        self.assertEqual(len(segments[2]), 10)
+        self.assertTrue((segments[2]['grain_type'] == GSF_GRAIN_TYPES.index("event")).all())
+        self.assertEqual(list(np.diff(segments[2]['origin_timestamp'])), [40000000]*9)
+
+    def test_scan_segments(self):
+        for data in [VIDEO_DATA_7, CODED_VIDEO_DATA_9,
+                     EVENT_DATA_8, CONCAT_CODED_VIDEO_DATA_9, _two_segment_gsf_data()]:
+            with self.subTest(size=len(data)):
+                with GSFDecoder(file_data=BytesIO(data)) as dec:
+                    segments = dec.scan_segments()
+                (head, grains) = loads(data)
+
+                self.assertEqual(sorted(segments.keys()), sorted(grains.keys()))
+                for (local_id, (headers, grain)) in segments.items():
+                    self.assertEqual(len(headers), len(grains[local_id]))
+                    self.assertEqual(grain.origin_timestamp, grains[local_id][0].origin_timestamp)
+                    self.assertEqual(grain.length, grains[local_id][0].length)
+                    self.assertEqual(bytes(grain.data), bytes(grains[local_id][0].data))
+
+
+def _grain_summary(grain, local_id):
+    return (local_id, grain.grain_type, grain.origin_timestamp.to_nanosec(), grain.length)
+
+
+class TestGSFParallelDecode(IsolatedAsyncioTestCase):
+    def assertParallelDecodeMatches(self, data, local_ids=None, **kwargs):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.gsf")
+            with open(path, "wb") as f:
+                f.write(data)
+
+            results = list(parallel_decode(path, _grain_summary, local_ids=local_ids, max_workers=2, **kwargs))
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            expected = [_grain_summary(grain, local_id) for (grain, local_id) in dec.grains(local_ids=local_ids)]
+
+        self.assertEqual(results, expected)
+        return results
+
+    def test_parallel_decode(self):
+        results = self.assertParallelDecodeMatches(_two_segment_gsf_data(), chunk_size=1)
+        self.assertEqual(len(results), 20)
+
+    def test_parallel_decode_default_chunks(self):
+        self.assertParallelDecodeMatches(VIDEO_DATA_8)
+
+    def test_parallel_decode_concatenated(self):
+        self.assertParallelDecodeMatches(CONCAT_CODED_VIDEO_DATA_9, chunk_size=4096)
+
+    def test_parallel_decode_with_local_ids(self):
+        results = self.assertParallelDecodeMatches(_two_segment_gsf_data(), local_ids=[2], chunk_size=1)
+        self.assertEqual(len(results), 10)
+
+    def test_parallel_decode_uses_stored_index(self):
+        with mock.patch.object(GSFSyncDecoderSession, "build_index") as build_index:
+            results = self.assertParallelDecodeMatches(_two_segment_gsf_data(index=True), chunk_size=1)
+
+        build_index.assert_not_called()
+        self.assertEqual(len(results), 20)
+
+
+class TestGSFRemux(IsolatedAsyncioTestCase):
+    def assertRemuxMatches(self, data, out, expected, relabelled=False):
+        """Check that the remuxed file contains exactly the expected grains, with their "grai" blocks unchanged (apart
+        from their local ids if `relabelled` is set)"""
+        (head, segments) = loads(out)
+        self.assertEqual({seg['local_id']: seg['count'] for seg in head['segments']},
+                         {local_id: len(grains) for (local_id, grains) in expected.items()})
+
+        for (local_id, grains) in expected.items():
+            self.assertEqual([(grain.origin_timestamp, bytes(grain.data)) for grain in segments.get(local_id, [])],
+                             [(grain.origin_timestamp, bytes(grain.data)) for grain in grains])
+
+        with GSFDecoder(file_data=BytesIO(out)) as dec:
+            out_index = dec.build_index()
+        for entry in out_index:
+            block = out[entry.offset:entry.data_offset + entry.data_length]
+            if relabelled:
+                block = block[10:]
+            self.assertIn(block, data)
+
+    def test_remux_all(self):
+        data = _two_segment_gsf_data()
+        out = BytesIO()
+
+        counts = remux(BytesIO(data), out)
+
+        self.assertEqual(counts, {1: 10, 2: 10})
+        (_, segments) = loads(data)
+        self.assertRemuxMatches(data, out.getvalue(), segments)
+
+    def test_remux_local_ids(self):
+        data = _two_segment_gsf_data()
+        out = BytesIO()
+
+        counts = remux(BytesIO(data), out, local_ids=[2])
+
+        self.assertEqual(counts, {2: 10})
+        (_, segments) = loads(data)
+        self.assertRemuxMatches(data, out.getvalue(), {2: segments[2]})
+
+    def test_remux_timerange_and_max_grains(self):
+        data = _two_segment_gsf_data(index=True)
+        start = Timestamp(1420102800, 0) + TimeOffset.from_count(2, 25)
+        timerange = TimeRange(start, start + TimeOffset.from_count(4, 25), TimeRange.INCLUDE_START)
+        out = BytesIO()
+
+        with mock.patch.object(GSFSyncDecoderSession, "build_index") as build_index:
+            counts = remux(BytesIO(data), out, timerange=timerange, max_grains=6)
+        build_index.assert_not_called()
+
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            expected = [(local_id, grain) for (grain, local_id) in dec.grains(
+                loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY) if grain.origin_timestamp in timerange][:6]
+        self.assertEqual(counts, {1: sum(1 for (local_id, _) in expected if local_id == 1),
+                                  2: sum(1 for (local_id, _) in expected if local_id == 2)})
+        self.assertRemuxMatches(data, out.getvalue(), {local_id: [grain for (lid, grain) in expected if lid == local_id]
+                                                       for local_id in (1, 2)})
+
+    def test_remux_files(self):
+        data = _two_segment_gsf_data()
+
+        with TemporaryDirectory() as tmpdir:
+            in_path = os.path.join(tmpdir, "in.gsf")
+            out_path = os.path.join(tmpdir, "out.gsf")
+            with open(in_path, "wb") as f:
+                f.write(data)
+
+            counts = remux(in_path, out_path, local_ids=[1], max_grains=4)
+
+            with open(out_path, "rb") as f:
+                out = f.read()
+
+        self.assertEqual(counts, {1: 4})
+        (_, segments) = loads(data)
+        self.assertRemuxMatches(data, out, {1: segments[1][:4]})
+
+    def _grai_blocks(self, data):
+        """Split a GSF file into its file header and "head" block, and the list of its "grai" blocks"""
+        pos = 12 + int.from_bytes(data[16:20], 'little')
+        blocks = []
+        while pos < len(data):
+            size = int.from_bytes(data[pos + 4:pos + 8], 'little')
+            if size == 0:
+                break
+            if data[pos:pos + 4] == b"grai":
+                blocks.append(data[pos:pos + size])
+            pos += size
+        return (data[:12 + int.from_bytes(data[16:20], 'little')], blocks)
+
+    def test_remux_copies_whole_grain_blocks(self):
+        # Add a block after the "grdt" block of each grain, which must be copied along with the rest of the grain
+        (header, blocks) = self._grai_blocks(_two_segment_gsf_data())
+        extra = b"xtra" + (12).to_bytes(4, 'little') + b"tail"
+        data = header + b"".join(b"grai" + (len(block) + len(extra)).to_bytes(4, 'little') + block[8:] + extra
+                                 for block in blocks) + b"grai" + bytes(4)
+        out = BytesIO()
+
+        counts = remux(BytesIO(data), out, local_ids=[1])
+
+        self.assertEqual(counts, {1: 10})
+        (_, in_blocks) = self._grai_blocks(data)
+        (_, out_blocks) = self._grai_blocks(out.getvalue())
+        self.assertEqual(out_blocks, [block for block in in_blocks if block[8:10] == b"\x01\x00"])
+
+    def _decoded_segments(self, data):
+        """The grains of a file by local id, decoding each concatenated file with its own "head" block"""
+        segments = {}
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY):
+                segment_id = [seg['id'] for seg in dec.file_headers['segments'] if seg['local_id'] == local_id][0]
+                segments.setdefault(segment_id, []).append(grain)
+        return segments
+
+    def test_remux_concatenated(self):
+        # Each file has a segment with local id 1 but a different segment id, so the second is given local id 2
+        for data in [CONCAT_CODED_VIDEO_DATA_9, AUDIO_DATA_8 + VIDEO_DATA_8]:
+            with self.subTest(length=len(data)):
+                out = BytesIO()
+
+                counts = remux(BytesIO(data), out)
+
+                segments = list(self._decoded_segments(data).values())
+                self.assertEqual(counts, {1: len(segments[0]), 2: len(segments[1])})
+                self.assertRemuxMatches(data, out.getvalue(), {1: segments[0], 2: segments[1]}, relabelled=True)
+                (head, _) = loads(out.getvalue())
+                self.assertEqual([seg['id'] for seg in head['segments']], list(self._decoded_segments(data)))
+
+    def test_remux_concatenated_same_segment(self):
+        # Files with the same segment id, eg. from a GSFRollingEncoder, are remuxed into one segment
+        segments = [{'local_id': 1, 'id': UUID('80af875c-1565-11e8-8f44-87ef081b48cd')},
+                    {'local_id': 2, 'id': UUID('80af875c-1565-11e8-8f44-87ef081b48ce')}]
+        parts = [_two_segment_gsf_data(segments=segments), _two_segment_gsf_data(count=5, segments=segments)]
+        data = b"".join(parts)
+        out = BytesIO()
+
+        counts = remux(BytesIO(data), out, local_ids=[2])
+
+        self.assertEqual(counts, {2: 15})
+        self.assertRemuxMatches(data, out.getvalue(), {2: loads(parts[0])[1][2] + loads(parts[1])[1][2]})
+
+    def test_file_range_copier_falls_back_to_buffered_copy(self):
+        data = bytes(range(256)) * 64
+
+        with TemporaryDirectory() as tmpdir:
+            in_path = os.path.join(tmpdir, "in.bin")
+            with open(in_path, "wb") as f:
+                f.write(data)
+
+            with open(in_path, "rb") as src:
+                dst = BytesIO()
+                copier = FileRangeCopier(src, dst, chunk_size=1000)
+                copier.copy(100, 5000)
+                copier.copy(10000, 6000)
+                self.assertEqual(dst.getvalue(), data[100:5100] + data[10000:16000])
+
+                with self.assertRaises(EOFError):
+                    copier.copy(len(data) - 10, 20)
+
+            with open(in_path, "rb") as src, open(os.path.join(tmpdir, "out.bin"), "wb+") as dst:
+                copier = FileRangeCopier(src, dst)
+                dst.write(b"x")
+                copier.copy(100, 5000)
+                dst.write(b"y")
+                dst.seek(0)
+                self.assertEqual(dst.read(), b"x" + data[100:5100] + b"y")
+
+
+class TestGSFMerge(IsolatedAsyncioTestCase):
+    def _decoded(self, data):
+        with GSFDecoder(file_data=BytesIO(data)) as dec:
+            head = dec.file_headers
+            grains = [(local_id, grain.origin_timestamp, bytes(grain.data) if grain.data is not None else None)
+                      for (grain, local_id) in dec.grains(loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY)]
+        return (head, grains)
+
+    def test_merge(self):
+        inputs = [_two_segment_gsf_data(), _two_segment_gsf_data(count=5)]
+        out = BytesIO()
+
+        local_id_maps = merge([BytesIO(data) for data in inputs], out, lookahead=10, tags=[("merged", "yes")])
+
+        self.assertEqual(local_id_maps, [{1: 1, 2: 2}, {1: 3, 2: 4}])
+        (head, grains) = self._decoded(out.getvalue())
+        self.assertEqual(head['tags'], [("merged", "yes")])
+        self.assertEqual([(seg['local_id'], seg['count']) for seg in head['segments']],
+                         [(1, 10), (2, 10), (3, 5), (4, 5)])
+
+        expected = []
+        for (n, data) in enumerate(inputs):
+            (_, input_grains) = self._decoded(data)
+            expected += [(local_id_maps[n][local_id], ts, payload) for (local_id, ts, payload) in input_grains]
+        self.assertEqual(grains, sorted(expected, key=lambda g: g[1]))
+
+    def test_merge_with_short_lookahead(self):
+        data = _two_segment_gsf_data()
+        out = BytesIO()
+
+        merge([BytesIO(data), BytesIO(_two_segment_gsf_data())], out, lookahead=1)
+
+        # The inputs can't be put in timestamp order with so little lookahead, but each is copied in its own order
+        (head, grains) = self._decoded(out.getvalue())
+        (_, input_grains) = self._decoded(data)
+        self.assertEqual(len(head['segments']), 4)
+        self.assertEqual([grain for grain in grains if grain[0] <= 2], input_grains)
+        self.assertEqual([(local_id - 2, ts, payload) for (local_id, ts, payload) in grains if local_id > 2],
+                         input_grains)
+
+    def test_merge_rolled_files(self):
+        src_id = UUID('e14e9d58-1567-11e8-8dd3-831a068eb034')
+        flow_id = UUID('ee1eed58-1567-11e8-a971-3b901a2dd8ab')
+        start_ts = Timestamp(1420102800, 0)
+
+        with TemporaryDirectory() as tmpdir:
+            with GSFRollingEncoder(os.path.join(tmpdir, "{}.gsf"), max_duration=TimeOffset.from_count(4, 25),
+                                   segments=[{'local_id': 3}]) as enc:
+                enc.segments[3].add_flow(src_id=src_id, flow_id=flow_id, format="urn:x-nmos:format:data",
+                                         data='{"label": "events"}')
+                for n in range(0, 10):
+                    grain = EventGrain(src_id=src_id, flow_id=flow_id,
+                                       origin_timestamp=start_ts + TimeOffset.from_count(n, 25))
+                    grain.append("/value", post=n)
+                    enc.add_grain(grain)
+
+            out_path = os.path.join(tmpdir, "merged.gsf")
+            local_id_maps = merge(list(reversed(enc.paths)), out_path)
+
+            with open(out_path, "rb") as f:
+                (head, grains) = self._decoded(f.read())
+            with open(enc.paths[0], "rb") as f:
+                (input_head, _) = self._decoded(f.read())
+
+        self.assertEqual(local_id_maps, [{3: 3}]*3)
+        self.assertEqual(head['segments'][0]['flow'], input_head['segments'][0]['flow'])
+        self.assertEqual(head['segments'][0]['flow']['data'], '{"label": "events"}')
+        self.assertEqual([(seg['local_id'], seg['count']) for seg in head['segments']], [(3, 10)])
+        self.assertEqual([ts for (_, ts, _) in grains], [start_ts + TimeOffset.from_count(n, 25) for n in range(0, 10)])
+
+    def test_merge_concatenated(self):
+        # The two concatenated files use the same local ids for different segments
+        parts = [_two_segment_gsf_data(), _two_segment_gsf_data(count=5)]
+        other = _two_segment_gsf_data(count=3)
+        out = BytesIO()
+
+        local_id_maps = merge([BytesIO(other), BytesIO(b"".join(parts))], out, lookahead=40)
+
+        self.assertEqual(local_id_maps, [{1: 1, 2: 2}, {1: 3, 2: 4}])
+        (head, grains) = self._decoded(out.getvalue())
+        self.assertEqual([(seg['local_id'], seg['count']) for seg in head['segments']],
+                         [(1, 3), (2, 3), (3, 10), (4, 10), (5, 5), (6, 5)])
+
+        expected = [(local_id, ts, payload) for (local_id, ts, payload) in self._decoded(other)[1]]
+        for (part, offset) in zip(parts, (2, 4)):
+            expected += [(local_id + offset, ts, payload) for (local_id, ts, payload) in self._decoded(part)[1]]
+        self.assertEqual(grains, sorted(expected, key=lambda g: g[1]))
+
+    def test_merge_rejects_bad_lookahead(self):
+        with self.assertRaises(ValueError):
+            merge([BytesIO(_two_segment_gsf_data())], BytesIO(), lookahead=0)
+
 
 class TestGSFLoads(IsolatedAsyncioTestCase):
     def _verify_loaded_video(self, head, segments):
@@ -2615,6 +4145,32 @@ class TestGSFLoads(IsolatedAsyncioTestCase):
         self.assertEqual(segments[1][1].grain_type, "empty")
         self.assertIsNone(segments[1][1].data)
 
+    def test_loads_raises_when_gbhd_contains_partial_block(self):
+        src_id = UUID('c707d64c-1596-11e8-a3fb-dca904824eec')
+        flow_id = UUID('da78668a-1596-11e8-a577-dca904824eec')
+        with self.assertRaises(GSFDecodeError) as cm:
+            (head, segments) = loads(b"SSBBgrsg\x07\x00\x00\x00" +
+                                     (b"head\x41\x00\x00\x00" +
+                                      b"\xd1\x9c\x0b\x91\x15\x90\x11\xe8\x85\x80\xdc\xa9\x04\x82N\xec" +
+                                      b"\xbf\x07\x03\x1d\x0f\x0f\x0f" +
+                                      (b"segm\x22\x00\x00\x00" +
+                                       b"\x01\x00" +
+                                       b"\xd3\xe1\x91\xf0\x15\x94\x11\xe8\x91\xac\xdc\xa9\x04\x82N\xec" +
+                                       b"\x01\x00\x00\x00\x00\x00\x00\x00")) +
+                                     (b"grai\x6a\x00\x00\x00" +
+                                      b"\x01\x00" +
+                                      (b"gbhd\x60\x00\x00\x00" +
+                                       src_id.bytes +
+                                       flow_id.bytes +
+                                       b"\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00" +
+                                       b"\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00" +
+                                       b"\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00" +
+                                       b"\x00\x00\x00\x00\x00\x00\x00\x00" +
+                                       b"\x00\x00\x00\x00\x00\x00\x00\x00" +
+                                       b"eghd")))
+
+        self.assertEqual(cm.exception.offset, 179)
+
     def test_loads_coded_audio(self):
         (head, segments) = loads(CODED_AUDIO_DATA_8)
 
@@ -16,7 +16,7 @@
 
 from unittest import TestCase, mock
 
-from mediagrains.utils import IOBytes
+from mediagrains.utils import IOBytes, GrainDataCache
 
 from hypothesis import given
 from hypothesis.strategies import integers
@@ -59,3 +59,78 @@ class TestIOBytes (TestCase):
 
         self.assertEqual(iobytes[12], 12)
         self.assertEqual(len(iobytes), iostream.read.return_value.__len__.return_value)
+
+    def test_fill(self):
+        iostream = mock.MagicMock()
+        cache = GrainDataCache(100)
+
+        iobytes = IOBytes(iostream, 20, 60, cache=cache)
+        self.assertEqual((iobytes.istream, iobytes.start, iobytes.length, iobytes.loaded), (iostream, 20, 60, False))
+
+        iobytes.fill(TEST_DATA[20:80])
+        self.assertTrue(iobytes.loaded)
+        self.assertEqual(bytes(iobytes), TEST_DATA[20:80])
+        self.assertIn(id(iobytes), cache)
+        iostream.read.assert_not_called()
+
+
+class TestGrainDataCache (TestCase):
+    def test_evicts_least_recently_used(self):
+        evicted = []
+        cache = GrainDataCache(100)
+
+        for key in range(0, 3):
+            cache.add(key, 40, lambda key=key: evicted.append(key))
+        self.assertEqual(evicted, [0])
+        self.assertEqual(cache.size, 80)
+
+        cache.touch(1)
+        cache.add(3, 40, lambda: evicted.append(3))
+        self.assertEqual(evicted, [0, 2])
+        self.assertNotIn(2, cache)
+        self.assertIn(1, cache)
+
+        # The newest item is kept even if it is larger than the budget on its own
+        cache.add(4, 200, lambda: evicted.append(4))
+        self.assertEqual(evicted, [0, 2, 1, 3])
+        self.assertEqual(len(cache), 1)
+
+        cache.clear()
+        self.assertEqual(evicted, [0, 2, 1, 3, 4])
+        self.assertEqual(cache.size, 0)
+
+    def test_iobytes_reloads_when_evicted(self):
+        iostream = BytesIO(TEST_DATA)
+        cache = GrainDataCache(150)
+        reader_mock = mock.MagicMock(side_effect=iostream.read)
+
+        with mock.patch.object(iostream, "read", new=reader_mock):
+            iobytes = [IOBytes(iostream, 100*n, 100, cache=cache) for n in range(0, 3)]
+
+            self.assertEqual(bytes(iobytes[0]), TEST_DATA[0:100])
+            self.assertEqual(bytes(iobytes[0]), TEST_DATA[0:100])
+            self.assertEqual(reader_mock.call_count, 1)
+
+            self.assertEqual(bytes(iobytes[1]), TEST_DATA[100:200])
+            self.assertEqual(cache.size, 100)
+            self.assertEqual(reader_mock.call_count, 2)
+
+            self.assertEqual(bytes(iobytes[0]), TEST_DATA[0:100])
+            self.assertEqual(len(iobytes[1]), 100)
+            self.assertEqual(reader_mock.call_count, 3)
+
+    def test_iobytes_access_keeps_data_cached(self):
+        iostream = BytesIO(TEST_DATA)
+        cache = GrainDataCache(250)
+        iobytes = [IOBytes(iostream, 100*n, 100, cache=cache) for n in range(0, 3)]
+
+        for n in range(0, 2):
+            self.assertEqual(bytes(iobytes[n]), TEST_DATA[100*n:100*(n + 1)])
+
+        # Indexing and attribute access count as uses, so the least recently used data is now the second item's
+        self.assertEqual(iobytes[0][3], TEST_DATA[3])
+        self.assertEqual(iobytes[0].find(TEST_DATA[5:6]), TEST_DATA.find(TEST_DATA[5:6]))
+        bytes(iobytes[2])
+
+        self.assertIn(id(iobytes[0]), cache)
+        self.assertNotIn(id(iobytes[1]), cache)
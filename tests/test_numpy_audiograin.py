@@ -18,8 +18,12 @@ from unittest import IsolatedAsyncioTestCase
 
 import uuid
 from fractions import Fraction
+from io import BytesIO
 
-from mediagrains.numpy.numpy_grains import AudioGrain
+import numpy as np
+
+from mediagrains.numpy.numpy_grains import AudioGrain, GrainFactory
+from mediagrains.gsf import GSFDecoder, GrainDataLoadingMode, dumps
 from mediagrains.cogenums import (
     CogAudioFormat,
     COG_AUDIO_FORMAT_DEPTH,
@@ -214,3 +218,28 @@ class TestGrain (IsolatedAsyncioTestCase):
 
         async with grain as _grain:
             self._assert_channel_data_equal(_grain, test_data)
+
+    def test_gsf_decode_with_numpy_factory(self):
+        """Check that the numpy GrainFactory decodes straight into numpy AudioGrains over the decoder's buffers"""
+        for fmt in PCM_FORMATS:
+            with self.subTest(format=fmt):
+                test_data = self._create_test_data(fmt, 2)
+                bytes_grain = self._create_audio_grain(
+                    fmt, test_data, constructor=bytesgrain_constructors.AudioGrain
+                )
+
+                buffers = []
+
+                def _buffer_provider(size):
+                    buffers.append(bytearray(size))
+                    return buffers[-1]
+
+                with GSFDecoder(file_data=BytesIO(dumps([bytes_grain])), parse_grain=GrainFactory) as dec:
+                    grains = [g for (g, local_id) in dec.grains(
+                        loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY, buffer_provider=_buffer_provider)]
+
+                self.assertEqual(len(grains), 1)
+                self.assertIsInstance(grains[0], AudioGrain)
+                self._assert_channel_data_equal(grains[0], test_data)
+                self.assertEqual(len(buffers), 1)
+                self.assertTrue(np.shares_memory(grains[0].data, np.frombuffer(buffers[0], dtype=np.uint8)))
@@ -17,7 +17,7 @@
 from unittest import IsolatedAsyncioTestCase, mock
 
 import uuid
-from mediagrains.numpy.numpy_grains import VideoGrain
+from mediagrains.numpy.numpy_grains import VideoGrain, GrainFactory
 from mediagrains.numpy.numpy_grains.VideoGrain import _dtype_from_cogframeformat
 from mediagrains.cogenums import (
     CogFrameFormat,
@@ -28,7 +28,7 @@ from mediagrains.cogenums import (
     COG_FRAME_IS_PLANAR,
     COG_FRAME_IS_PLANAR_RGB,
     COG_FRAME_FORMAT_ACTIVE_BITS)
-from mediagrains.gsf import loads, dumps
+from mediagrains.gsf import loads, dumps, GSFDecoder, GrainDataLoadingMode
 from mediagrains.comparison import compare_grain
 import mediagrains.grains as bytesgrain_constructors
 from mediatimestamp.immutable import Timestamp, TimeRange
@@ -37,6 +37,7 @@ from copy import copy, deepcopy
 from typing import Tuple, Optional
 
 from itertools import chain, repeat
+from io import BytesIO
 
 import numpy as np
 
@@ -877,3 +878,58 @@ class TestGrain (IsolatedAsyncioTestCase):
                 new_grain = VideoGrain(grain=segments[1][0])
                 comp = compare_grain(new_grain, grain)
                 self.assertTrue(comp, msg=str(comp))
+
+    def test_video_grain_gsf_decode_with_numpy_factory(self):
+        src_id = uuid.UUID("f18ee944-0841-11e8-b0b0-17cef04bd429")
+        flow_id = uuid.UUID("f79ce4da-0841-11e8-9a5b-dfedb11bafeb")
+        cts = Timestamp.from_tai_sec_nsec("417798915:0")
+        ots = Timestamp.from_tai_sec_nsec("417798915:5")
+        sts = Timestamp.from_tai_sec_nsec("417798915:10")
+
+        for fmt in [CogFrameFormat.S16_422_10BIT,
+                    CogFrameFormat.U8_420,
+                    CogFrameFormat.UYVY,
+                    CogFrameFormat.RGBA]:
+            with self.subTest(fmt=fmt):
+                with mock.patch.object(Timestamp, "get_time", return_value=cts):
+                    grain = VideoGrain(src_id=src_id, flow_id=flow_id, origin_timestamp=ots, sync_timestamp=sts,
+                                       cog_frame_format=fmt,
+                                       width=16, height=16, cog_frame_layout=CogFrameLayout.FULL_FRAME)
+
+                self.write_test_pattern(grain)
+
+                buffers = []
+
+                def _buffer_provider(size):
+                    buffers.append(bytearray(size))
+                    return buffers[-1]
+
+                with GSFDecoder(file_data=BytesIO(dumps([grain])), parse_grain=GrainFactory) as dec:
+                    new_grains = [g for (g, local_id) in dec.grains(
+                        loading_mode=GrainDataLoadingMode.LOAD_IMMEDIATELY, buffer_provider=_buffer_provider)]
+
+                self.assertEqual(len(new_grains), 1)
+                self.assertIsInstance(new_grains[0], VideoGrain)
+                comp = compare_grain(new_grains[0], grain)
+                self.assertTrue(comp, msg=str(comp))
+
+                # The numpy data and its component views wrap the decoder's buffer rather than a copy of it
+                self.assertEqual(len(buffers), 1)
+                self.assertTrue(np.shares_memory(new_grains[0].data, np.frombuffer(buffers[0], dtype=np.uint8)))
+                self.assertTrue(np.shares_memory(new_grains[0].component_data[0],
+                                                 np.frombuffer(buffers[0], dtype=np.uint8)))
+
+    def test_grain_factory_forwards_kwargs(self):
+        """Check that the numpy GrainFactory passes extra keyword arguments on whenever it falls back to
+        mediagrains.grains.GrainFactory"""
+        src_id = uuid.UUID("f18ee944-0841-11e8-b0b0-17cef04bd429")
+        flow_id = uuid.UUID("f79ce4da-0841-11e8-9a5b-dfedb11bafeb")
+        meta = bytesgrain_constructors.GrainFactory(src_id=src_id, flow_id=flow_id).meta
+
+        with mock.patch.object(bytesgrain_constructors, "GrainFactory") as factory:
+            GrainFactory(src_id=src_id, flow_id=flow_id)
+            factory.assert_called_once_with(meta=None, data=None, src_id=src_id, flow_id=flow_id)
+
+            factory.reset_mock()
+            GrainFactory(meta=meta, data=None, src_id=src_id, flow_id=flow_id)
+            factory.assert_called_once_with(meta=meta, data=None, src_id=src_id, flow_id=flow_id)